@@ -1,5 +1,5 @@
 import os
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
 
 from fastapi import Depends, HTTPException, Header, status
 from fastapi.security import OAuth2PasswordBearer
@@ -11,7 +11,7 @@ import redis.asyncio as redis
 
 from app.core.config import settings
 from app.core.security import ALGORITHM
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, AsyncSessionLocal
 from app.db.models.user import User
 from app.schemas.token import TokenPayload
 from app.services.agent import AgentService
@@ -39,6 +39,11 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator:
+    """Sessão assíncrona (asyncpg) para endpoints do fluxo de mensagens."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 
 def get_current_user(
     db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
@@ -8,8 +8,10 @@ from requests import Session
 
 from app import schemas
 from app.db.models.archived_conversation import ArchivedConversation
+from app.db.models.conversation_summary import ConversationSummaryRecord
 from app.db.models.user import User
 from app.schemas.archived_conversation import PaginatedArchivedConversations
+from app.schemas.conversation_summary import ConversationSummary as ConversationSummarySchema
 from app.services.orchestrator import AgentOrchestrator
 from app.api.deps import get_current_active_user, get_db, get_tenant_id, get_enhanced_orchestrator
 
@@ -96,6 +98,7 @@ async def get_conversation(
 async def get_conversation_summary(
     conversation_id: str,
     tenant_id: str = Depends(get_tenant_id),
+    db: Session = Depends(get_db),
     orchestrator: AgentOrchestrator = Depends(get_enhanced_orchestrator)
 ):
     """
@@ -104,14 +107,11 @@ async def get_conversation_summary(
     try:
         state = await orchestrator.get_conversation_state(conversation_id)
         
-        if not state:
-            raise HTTPException(status_code=404, detail=f"Conversa {conversation_id} não encontrada")
-        
-        if state.tenant_id != tenant_id:
+        if state and state.tenant_id != tenant_id:
             raise HTTPException(status_code=403, detail="Sem permissão para acessar esta conversa")
         
         # Check if there's a recent summary
-        if "last_summary" in state.metadata:
+        if state and "last_summary" in state.metadata:
             summary = state.metadata["last_summary"]
             return {
                 "conversation_id": state.conversation_id,
@@ -119,6 +119,26 @@ async def get_conversation_summary(
                 "generated_at": summary.get("generated_at")
             }
         
+        # Resumo persistido (também disponível para conversas já arquivadas)
+        stored_summary = db.query(ConversationSummaryRecord).filter(
+            ConversationSummaryRecord.conversation_id == conversation_id,
+            ConversationSummaryRecord.tenant_id == tenant_id
+        ).first()
+        
+        if stored_summary:
+            return {
+                "conversation_id": stored_summary.conversation_id,
+                "brief_summary": stored_summary.brief_summary,
+                "detailed_summary": stored_summary.detailed_summary,
+                "sentiment": stored_summary.sentiment,
+                "key_points": stored_summary.key_points,
+                "entities": stored_summary.entities,
+                "generated_at": stored_summary.updated_at.timestamp() if stored_summary.updated_at else None
+            }
+        
+        if not state:
+            raise HTTPException(status_code=404, detail=f"Conversa {conversation_id} não encontrada")
+        
         # Generate a new summary if needed
         if orchestrator.memory_service:
             summary = await orchestrator.memory_service.generate_conversation_summary(
@@ -197,6 +217,29 @@ async def list_conversations(
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@router.get("/user/{user_id}/summaries", response_model=List[ConversationSummarySchema])
+async def list_user_conversation_summaries(
+    user_id: str,
+    tenant_id: str = Depends(get_tenant_id),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Lista os resumos mais recentes das conversas de um usuário.
+    """
+    if not current_user.is_superuser and current_user.tenant_id != int(tenant_id):
+        raise HTTPException(
+            status_code=403, 
+            detail="Sem permissão para acessar as conversas deste usuário"
+        )
+    
+    # Consulta coberta pelo índice (tenant_id, user_id, created_at)
+    return db.query(ConversationSummaryRecord).filter(
+        ConversationSummaryRecord.tenant_id == tenant_id,
+        ConversationSummaryRecord.user_id == user_id
+    ).order_by(ConversationSummaryRecord.created_at.desc()).limit(limit).all()
+
 @router.get("/archived/tenant/{tenant_id}", response_model=PaginatedArchivedConversations)
 async def list_archived_conversations_by_tenant(
     tenant_id: str,
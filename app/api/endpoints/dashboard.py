@@ -1,5 +1,7 @@
 # app/api/endpoints/dashboard.py
 from datetime import datetime, timedelta
+import json
+import uuid
 from typing import Dict, List, Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
@@ -7,8 +9,9 @@ from sqlalchemy import extract, func, desc, and_
 from sqlalchemy.orm import Session
 import random
 
-from app.api.deps import get_db, get_current_active_user, get_tenant_id
-from app.db.models.token_usage import TokenUsageAlert, TokenUsageLimit, TokenUsageLog
+from app.api.deps import get_db, get_current_active_user, get_tenant_id, get_redis_client
+from app.core.config import settings
+from app.db.models.token_usage import TokenUsageAlert, TokenUsageLimit, TokenUsageLog, TokenUsageDaily
 from app.db.models.user import User
 from app.db.models.agent import Agent
 from app.db.models.tenant import Tenant
@@ -23,6 +26,34 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.api.endpoints.dashboard")
 
+def _get_agent_names(db: Session, agent_ids) -> Dict[str, str]:
+    """Busca os nomes de vários agentes em uma única consulta (IN)."""
+    valid_ids = set()
+    for agent_id in agent_ids:
+        if not agent_id:
+            continue
+        try:
+            valid_ids.add(agent_id if isinstance(agent_id, uuid.UUID) else uuid.UUID(str(agent_id)))
+        except ValueError:
+            # IDs inválidos não devem invalidar a consulta inteira
+            continue
+    
+    if not valid_ids:
+        return {}
+    
+    rows = db.query(Agent.id, Agent.name).filter(Agent.id.in_(valid_ids)).all()
+    return {str(row.id): row.name for row in rows}
+
+def _get_model_names(db: Session, model_ids) -> Dict[int, str]:
+    """Busca os nomes de vários modelos LLM em uma única consulta (IN)."""
+    model_ids = {model_id for model_id in model_ids if model_id is not None}
+    if not model_ids:
+        return {}
+    
+    from app.db.models.llm_model import LLMModel
+    rows = db.query(LLMModel.id, LLMModel.name).filter(LLMModel.id.in_(model_ids)).all()
+    return {row.id: row.name for row in rows}
+
 @router.get("/stats")
 async def get_dashboard_stats(
     tenant_id: str = Depends(get_tenant_id),
@@ -86,6 +117,7 @@ async def get_dashboard_charts(
     tenant_id: str = Depends(get_tenant_id),
     days: int = Query(7, ge=1, le=30),
     db: Session = Depends(get_db),
+    redis_client = Depends(get_redis_client),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -98,41 +130,54 @@ async def get_dashboard_charts(
     if not current_user.is_superuser and current_user.tenant_id != tenant_id_int:
         raise HTTPException(status_code=403, detail="No permission to access this tenant's data")
     
-    # Get dates for the last N days
+    # Resposta em cache por tenant e janela
     today = datetime.utcnow().date()
-    dates = [(today - timedelta(days=i)).strftime('%d/%m') for i in range(days-1, -1, -1)]
+    cache_key = f"dashboard:charts:{tenant_id}:{days}:{today.isoformat()}"
+    try:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logger.warning(f"Erro ao ler cache do dashboard: {e}")
     
-    # Prepare data structures
-    conversations_data = [0] * days
-    messages_data = [0] * days
+    # Get dates for the last N days
+    day_list = [today - timedelta(days=i) for i in range(days-1, -1, -1)]
+    dates = [day.strftime('%d/%m') for day in day_list]
+    window_start = datetime.combine(day_list[0], datetime.min.time())
+    
+    # Conversas e mensagens por dia em uma única consulta
+    day_bucket = func.date_trunc('day', ArchivedConversation.archived_at)
+    daily_rows = db.query(
+        day_bucket.label("day"),
+        func.count(ArchivedConversation.id).label("conversations"),
+        func.coalesce(func.sum(ArchivedConversation.message_count), 0).label("messages")
+    ).filter(
+        ArchivedConversation.tenant_id == tenant_id,
+        ArchivedConversation.archived_at >= window_start
+    ).group_by(day_bucket).all()
     
-    # Query archived conversations for each day
-    for i, day_offset in enumerate(range(days-1, -1, -1)):
-        day_date = today - timedelta(days=day_offset)
-        day_start = datetime.combine(day_date, datetime.min.time())
-        day_end = datetime.combine(day_date, datetime.max.time())
-        
-        # Count conversations
-        conv_count = db.query(func.count(ArchivedConversation.id)).filter(
-            ArchivedConversation.tenant_id == tenant_id,
-            ArchivedConversation.archived_at.between(day_start, day_end)
-        ).scalar() or 0
-        
-        conversations_data[i] = conv_count
-        
-        # Count messages (sum of message_count field)
-        msg_count = db.query(func.sum(ArchivedConversation.message_count)).filter(
-            ArchivedConversation.tenant_id == tenant_id,
-            ArchivedConversation.archived_at.between(day_start, day_end)
-        ).scalar() or 0
-        
-        messages_data[i] = msg_count
+    daily_totals = {row.day.date(): row for row in daily_rows}
+    conversations_data = [daily_totals[day].conversations if day in daily_totals else 0 for day in day_list]
+    messages_data = [int(daily_totals[day].messages) if day in daily_totals else 0 for day in day_list]
+    
+    # Conversas por agente (agente final registrado no arquivamento)
+    agent_rows = db.query(
+        ArchivedConversation.final_agent_id,
+        func.count(ArchivedConversation.id).label("conversations")
+    ).filter(
+        ArchivedConversation.tenant_id == tenant_id,
+        ArchivedConversation.archived_at >= window_start,
+        ArchivedConversation.final_agent_id != None
+    ).group_by(ArchivedConversation.final_agent_id).all()
+    
+    conversations_by_agent = {row.final_agent_id: row.conversations for row in agent_rows}
     
     # For agent distribution, get active agents and their conversation counts
     agents = db.query(Agent).filter(
         Agent.tenant_id == tenant_id_int,
         Agent.active == True
     ).all()
+    agents.sort(key=lambda agent: conversations_by_agent.get(str(agent.id), 0), reverse=True)
     
     agent_names = []
     agent_counts = []
@@ -145,12 +190,7 @@ async def get_dashboard_charts(
     
     for i, agent in enumerate(agents[:6]):  # Limit to 6 agents for display
         agent_names.append(agent.name)
-        
-        # Count conversations assigned to this agent
-        # This isn't perfect, since we only have archived conversations
-        # We'd need to modify the schema to track the final agent that handled the conversation
-        agent_count = random.randint(5, 30)  # Placeholder
-        agent_counts.append(agent_count)
+        agent_counts.append(conversations_by_agent.get(str(agent.id), 0))
         
         # Assign colors
         color_idx = i % len(colors)
@@ -164,7 +204,7 @@ async def get_dashboard_charts(
         agent_colors = ['#4e73df']
         agent_hover_colors = ['#2e59d9']
     
-    return {
+    response = {
         "dates": dates,
         "conversations": conversations_data,
         "messages": messages_data,
@@ -173,6 +213,13 @@ async def get_dashboard_charts(
         "agent_colors": agent_colors,
         "agent_hover_colors": agent_hover_colors
     }
+    
+    try:
+        await redis_client.set(cache_key, json.dumps(response), ex=settings.DASHBOARD_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Erro ao gravar cache do dashboard: {e}")
+    
+    return response
 
 @router.get("/recent-conversations")
 async def get_recent_conversations(
@@ -198,6 +245,12 @@ async def get_recent_conversations(
         ArchivedConversation.archived_at.desc()
     ).limit(limit).all()
     
+    # Buscar nomes dos agentes de uma vez
+    agent_names = _get_agent_names(
+        db,
+        [conv.final_agent_id or (conv.meta_data or {}).get("current_agent_id") for conv in archived_convs]
+    )
+    
     # Format the conversations
     result = []
     for conv in archived_convs:
@@ -212,19 +265,9 @@ async def get_recent_conversations(
             "archive_reason": conv.archive_reason,
         }
         
-        # Get agent name if available in metadata
-        meta_data = conv.meta_data or {}
-        agent_id = meta_data.get("current_agent_id")
-        
-        if agent_id:
-            # Try to get agent name from the database
-            agent = db.query(Agent).filter(Agent.id == agent_id).first()
-            if agent:
-                conv_data["agent_name"] = agent.name
-            else:
-                conv_data["agent_name"] = "Unknown Agent"
-        else:
-            conv_data["agent_name"] = "Unknown Agent"
+        # Agente final registrado no arquivamento (ou nos metadados, para registros antigos)
+        agent_id = conv.final_agent_id or (conv.meta_data or {}).get("current_agent_id")
+        conv_data["agent_name"] = agent_names.get(str(agent_id), "Unknown Agent") if agent_id else "Unknown Agent"
         
         result.append(conv_data)
     
@@ -272,82 +315,83 @@ async def get_token_usage_dashboard(
         period="monthly"
     )
     
-    # Obter uso por agente no mês atual
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+    # Obter uso por agente no mês atual (agregado diário)
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
     # Consulta para obter uso por agente no mês atual
     agent_query = db.query(
-        TokenUsageLog.agent_id,
-        func.sum(TokenUsageLog.total_tokens).label("total_tokens"),
-        func.sum(TokenUsageLog.estimated_cost_usd).label("total_cost")
+        TokenUsageDaily.agent_id,
+        func.sum(TokenUsageDaily.total_tokens).label("total_tokens"),
+        func.sum(TokenUsageDaily.estimated_cost_usd).label("total_cost")
     ).filter(
-        TokenUsageLog.tenant_id == tenant_id_int,
-        extract('year', TokenUsageLog.timestamp) == current_year,
-        extract('month', TokenUsageLog.timestamp) == current_month
+        TokenUsageDaily.tenant_id == tenant_id_int,
+        TokenUsageDaily.period_start >= month_start
     ).group_by(
-        TokenUsageLog.agent_id
+        TokenUsageDaily.agent_id
     ).order_by(
-        func.sum(TokenUsageLog.total_tokens).desc()
+        func.sum(TokenUsageDaily.total_tokens).desc()
+    )
+    
+    agent_rows = agent_query.all()
+    
+    # Obter limites ativos e alertas recentes antes para buscar todos os nomes de agentes de uma vez
+    limits = db.query(TokenUsageLimit).filter(
+        TokenUsageLimit.tenant_id == tenant_id_int,
+        TokenUsageLimit.is_active == True
+    ).all()
+    
+    alerts = db.query(TokenUsageAlert).filter(
+        TokenUsageAlert.tenant_id == tenant_id_int
+    ).order_by(
+        TokenUsageAlert.created_at.desc()
+    ).limit(5).all()
+    
+    agent_names = _get_agent_names(
+        db,
+        [row.agent_id for row in agent_rows]
+        + [limit.agent_id for limit in limits]
+        + [alert.agent_id for alert in alerts]
     )
     
     agent_usage = []
-    for result in agent_query.all():
+    for result in agent_rows:
         agent_id = result.agent_id
         
-        # Obter nome do agente
-        agent_name = "Unknown Agent"
-        from app.db.models.agent import Agent
-        agent = db.query(Agent).filter(Agent.id == agent_id).first()
-        if agent:
-            agent_name = agent.name
-        
         agent_usage.append({
             "agent_id": str(agent_id),
-            "agent_name": agent_name,
+            "agent_name": agent_names.get(str(agent_id), "Unknown Agent"),
             "total_tokens": result.total_tokens,
             "total_cost": result.total_cost
         })
     
     # Obter uso por modelo LLM no mês atual
     model_query = db.query(
-        TokenUsageLog.model_id,
-        func.sum(TokenUsageLog.total_tokens).label("total_tokens"),
-        func.sum(TokenUsageLog.estimated_cost_usd).label("total_cost")
+        TokenUsageDaily.model_id,
+        func.sum(TokenUsageDaily.total_tokens).label("total_tokens"),
+        func.sum(TokenUsageDaily.estimated_cost_usd).label("total_cost")
     ).filter(
-        TokenUsageLog.tenant_id == tenant_id_int,
-        extract('year', TokenUsageLog.timestamp) == current_year,
-        extract('month', TokenUsageLog.timestamp) == current_month
+        TokenUsageDaily.tenant_id == tenant_id_int,
+        TokenUsageDaily.period_start >= month_start
     ).group_by(
-        TokenUsageLog.model_id
+        TokenUsageDaily.model_id
     ).order_by(
-        func.sum(TokenUsageLog.total_tokens).desc()
+        func.sum(TokenUsageDaily.total_tokens).desc()
     )
     
+    model_rows = model_query.all()
+    model_names = _get_model_names(db, [row.model_id for row in model_rows])
+    
     model_usage = []
-    for result in model_query.all():
+    for result in model_rows:
         model_id = result.model_id
         
-        # Obter nome do modelo
-        model_name = "Unknown Model"
-        from app.db.models.llm_model import LLMModel
-        model = db.query(LLMModel).filter(LLMModel.id == model_id).first()
-        if model:
-            model_name = model.name
-        
         model_usage.append({
             "model_id": model_id,
-            "model_name": model_name,
+            "model_name": model_names.get(model_id, "Unknown Model"),
             "total_tokens": result.total_tokens,
             "total_cost": result.total_cost
         })
     
-    # Obter limites ativos
-    limits = db.query(TokenUsageLimit).filter(
-        TokenUsageLimit.tenant_id == tenant_id_int,
-        TokenUsageLimit.is_active == True
-    ).all()
-    
     limits_data = []
     for limit in limits:
         limit_data = {
@@ -360,21 +404,11 @@ async def get_token_usage_dashboard(
         }
         
         # Adicionar nome do agente se aplicável
-        if limit.agent_id:
-            from app.db.models.agent import Agent
-            agent = db.query(Agent).filter(Agent.id == limit.agent_id).first()
-            if agent:
-                limit_data["agent_name"] = agent.name
+        if limit.agent_id and str(limit.agent_id) in agent_names:
+            limit_data["agent_name"] = agent_names[str(limit.agent_id)]
         
         limits_data.append(limit_data)
     
-    # Obter alertas recentes
-    alerts = db.query(TokenUsageAlert).filter(
-        TokenUsageAlert.tenant_id == tenant_id_int
-    ).order_by(
-        TokenUsageAlert.created_at.desc()
-    ).limit(5).all()
-    
     alerts_data = []
     for alert in alerts:
         alert_data = {
@@ -389,11 +423,8 @@ async def get_token_usage_dashboard(
         }
         
         # Adicionar nome do agente se aplicável
-        if alert.agent_id:
-            from app.db.models.agent import Agent
-            agent = db.query(Agent).filter(Agent.id == alert.agent_id).first()
-            if agent:
-                alert_data["agent_name"] = agent.name
+        if alert.agent_id and str(alert.agent_id) in agent_names:
+            alert_data["agent_name"] = agent_names[str(alert.agent_id)]
         
         alerts_data.append(alert_data)
     
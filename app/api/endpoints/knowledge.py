@@ -53,7 +53,8 @@ async def upload_documents(
         #rag_service = RAGService(tenant_id=tenant_id)
         #rag_service = SeuProcessador(tenant_id=tenant_id)
         rag_service = RAGServiceFAISS(tenant_id=tenant_id)
-        num_chunks = await rag_service.index_documents(temp_dir, category=category)
+        # Indexação incremental: chunks inalterados não são embutidos novamente
+        report = await rag_service.index_documents(temp_dir, category=category)
         
         # Registrar upload no banco de dados (opcional)
         # Você pode criar um modelo Document para rastrear uploads
@@ -61,10 +62,14 @@ async def upload_documents(
         return JSONResponse(
             content={
                 "status": "success",
-                "message": f"{len(files)} documentos indexados com sucesso em {num_chunks} chunks",
+                "message": (
+                    f"{len(files)} documentos indexados com sucesso: {report['added']} chunks adicionados, "
+                    f"{report['skipped']} inalterados, {report['replaced']} substituídos"
+                ),
                 "files": [file.filename for file in files],
                 "tenant_id": tenant_id,
-                "category": category
+                "category": category,
+                "chunks": report
             },
             status_code=200
         )
@@ -166,7 +166,7 @@ async def delete_token_limit(
 async def get_token_usage(
     tenant_id: Optional[int] = None,
     agent_id: Optional[str] = None,
-    period: str = Query("monthly", regex="^(daily|monthly|yearly)$"),
+    period: str = Query("monthly", regex="^(hourly|daily|monthly|yearly)$"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
@@ -7,6 +7,7 @@ import re
 from typing import Dict, Any, Optional, List
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Path, Query
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 import uuid
 import json
@@ -18,12 +19,14 @@ from app.core.redis import get_redis
 from app.schemas.agent import AgentType
 from app.services.agent import AgentService
 from app.services.config import load_system_config
+from app.services.llm.factory import LLMServiceFactory
 #from app.services.llm import LLMService
 from app.services.orchestrator import AgentOrchestrator
 from app.services.rag_faiss import RAGServiceFAISS
 from app.services.token_counter import TokenCounterService
 from app.services.whatsapp import WhatsAppService
 from app.db.models.webhook import Webhook, WebhookLog
+from app.db.session import AsyncSessionLocal, worker_session
 from app.db.models.agent import Agent
 from app.db.models.conversation import ConversationState
 from app.schemas.webhook import WebhookCreate, WebhookResponse, WebhookLogResponse
@@ -50,7 +53,6 @@ async def whatsapp_webhook(
     request: Request,
     background_tasks: BackgroundTasks,
     whatsapp_service: WhatsAppService = Depends(get_whatsapp_service),
-    db: Session = Depends(get_db),
 ):
     """
     Webhook to receive events from the WhatsApp service
@@ -63,10 +65,9 @@ async def whatsapp_webhook(
         if data.get("event_type") == "*events.Message":
             # Process message in background
             background_tasks.add_task(
-                process_whatsapp_message,
+                process_whatsapp_message_in_worker,
                 data,
-                whatsapp_service,
-                db
+                whatsapp_service
             )
         
         return {"status": "success"}
@@ -242,8 +243,7 @@ async def test_webhook(
     background_tasks.add_task(
         send_webhook_request,
         webhook,
-        test_event,
-        db
+        test_event
     )
     
     return {"status": "success", "message": "Test webhook dispatched"}
@@ -291,6 +291,19 @@ async def get_webhook_logs(
     
     return result
 
+async def process_whatsapp_message_in_worker(data: Dict[str, Any], whatsapp_service: WhatsAppService):
+    """
+    Executa o processamento em segundo plano com uma sessão própria do pool de jobs.
+    A sessão da requisição já foi encerrada quando a background task roda.
+    
+    As consultas do fluxo de mensagens (agente, configuração do LLM, tokens, alertas
+    e logs de webhook) usam sessões assíncronas curtas, liberadas antes das chamadas
+    ao LLM. A sessão síncrona só faz checkout de uma conexão se algum caminho
+    administrativo a usar, então não fica presa durante o processamento.
+    """
+    with worker_session() as db:
+        await process_whatsapp_message(data, whatsapp_service, db)
+
 # função principal que processa as mensagens recebidas do WhatsApp
 async def process_whatsapp_message(data: Dict[str, Any], whatsapp_service: WhatsAppService, db: Session):
     """
@@ -434,15 +447,15 @@ async def process_whatsapp_message(data: Dict[str, Any], whatsapp_service: Whats
                 print(f"Nenhum agente encontrado para o dispositivo {device_id} do tenant {tenant_id}")
 
                 # Buscar agente geral ativo para este tenant
-                agent_query = (
-                    db.query(Agent)
-                    .filter(
-                        Agent.tenant_id == tenant_id,
-                        Agent.type == 'general',
-                        Agent.active == True
+                async with AsyncSessionLocal() as async_db:
+                    result = await async_db.execute(
+                        select(Agent).where(
+                            Agent.tenant_id == int(tenant_id),
+                            Agent.type == 'general',
+                            Agent.active == True
+                        ).limit(1)
                     )
-                    .first()
-                )
+                    agent_query = result.scalars().first()
                 
                 if not agent_query:
                     logger.warning(f"Nenhum agente geral ativo encontrado para o tenant {tenant_id}")
@@ -457,8 +470,9 @@ async def process_whatsapp_message(data: Dict[str, Any], whatsapp_service: Whats
                     return 
         
         
-        # Inicializar serviços
-        llm_service = await get_llm_service(db, str(tenant_id) if tenant_id else None) #LLMService(api_key=os.getenv("OPENAI_API_KEY"))
+        # Inicializar serviços (configuração do LLM lida pela sessão assíncrona)
+        async with AsyncSessionLocal() as async_db:
+            llm_service = await LLMServiceFactory.create_service(async_db, tenant_id=int(tenant_id) if tenant_id else None)
         rag_service = RAGServiceFAISS(tenant_id=tenant_id)
         
         if has_valid_audio and not llm_supports_audio(llm_service):
@@ -733,17 +747,21 @@ async def process_whatsapp_message(data: Dict[str, Any], whatsapp_service: Whats
         
         # Processar webhooks para este evento
         # (código existente para processamento de webhooks)
-        tenant_webhooks = db.query(Webhook).filter(
-            Webhook.tenant_id == tenant_id,
-            Webhook.enabled == True
-        ).all()
+        async with AsyncSessionLocal() as async_db:
+            result = await async_db.execute(
+                select(Webhook).where(
+                    Webhook.tenant_id == int(tenant_id),
+                    Webhook.enabled == True
+                )
+            )
+            tenant_webhooks = result.scalars().all()
         
         for webhook in tenant_webhooks:
             webhook_events = json.loads(webhook.events) if webhook.events else []
             if not webhook_events or "*" in webhook_events or "*events.Message" in webhook_events:
                 webhook_devices = json.loads(webhook.device_ids) if webhook.device_ids else []
                 if not webhook_devices or device_id in webhook_devices:
-                    await send_webhook_request(webhook, data, db)
+                    await send_webhook_request(webhook, data)
         
     except Exception as e:
         logger.error(f"Erro ao processar mensagem do WhatsApp: {e}")
@@ -1256,30 +1274,32 @@ async def process_whatsapp_message_simplified(data: Dict[str, Any], whatsapp_ser
                 webhook_devices = json.loads(webhook.device_ids) if webhook.device_ids else []
                 if not webhook_devices or device_id in webhook_devices:
                     # Send webhook
-                    await send_webhook_request(webhook, data, db)
+                    await send_webhook_request(webhook, data)
         
     except Exception as e:
         logger.error(f"Error processing WhatsApp message: {e}")
 
 
-async def send_webhook_request(webhook: Webhook, data: Dict[str, Any], db: Session):
+async def send_webhook_request(webhook: Webhook, data: Dict[str, Any]):
     """
-    Send a webhook request with retries
+    Send a webhook request with retries.
+    O log é gravado em sessões assíncronas curtas, para que nenhuma conexão
+    fique presa durante as requisições HTTP e o backoff.
     """
     import httpx
     
     # Prepare webhook log
-    log = WebhookLog(
-        id=str(uuid.uuid4()),
-        webhook_id=webhook.id,
-        status="pending",
-        event_type=data.get("event_type", "unknown"),
-        attempt_count=0,
-        payload=json.dumps(data)
-    )
-    
-    db.add(log)
-    db.commit()
+    log_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as async_db:
+        async_db.add(WebhookLog(
+            id=log_id,
+            webhook_id=webhook.id,
+            status="pending",
+            event_type=data.get("event_type", "unknown"),
+            attempt_count=0,
+            payload=json.dumps(data)
+        ))
+        await async_db.commit()
     
     # Prepare request
     url = webhook.url
@@ -1307,7 +1327,7 @@ async def send_webhook_request(webhook: Webhook, data: Dict[str, Any], db: Sessi
     
     while attempt < max_attempts:
         attempt += 1
-        log.attempt_count = attempt
+        log_values = {"attempt_count": attempt}
         
         try:
             async with httpx.AsyncClient() as client:
@@ -1319,34 +1339,41 @@ async def send_webhook_request(webhook: Webhook, data: Dict[str, Any], db: Sessi
                 )
                 
                 # Update log with response
-                log.response_code = response.status_code
-                log.response_body = response.text[:1000]  # Limit response size
+                log_values["response_code"] = response.status_code
+                log_values["response_body"] = response.text[:1000]  # Limit response size
                 
                 if 200 <= response.status_code < 300:
-                    log.status = "success"
-                    db.commit()
+                    log_values["status"] = "success"
+                    await _update_webhook_log(log_id, log_values)
                     return
                 
                 # Failed but got a response
-                log.status = "failed"
-                log.error_message = f"HTTP {response.status_code}: {response.text[:200]}"
+                log_values["status"] = "failed"
+                log_values["error_message"] = f"HTTP {response.status_code}: {response.text[:200]}"
                 
         except Exception as e:
             # Connection error or timeout
-            log.status = "failed"
-            log.error_message = str(e)[:500]  # Limit error message size
+            log_values["status"] = "failed"
+            log_values["error_message"] = str(e)[:500]  # Limit error message size
         
         # If this isn't the last attempt, mark as retrying
         if attempt < max_attempts:
-            log.status = "retrying"
-            db.commit()
+            log_values["status"] = "retrying"
+            await _update_webhook_log(log_id, log_values)
             
             # Exponential backoff
             await asyncio.sleep(backoff)
             backoff *= 2
         else:
             # Final failure
-            db.commit()
+            await _update_webhook_log(log_id, log_values)
+
+
+async def _update_webhook_log(log_id: str, values: Dict[str, Any]):
+    """Atualiza o log de um envio de webhook em uma sessão assíncrona curta."""
+    async with AsyncSessionLocal() as async_db:
+        await async_db.execute(update(WebhookLog).where(WebhookLog.id == log_id).values(**values))
+        await async_db.commit()
 
 
 def detect_category(text: str) -> Optional[str]:
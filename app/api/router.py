@@ -11,6 +11,9 @@ import psutil
 import asyncio
 
 from app.api.deps import get_db
+from app.db.session import get_pool_stats
+from app.services.memory_fallback import get_fallback_memory_stats
+from app.services.llm.embedding_batcher import get_embedding_batcher
 from app.core.config import settings
 
 from app.api.endpoints import auth, users, dashboard, llm_admin, whatsapp, tenants, conversations, appointments, webhook, knowledge, agents, internal, token_limits, whatsapp_notifications, whatsapp_monitoring
@@ -77,7 +80,8 @@ def detailed_health_check(db: Session = Depends(get_db)):
             health_status["checks"]["database"] = {
                 "status": "healthy",
                 "response_time_ms": round(db_duration, 2),
-                "message": "Database connection successful"
+                "message": "Database connection successful",
+                "pools": get_pool_stats()
             }
         else:
             health_status["checks"]["database"] = {
@@ -113,7 +117,9 @@ def detailed_health_check(db: Session = Depends(get_db)):
             "status": memory_status,
             "usage_percent": memory_usage_percent,
             "available_gb": round(memory.available / (1024**3), 2),
-            "message": memory_message
+            "message": memory_message,
+            "fallback_index": get_fallback_memory_stats(),
+            "embedding_batcher": get_embedding_batcher().stats()
         }
         
     except Exception as e:
@@ -26,6 +26,13 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "assistant")
     SQLALCHEMY_DATABASE_URI: PostgresDsn = None
+    # Pool de conexões (API) e pool separado para jobs em segundo plano
+    DB_POOL_SIZE: int = os.getenv("DB_POOL_SIZE", 10)
+    DB_MAX_OVERFLOW: int = os.getenv("DB_MAX_OVERFLOW", 20)
+    DB_POOL_TIMEOUT: int = os.getenv("DB_POOL_TIMEOUT", 30)  # Segundos
+    DB_POOL_RECYCLE: int = os.getenv("DB_POOL_RECYCLE", 1800)  # Segundos
+    WORKER_DB_POOL_SIZE: int = os.getenv("WORKER_DB_POOL_SIZE", 5)
+    WORKER_DB_MAX_OVERFLOW: int = os.getenv("WORKER_DB_MAX_OVERFLOW", 5)
     
     # Serviço WhatsApp
     WHATSAPP_SERVICE_URL: str = os.getenv("WHATSAPP_SERVICE_URL", "http://localhost:8080")
@@ -37,11 +44,45 @@ class Settings(BaseSettings):
     
     # RAG
     VECTOR_DB_PATH: str = os.getenv("VECTOR_DB_PATH", "./storage/vectordb")
+    # Indexação de documentos: processos de parsing (0 = número de CPUs) e chunks por lote de embeddings
+    RAG_INGEST_WORKERS: int = int(os.getenv("RAG_INGEST_WORKERS", 0))
+    RAG_INGEST_BATCH_SIZE: int = int(os.getenv("RAG_INGEST_BATCH_SIZE", 256))
     
     # Memory
     MEMORY_DB_PATH: str = os.getenv("MEMORY_DB_PATH", "./storage/memorydb")
     MEMORY_ENABLED: bool = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
     MEMORY_USE_LOCAL_STORAGE: bool = os.getenv("MEMORY_USE_LOCAL_STORAGE", "true").lower() == "true"
+    # Resumo de conversas em uma única chamada com saída JSON (fallback: prompts individuais em paralelo)
+    MEMORY_STRUCTURED_SUMMARY: bool = os.getenv("MEMORY_STRUCTURED_SUMMARY", "true").lower() == "true"
+    # Tempo máximo (segundos) da marca de resumo em andamento de uma conversa
+    MEMORY_SUMMARY_IN_PROGRESS_TTL: int = int(os.getenv("MEMORY_SUMMARY_IN_PROGRESS_TTL", 300))
+    # Persistência write-behind dos índices FAISS de memória
+    MEMORY_FLUSH_BATCH_SIZE: int = int(os.getenv("MEMORY_FLUSH_BATCH_SIZE", 50))
+    MEMORY_FLUSH_INTERVAL: float = float(os.getenv("MEMORY_FLUSH_INTERVAL", 30.0))
+    # Índices de tenant carregados em memória (LRU) e tempo ocioso até serem descartados (segundos)
+    MEMORY_INDEX_MAX_LOADED: int = int(os.getenv("MEMORY_INDEX_MAX_LOADED", 200))
+    MEMORY_INDEX_IDLE_TTL: float = float(os.getenv("MEMORY_INDEX_IDLE_TTL", 3600.0))
+    # Expiração/compactação dos índices de memória (intervalo em segundos)
+    MEMORY_CLEANUP_INTERVAL: int = int(os.getenv("MEMORY_CLEANUP_INTERVAL", 86400))
+    MEMORY_COMPACTION_MIN_TOMBSTONE_RATIO: float = float(os.getenv("MEMORY_COMPACTION_MIN_TOMBSTONE_RATIO", 0.1))
+    # Cache do perfil do usuário (invalidado ao adicionar memórias)
+    MEMORY_PROFILE_CACHE_TTL: int = int(os.getenv("MEMORY_PROFILE_CACHE_TTL", 3600))
+    # Cotas do fallback em memória (usado quando FAISS/serviço vetorial falham)
+    MEMORY_FALLBACK_MAX_PER_USER: int = int(os.getenv("MEMORY_FALLBACK_MAX_PER_USER", 200))
+    MEMORY_FALLBACK_MAX_PER_TENANT: int = int(os.getenv("MEMORY_FALLBACK_MAX_PER_TENANT", 5000))
+    MEMORY_FALLBACK_MAX_TOTAL: int = int(os.getenv("MEMORY_FALLBACK_MAX_TOTAL", 50000))
+    # Micro-batching de embeddings: pedidos concorrentes agrupados em uma chamada em lote
+    EMBEDDING_BATCH_ENABLED: bool = os.getenv("EMBEDDING_BATCH_ENABLED", "true").lower() == "true"
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 10))
+    EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 64))
+    # Extração de memórias em lote (fila no Redis processada por um worker)
+    MEMORY_EXTRACTION_BATCH_ENABLED: bool = os.getenv("MEMORY_EXTRACTION_BATCH_ENABLED", "true").lower() == "true"
+    MEMORY_EXTRACTION_WORKER_ENABLED: bool = os.getenv("MEMORY_EXTRACTION_WORKER_ENABLED", "true").lower() == "true"
+    MEMORY_EXTRACTION_CONCURRENCY: int = int(os.getenv("MEMORY_EXTRACTION_CONCURRENCY", 2))
+    MEMORY_EXTRACTION_BATCH_SIZE: int = int(os.getenv("MEMORY_EXTRACTION_BATCH_SIZE", 20))
+    MEMORY_EXTRACTION_INTERVAL: int = int(os.getenv("MEMORY_EXTRACTION_INTERVAL", 300))
+    MEMORY_EXTRACTION_OFFPEAK_HOURS: str = os.getenv("MEMORY_EXTRACTION_OFFPEAK_HOURS", "")  # Ex.: "22-6"; vazio = qualquer hora
+    MEMORY_EXTRACTION_MAX_ATTEMPTS: int = int(os.getenv("MEMORY_EXTRACTION_MAX_ATTEMPTS", 5))  # Falhas antes do dead letter
     
 
     # LLMs API_KEYs
@@ -64,6 +105,27 @@ class Settings(BaseSettings):
     AUDIO_SUPPORTED_FORMATS: List[str] = ["mp3", "ogg", "wav"]
     AUDIO_PROCESSING_TIMEOUT: int = os.getenv("AUDIO_PROCESSING_TIMEOUT", 30)  # Timeout em segundos
 
+    # Limites de uso de tokens
+    # Modo de bloqueio antes da chamada ao LLM: "off", "reject" ou "downgrade"
+    TOKEN_LIMIT_ENFORCEMENT: str = os.getenv("TOKEN_LIMIT_ENFORCEMENT", "off").lower()
+    # Modelo alternativo por provedor, no formato "provedor:modelo" separado por vírgulas
+    # (ex.: "openai:gpt-4o-mini,gemini:gemini-1.5-flash"); nome sem provedor vale para a OpenAI
+    TOKEN_LIMIT_DOWNGRADE_MODEL: str = os.getenv("TOKEN_LIMIT_DOWNGRADE_MODEL", "")
+    TOKEN_LIMIT_REJECT_MESSAGE: str = os.getenv(
+        "TOKEN_LIMIT_REJECT_MESSAGE",
+        "No momento não é possível atender sua solicitação. Por favor, tente novamente mais tarde."
+    )
+    TOKEN_COUNTER_RECONCILE_INTERVAL: int = os.getenv("TOKEN_COUNTER_RECONCILE_INTERVAL", 900)  # Segundos
+
+    # Dashboard
+    DASHBOARD_CACHE_TTL: int = os.getenv("DASHBOARD_CACHE_TTL", 60)  # Segundos
+
+    # Arquivamento de conversas (gravação em lote em segundo plano)
+    ARCHIVE_BATCH_SIZE: int = os.getenv("ARCHIVE_BATCH_SIZE", 50)
+    ARCHIVE_FLUSH_INTERVAL: float = os.getenv("ARCHIVE_FLUSH_INTERVAL", 2.0)  # Segundos
+    ARCHIVE_MAX_RETRIES: int = os.getenv("ARCHIVE_MAX_RETRIES", 3)
+    ARCHIVE_DEAD_LETTER_PATH: str = os.getenv("ARCHIVE_DEAD_LETTER_PATH", "./storage/archive_dead_letter.jsonl")
+
     
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: str, values: dict) -> str:
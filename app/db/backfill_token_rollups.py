@@ -0,0 +1,29 @@
+#app/db/backfill_token_rollups.py
+
+import argparse
+import logging
+from datetime import datetime
+
+from app.db.session import worker_session
+from app.services.token_counter import TokenCounterService
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.db.backfill_token_rollups")
+
+def backfill_token_rollups(start_date: datetime = None, end_date: datetime = None):
+    """Popula token_usage_hourly e token_usage_daily a partir de token_usage_logs."""
+    with worker_session() as db:
+        return TokenCounterService(db).backfill_usage_rollups(start_date=start_date, end_date=end_date)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill dos agregados de uso de tokens")
+    parser.add_argument("--start", help="Data inicial (YYYY-MM-DD). Padrão: todo o histórico")
+    parser.add_argument("--end", help="Data final exclusiva (YYYY-MM-DD). Padrão: agora")
+    args = parser.parse_args()
+    
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else None
+    end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else None
+    
+    logger.info("Starting token usage rollup backfill...")
+    result = backfill_token_rollups(start, end)
+    logger.info(f"Token usage rollup backfill completed: {result}")
@@ -0,0 +1,50 @@
+#app/db/compact_memory_indices.py
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.core.config import settings
+from app.services.config import load_system_config
+from app.services.memory import MemoryService
+from app.services.memory_index_store import acquire_storage_lock, get_memory_index_store
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.db.compact_memory_indices")
+
+async def compact_memory_indices(tenant_id: str = None, days_threshold: int = None, min_tombstone_ratio: float = None):
+    """Expira memórias antigas dos índices FAISS locais e compacta os índices."""
+    memory_config = load_system_config().memory
+    memory_service = MemoryService(
+        llm_service=None,
+        vector_db_path=memory_config.memory_db_path or settings.MEMORY_DB_PATH
+    )
+    
+    try:
+        return await memory_service.compact_memory_indices(
+            tenant_id=tenant_id,
+            days_threshold=days_threshold or memory_config.cleanup_age_days,
+            min_tombstone_ratio=min_tombstone_ratio
+        )
+    finally:
+        # Gravação síncrona de todos os índices: fora do event loop (roda também no servidor)
+        await asyncio.to_thread(get_memory_index_store().flush_all)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expiração e compactação dos índices de memória")
+    parser.add_argument("--tenant", help="ID do tenant. Padrão: todos os índices locais")
+    parser.add_argument("--days", type=int, help="Dias sem acesso para expirar. Padrão: cleanup_age_days")
+    parser.add_argument("--min-ratio", type=float, help="Proporção mínima de tombstones para compactar")
+    args = parser.parse_args()
+    
+    # A API mantém os índices e logs pendentes em memória: não gravar nos mesmos diretórios
+    storage_lock = acquire_storage_lock(load_system_config().memory.memory_db_path or settings.MEMORY_DB_PATH)
+    if storage_lock is None:
+        logger.error("Diretório de memórias em uso por outro processo (API em execução?). A manutenção roda periodicamente no servidor (MEMORY_CLEANUP_INTERVAL).")
+        sys.exit(1)
+    
+    logger.info("Starting memory index maintenance...")
+    report = asyncio.run(compact_memory_indices(args.tenant, args.days, args.min_ratio))
+    reclaimed = sum(item["reclaimed"] for item in report.values())
+    logger.info(f"Memory index maintenance completed: {reclaimed} vectors reclaimed. {report}")
@@ -0,0 +1,52 @@
+#app/db/extract_memories.py
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.core.config import settings
+from app.core.redis import close_redis_connections
+from app.services.config import load_system_config
+from app.services.memory_extraction import get_memory_extraction_queue
+from app.services.memory_index_store import acquire_storage_lock, get_memory_index_store
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.db.extract_memories")
+
+async def extract_memories(force: bool = False, concurrency: int = None, requeue_failed: bool = False) -> int:
+    """Processa a fila de extração de memórias até esvaziá-la."""
+    queue = get_memory_extraction_queue()
+    if concurrency:
+        queue.concurrency = concurrency
+    
+    try:
+        if requeue_failed:
+            await queue.requeue_failed()
+        
+        return await queue.drain(force=force)
+    finally:
+        await asyncio.to_thread(get_memory_index_store().flush_all)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extração de memórias das conversas enfileiradas")
+    parser.add_argument("--force", action="store_true", help="Processar fora da janela de baixa demanda")
+    parser.add_argument("--concurrency", type=int, help="Conversas processadas em paralelo")
+    parser.add_argument("--requeue-failed", action="store_true", help="Devolver à fila as conversas do dead letter antes de processar")
+    args = parser.parse_args()
+    
+    # As memórias extraídas vão para os índices FAISS: não disputar os diretórios com a API
+    storage_lock = acquire_storage_lock(load_system_config().memory.memory_db_path or settings.MEMORY_DB_PATH)
+    if storage_lock is None:
+        logger.error("Diretório de memórias em uso por outro processo (API em execução?). Com a API no ar, a fila é processada pelo servidor (MEMORY_EXTRACTION_WORKER_ENABLED).")
+        sys.exit(1)
+    
+    async def main():
+        try:
+            return await extract_memories(args.force, args.concurrency, args.requeue_failed)
+        finally:
+            await close_redis_connections()
+    
+    logger.info("Starting memory extraction...")
+    processed = asyncio.run(main())
+    logger.info(f"Memory extraction completed: {processed} conversations processed")
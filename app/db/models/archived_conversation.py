@@ -16,5 +16,6 @@ class ArchivedConversation(Base):
     meta_data = Column(JSONB, nullable=True)  # PostgreSQL JSONB para armazenar metadados
     message_count = Column(Integer, default=0)
     archive_reason = Column(String, nullable=True)
+    final_agent_id = Column(String, nullable=True, index=True)  # Agente que atendia a conversa ao arquivar
     archived_at = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
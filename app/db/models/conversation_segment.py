@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+class ConversationSegment(Base):
+    """Trechos do histórico removidos do estado ativo pela compactação (armazenamento frio)."""
+    __tablename__ = "conversation_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(String, nullable=False, index=True)
+    tenant_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    segment_index = Column(Integer, nullable=False)  # Posição absoluta da primeira mensagem do trecho na conversa
+    messages = Column(JSONB, nullable=False)
+    message_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("conversation_id", "segment_index", name="uq_conversation_segments_index"),
+    )
@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+class ConversationSummaryRecord(Base):
+    """Resumo mais recente de cada conversa (gerado pelo MemoryService)."""
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(String, nullable=False, unique=True, index=True)
+    tenant_id = Column(String, nullable=False)
+    user_id = Column(String, nullable=False)
+    brief_summary = Column(Text, nullable=False)
+    detailed_summary = Column(Text, nullable=True)
+    key_points = Column(JSONB, nullable=True)
+    entities = Column(JSONB, nullable=True)
+    sentiment = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Resumos recentes de um usuário (perfil e telas administrativas)
+        Index("ix_conversation_summaries_tenant_user_created", "tenant_id", "user_id", "created_at"),
+    )
@@ -1,7 +1,7 @@
 # app/db/models/token_usage.py
 from datetime import datetime
 import uuid
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Float, Boolean, UUID
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, BigInteger, String, Float, Boolean, UUID, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
 from app.db.session import Base
@@ -64,4 +64,45 @@ class TokenUsageAlert(Base):
 
     # Relacionamentos
     tenant = relationship("Tenant", back_populates="token_alerts")
-    agent = relationship("Agent", back_populates="token_alerts")
\ No newline at end of file
+    agent = relationship("Agent", back_populates="token_alerts")
+
+class TokenUsageHourly(Base):
+    """Agregado horário de uso de tokens (tenant, agente, modelo, hora)."""
+    __tablename__ = "token_usage_hourly"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "agent_id", "model_id", "period_start", name="uq_token_usage_hourly_bucket"),
+        Index("idx_token_usage_hourly_tenant_period", "tenant_id", "period_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey("agents.id"), nullable=False)
+    model_id = Column(Integer, ForeignKey("llm_models.id"), nullable=False)
+    period_start = Column(DateTime, nullable=False)  # Início da hora (date_trunc('hour'))
+    request_count = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    estimated_cost_usd = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TokenUsageDaily(Base):
+    """Agregado diário de uso de tokens (tenant, agente, modelo, dia)."""
+    __tablename__ = "token_usage_daily"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "agent_id", "model_id", "period_start", name="uq_token_usage_daily_bucket"),
+        Index("idx_token_usage_daily_tenant_period", "tenant_id", "period_start"),
+        Index("idx_token_usage_daily_agent_period", "agent_id", "period_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    agent_id = Column(UUID(as_uuid=True), ForeignKey("agents.id"), nullable=False)
+    model_id = Column(Integer, ForeignKey("llm_models.id"), nullable=False)
+    period_start = Column(DateTime, nullable=False)  # Início do dia (date_trunc('day'))
+    request_count = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    estimated_cost_usd = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
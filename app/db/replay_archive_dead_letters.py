@@ -0,0 +1,21 @@
+#app/db/replay_archive_dead_letters.py
+
+import logging
+
+from app.services.archive_writer import get_archive_writer, stop_archive_writer
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.db.replay_archive_dead_letters")
+
+def replay_archive_dead_letters() -> int:
+    """Reenfileira os registros do dead letter e aguarda a gravação no banco."""
+    try:
+        return get_archive_writer().replay_dead_letters()
+    finally:
+        # Encerrar o writer grava o que ainda está na fila
+        stop_archive_writer()
+
+if __name__ == "__main__":
+    logger.info("Starting archive dead letter replay...")
+    replayed = replay_archive_dead_letters()
+    logger.info(f"Archive dead letter replay completed: {replayed} records requeued")
@@ -1,13 +1,135 @@
-from sqlalchemy import create_engine
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Generator
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
 # Criar URL do banco de dados
 SQLALCHEMY_DATABASE_URI = f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_SERVER}/{settings.POSTGRES_DB}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+# Engine separado para jobs em segundo plano (arquivamento, reconciliação, backfills),
+# para que eles não disputem conexões com as requisições da API
+worker_engine = create_engine(
+    SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    pool_size=settings.WORKER_DB_POOL_SIZE,
+    max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE
+)
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
+# Engine assíncrono (asyncpg) para as consultas do processamento de mensagens.
+# O engine síncrono acima continua sendo usado pelos endpoints administrativos.
+ASYNC_SQLALCHEMY_DATABASE_URI = f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_SERVER}/{settings.POSTGRES_DB}"
+
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+
+@contextmanager
+def worker_session() -> Generator[Session, None, None]:
+    """
+    Sessão de banco para jobs em segundo plano.
+    Cada job/iteração abre a sua sessão e a devolve ao pool ao final.
+    """
+    db = WorkerSessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# ---- Métricas de checkout do pool ----
+
+class _PoolMetrics:
+    """Contadores de checkout/checkin de conexões de um engine."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.total_hold_time = 0.0
+        self.max_hold_time = 0.0
+    
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checkout_at"] = time.monotonic()
+        with self._lock:
+            self.checkouts += 1
+    
+    def on_checkin(self, dbapi_connection, connection_record):
+        checkout_at = connection_record.info.pop("checkout_at", None)
+        with self._lock:
+            self.checkins += 1
+            if checkout_at is not None:
+                held = time.monotonic() - checkout_at
+                self.total_hold_time += held
+                self.max_hold_time = max(self.max_hold_time, held)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "avg_hold_ms": round(self.total_hold_time / self.checkins * 1000, 2) if self.checkins else 0.0,
+                "max_hold_ms": round(self.max_hold_time * 1000, 2)
+            }
+
+
+_pool_metrics: Dict[str, _PoolMetrics] = {}
+
+def _register_pool_metrics(name: str, sync_engine: Engine):
+    metrics = _PoolMetrics()
+    event.listen(sync_engine, "checkout", metrics.on_checkout)
+    event.listen(sync_engine, "checkin", metrics.on_checkin)
+    _pool_metrics[name] = metrics
+
+_register_pool_metrics("api", engine)
+_register_pool_metrics("worker", worker_engine)
+_register_pool_metrics("async", async_engine.sync_engine)
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Retorna o estado atual e as métricas de checkout de cada pool de conexões."""
+    engines = {"api": engine, "worker": worker_engine, "async": async_engine.sync_engine}
+    
+    stats = {}
+    for name, pool_engine in engines.items():
+        pool = pool_engine.pool
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checked_in": pool.checkedin(),
+            **_pool_metrics[name].snapshot()
+        }
+    
+    return stats
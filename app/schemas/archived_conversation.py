@@ -8,6 +8,7 @@ class ArchivedConversationBase(BaseModel):
     user_id: str
     message_count: int
     archive_reason: Optional[str] = None
+    final_agent_id: Optional[str] = None
 
 class ArchivedConversationCreate(ArchivedConversationBase):
     history: List[Dict[str, Any]]
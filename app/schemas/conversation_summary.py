@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    tenant_id: str
+    user_id: str
+    brief_summary: str
+    detailed_summary: Optional[str] = None
+    key_points: Optional[List[str]] = None
+    entities: Optional[Dict[str, Any]] = None
+    sentiment: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
@@ -58,7 +58,7 @@ class TokenUsageLogResponse(TokenUsageLogBase):
 class TokenUsageSummary(BaseModel):
     tenant_id: Optional[int] = None
     agent_id: Optional[str] = None
-    period: str  # "daily", "monthly", "yearly"
+    period: str  # "hourly", "daily", "monthly", "yearly"
     period_value: str  # e.g., "2025-05", "2025-05-20"
     total_tokens: int
     prompt_tokens: int
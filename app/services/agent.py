@@ -13,6 +13,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models.agent import Agent as AgentModel
 from app.db.models.contact_control import ContactControl, ContactListType
 from app.db.models.device_agent import DeviceAgent
+from app.db.session import AsyncSessionLocal
 from app.schemas.agent import Agent, AgentPrompt, AgentType
 from app.services.whatsapp import WhatsAppService
 import logging
@@ -161,6 +162,21 @@ class AgentService:
         # Converter para schema
         return self._db_to_schema(db_agent)
     
+    async def get_agent_async(self, agent_id: str) -> Optional[Agent]:
+        """Obtém um agente pelo ID usando a sessão assíncrona (fluxo de mensagens)."""
+        if not agent_id:
+            return None
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(AgentModel).where(AgentModel.id == agent_id))
+            db_agent = result.scalar_one_or_none()
+        
+        if not db_agent:
+            return None
+        
+        # Converter para schema
+        return self._db_to_schema(db_agent)
+    
     def get_agents_by_tenant(self, tenant_id: str) -> List[Agent]:
         """Obtém todos os agentes de um tenant."""
         # Buscar no banco de dados
@@ -180,6 +196,17 @@ class AgentService:
         # Converter para schema
         return [self._db_to_schema(db_agent) for db_agent in db_agents]
     
+    async def get_agents_by_tenant_async(self, tenant_id: str) -> List[Agent]:
+        """Obtém todos os agentes de um tenant usando a sessão assíncrona (fluxo de mensagens)."""
+        query = select(AgentModel).where(AgentModel.tenant_id == int(tenant_id))
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            db_agents = result.scalars().all()
+        
+        # Converter para schema
+        return [self._db_to_schema(db_agent) for db_agent in db_agents]
+    
     # Obter agentes com relação com o agente atual # TODO validar
     # def get_agents_by_tenant_and_relationship_with_current_agent(self, tenant_id: str, current_agent_id: str) -> List[Agent]:
     #     """Obtém todos os agentes relacionados ao agente atual para escalação."""
@@ -231,6 +258,29 @@ class AgentService:
         # Converter para schema
         return [self._db_to_schema(db_agent) for db_agent in db_agents]
     
+    async def get_agents_by_tenant_and_relationship_with_current_agent_async(self, tenant_id: str, current_agent_id: str) -> List[Agent]:
+        """Obtém os agentes de escalação do agente atual usando a sessão assíncrona (fluxo de mensagens)."""
+        current_agent = await self.get_agent_async(current_agent_id)
+        if not current_agent or not current_agent.escalation_enabled or not current_agent.list_escalation_agent_ids:
+            return []
+        
+        escalation_agent_ids = current_agent.list_escalation_agent_ids
+        if isinstance(escalation_agent_ids, str):
+            escalation_agent_ids = json.loads(escalation_agent_ids)
+        
+        query = select(AgentModel).where(
+            AgentModel.tenant_id == int(tenant_id),
+            AgentModel.id.in_(escalation_agent_ids),
+            AgentModel.active == True
+        )
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            db_agents = result.scalars().all()
+        
+        # Converter para schema
+        return [self._db_to_schema(db_agent) for db_agent in db_agents]
+    
     
     def update_agent(self, agent_id: str, agent_data: Dict[str, Any]) -> Optional[Agent]:
         """Atualiza um agente existente."""
@@ -444,16 +494,17 @@ class AgentService:
         """
         # Buscar mapeamento ativo para este dispositivo
         query = select(DeviceAgent).join(AgentModel).where(
-            DeviceAgent.device_id == device_id,
+            DeviceAgent.device_id == int(device_id),
             DeviceAgent.is_active == True,
-            AgentModel.tenant_id == tenant_id
+            AgentModel.tenant_id == int(tenant_id)
         )
-        result = self.db.execute(query)
-        mapping = result.scalar_one_or_none()
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            mapping = result.scalar_one_or_none()
         
         if mapping:
             # Retornar o agente mapeado para este dispositivo
-            return self.get_agent(mapping.agent_id)
+            return await self.get_agent_async(mapping.agent_id)
         
         # Fallback: buscar agente geral do tenant
         # general_agents = await self.get_agents_by_tenant_and_type(tenant_id, AgentType.GENERAL)
@@ -473,21 +524,32 @@ class AgentService:
         """
         # Buscar todos os mapeamentos de dispositivo-agente ativos
         query = select(DeviceAgent).join(AgentModel).where(
-            DeviceAgent.device_id == device_id,
+            DeviceAgent.device_id == int(device_id),
             DeviceAgent.is_active == True,
-            AgentModel.tenant_id == tenant_id,
+            AgentModel.tenant_id == int(tenant_id),
             AgentModel.active == True
         )
-        result = self.db.execute(query)
-        device_agents = result.scalars().all()
-        
-        if not device_agents:
-            logger.info("Nenhum agente mapeado para este dispositivo")
-            print("Nenhum agente mapeado para este dispositivo")
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            device_agents = result.scalars().all()
+            
+            if not device_agents:
+                logger.info("Nenhum agente mapeado para este dispositivo")
+                print("Nenhum agente mapeado para este dispositivo")
+                
+                # Nenhum agente mapeado para este dispositivo, usar fallback
+                #general_agents = self.get_agents_by_tenant_and_type(tenant_id, AgentType.GENERAL)
+                return None, False
             
-            # Nenhum agente mapeado para este dispositivo, usar fallback
-            #general_agents = self.get_agents_by_tenant_and_type(tenant_id, AgentType.GENERAL)
-            return None, False
+            # Controle de contatos de todos os agentes do dispositivo em uma única consulta
+            contact_query = select(ContactControl).where(
+                ContactControl.agent_id.in_([device_agent.agent_id for device_agent in device_agents]),
+                ContactControl.device_id == int(device_id)
+            )
+            contact_result = await session.execute(contact_query)
+            contacts_by_agent: Dict[Any, List[ContactControl]] = {}
+            for control in contact_result.scalars().all():
+                contacts_by_agent.setdefault(control.agent_id, []).append(control)
         
         should_response = False
         
@@ -496,12 +558,7 @@ class AgentService:
             agent_id = device_agent.agent_id
             
             # Verificar controle de contatos para este agente
-            contact_query = select(ContactControl).where(
-                ContactControl.agent_id == agent_id,
-                ContactControl.device_id == device_id
-            )
-            contact_result = self.db.execute(contact_query)
-            contacts = contact_result.scalars().all()
+            contacts = contacts_by_agent.get(agent_id, [])
             
             # Agrupar por tipo de lista
             whitelist = [c.contact_id for c in contacts if c.list_type == ContactListType.WHITELIST]
@@ -517,14 +574,14 @@ class AgentService:
             else:
                 # Se não há listas, o agente responde a todos
                 should_response = True
-                return self.get_agent(agent_id), should_response
+                return await self.get_agent_async(agent_id), should_response
             
             
         
         # Nenhum agente específico deve responder a este contato
         # Usar o agente geral do tenant como fallback
         # na verdade, não retornar nada aqui
-        return self.get_agent(agent_id), should_response
+        return await self.get_agent_async(agent_id), should_response
 
     async def manage_contact_list(self, agent_id: str, device_id: int, contacts: List[str], 
                                 list_type: ContactListType) -> bool:
@@ -0,0 +1,324 @@
+# app/services/archive_writer.py
+import copy
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.archive_writer")
+
+
+class ConversationArchiveWriter:
+    """
+    Grava conversas arquivadas e resumos no PostgreSQL em segundo plano.
+    
+    As conversas são enfileiradas pelo orquestrador e inseridas em lotes por uma
+    thread dedicada, com novas tentativas em caso de falha, para que o fluxo de
+    mensagens não espere pela escrita no banco.
+    
+    Se um lote continuar falhando após as novas tentativas, os registros são
+    gravados um a um; os que ainda assim falharem vão para o arquivo de dead letter
+    (JSON lines), de onde podem ser reenfileirados com `replay_dead_letters`.
+    Registros recusados com a fila cheia também vão para o dead letter, gravado
+    pela thread de escrita (nunca na thread de quem enfileira).
+    """
+    
+    def __init__(
+        self,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_retries: int = 3,
+        max_queue_size: int = 10000,
+        dead_letter_path: Optional[str] = None
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._dead_letter_lock = threading.Lock()
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        # Registros recusados com a fila cheia, gravados no dead letter pela thread de escrita
+        self._overflow: "deque[Dict[str, Any]]" = deque()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Inicia a thread de escrita (idempotente)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="conversation-archive-writer", daemon=True)
+            self._thread.start()
+            logger.info(f"Archive writer iniciado (lote={self.batch_size}, intervalo={self.flush_interval}s)")
+    
+    def stop(self, timeout: float = 10.0):
+        """Sinaliza a parada e aguarda a gravação do que ainda está na fila."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Archive writer encerrado com {self._queue.qsize()} conversas pendentes")
+            self._thread = None
+    
+    def enqueue(self, state) -> bool:
+        """
+        Enfileira uma conversa para arquivamento.
+        
+        Args:
+            state: ConversationState a ser arquivado
+        
+        Returns:
+            True se a conversa foi enfileirada
+        """
+        # Copiar os dados agora: o estado continua sendo alterado pelo orquestrador
+        record = {
+            "conversation_id": state.conversation_id,
+            "tenant_id": state.tenant_id,
+            "user_id": state.user_id,
+            "history": copy.deepcopy(state.history),
+            "meta_data": copy.deepcopy(state.metadata),
+            "message_count": len(state.history),
+            "archive_reason": state.metadata.get("archive_reason", "unknown"),
+            "final_agent_id": state.current_agent_id,
+            "archived_at": datetime.utcnow()
+        }
+        
+        return self._put(record)
+    
+    def enqueue_summary(self, summary) -> bool:
+        """
+        Enfileira o resumo de uma conversa (upsert por conversation_id).
+        
+        Args:
+            summary: ConversationSummary gerado pelo MemoryService
+        
+        Returns:
+            True se o resumo foi enfileirado
+        """
+        record = {
+            "_kind": "summary",
+            "conversation_id": summary.conversation_id,
+            "tenant_id": str(summary.tenant_id),
+            "user_id": summary.user_id,
+            "brief_summary": summary.brief_summary,
+            "detailed_summary": summary.detailed_summary,
+            "key_points": list(summary.key_points or []),
+            "entities": dict(summary.entities or {}),
+            "sentiment": summary.sentiment,
+            "created_at": datetime.utcfromtimestamp(summary.created_at),
+            "updated_at": datetime.utcnow()
+        }
+        
+        return self._put(record)
+    
+    def _put(self, record: Dict[str, Any]) -> bool:
+        """
+        Coloca um registro na fila. Com a fila cheia o registro é entregue à thread de
+        escrita para o dead letter: nada é gravado na thread atual (que pode ser o event loop).
+        """
+        self.start()
+        
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            logger.error(f"Fila de arquivamento cheia, registro da conversa {record['conversation_id']} enviado ao dead letter")
+            self._overflow.append(record)
+            return False
+    
+    def _run(self):
+        """Loop da thread: acumula registros e grava em lotes."""
+        while not (self._stop_event.is_set() and self._queue.empty() and not self._overflow):
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+            self._drain_overflow()
+    
+    def _drain_overflow(self) -> None:
+        """Grava no dead letter os registros recusados com a fila cheia."""
+        records = []
+        while self._overflow:
+            records.append(self._overflow.popleft())
+        if records:
+            self._dead_letter(records)
+    
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Aguarda até `batch_size` registros ou até o fim do intervalo de flush."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        Insere um lote de registros, com novas tentativas e backoff exponencial.
+        Se o lote continuar falhando, grava registro a registro para que um único
+        registro inválido não descarte os demais.
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._insert(batch)
+                logger.info(f"{len(batch)} registros de conversas arquivados no banco de dados")
+                return True
+            except Exception as e:
+                logger.error(f"Falha ao arquivar lote de {len(batch)} conversas (tentativa {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(min(2 ** attempt, 30))
+        
+        failed = batch
+        if len(batch) > 1:
+            failed = []
+            for record in batch:
+                try:
+                    self._insert([record])
+                except Exception as e:
+                    logger.error(f"Falha ao arquivar registro da conversa {record['conversation_id']}: {e}")
+                    failed.append(record)
+            
+            logger.warning(f"Lote gravado registro a registro: {len(batch) - len(failed)}/{len(batch)} arquivados")
+        
+        if failed:
+            self._dead_letter(failed)
+        
+        return not failed
+    
+    def _insert(self, records: List[Dict[str, Any]]) -> None:
+        """Grava os registros em uma única transação (levanta a exceção em caso de falha)."""
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        from app.db.models.archived_conversation import ArchivedConversation
+        from app.db.models.conversation_summary import ConversationSummaryRecord
+        from app.db.session import WorkerSessionLocal
+        
+        archives = []
+        summaries = {}
+        for record in records:
+            values = {k: v for k, v in record.items() if k != "_kind"}
+            if record.get("_kind") == "summary":
+                # Apenas o resumo mais recente de cada conversa no lote
+                summaries[values["conversation_id"]] = values
+            else:
+                archives.append(values)
+        
+        db = WorkerSessionLocal()
+        try:
+            if archives:
+                db.add_all([ArchivedConversation(**values) for values in archives])
+            
+            if summaries:
+                stmt = pg_insert(ConversationSummaryRecord).values(list(summaries.values()))
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ConversationSummaryRecord.conversation_id],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in ("brief_summary", "detailed_summary", "key_points", "entities", "sentiment", "updated_at")
+                    }
+                )
+                db.execute(stmt)
+            
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _dead_letter(self, records: List[Dict[str, Any]]) -> None:
+        """Acrescenta registros não gravados ao arquivo de dead letter."""
+        conversation_ids = [record["conversation_id"] for record in records]
+        if not self.dead_letter_path:
+            logger.error(f"Conversas não arquivadas (dead letter desabilitado): {conversation_ids}")
+            return
+        
+        try:
+            with self._dead_letter_lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter_path)), exist_ok=True)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, default=str) + "\n")
+            
+            logger.error(f"{len(records)} registros não arquivados gravados em {self.dead_letter_path}: {conversation_ids}")
+        except Exception as e:
+            logger.error(f"Erro ao gravar dead letter do arquivamento ({conversation_ids}): {e}")
+    
+    def replay_dead_letters(self) -> int:
+        """
+        Reenfileira os registros do arquivo de dead letter.
+        
+        Returns:
+            Número de registros reenfileirados
+        """
+        if not self.dead_letter_path:
+            return 0
+        
+        # Renomear antes de ler (nome único por replay): novas falhas vão para um arquivo novo
+        with self._dead_letter_lock:
+            if os.path.exists(self.dead_letter_path):
+                os.replace(self.dead_letter_path, f"{self.dead_letter_path}.replay.{time.time_ns()}")
+        
+        # Inclui arquivos de replays anteriores interrompidos antes de removê-los
+        replay_paths = sorted(glob.glob(f"{glob.escape(self.dead_letter_path)}.replay*"))
+        
+        replayed = 0
+        for replay_path in replay_paths:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    for field in ("archived_at", "created_at", "updated_at"):
+                        if isinstance(record.get(field), str):
+                            record[field] = datetime.fromisoformat(record[field])
+                    if self._put(record):
+                        replayed += 1
+            
+            os.remove(replay_path)
+        
+        logger.info(f"{replayed} registros do dead letter reenfileirados para arquivamento")
+        return replayed
+
+
+# Singleton do writer
+_archive_writer: Optional[ConversationArchiveWriter] = None
+
+def get_archive_writer() -> ConversationArchiveWriter:
+    """Obtém a instância global do writer de arquivamento."""
+    global _archive_writer
+    
+    if _archive_writer is None:
+        _archive_writer = ConversationArchiveWriter(
+            batch_size=settings.ARCHIVE_BATCH_SIZE,
+            flush_interval=settings.ARCHIVE_FLUSH_INTERVAL,
+            max_retries=settings.ARCHIVE_MAX_RETRIES,
+            dead_letter_path=settings.ARCHIVE_DEAD_LETTER_PATH
+        )
+    
+    return _archive_writer
+
+def stop_archive_writer():
+    """Encerra o writer de arquivamento, gravando as conversas pendentes."""
+    global _archive_writer
+    
+    if _archive_writer is not None:
+        _archive_writer.stop()
+        _archive_writer = None
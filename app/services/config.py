@@ -33,9 +33,11 @@ class MemoryConfig(BaseModel):
     use_local_storage: bool = True
     summary_frequency: int = 10  # Messages
     summary_time_threshold: int = 1800  # Seconds (30 mins)
+    summary_max_input_chars: int = 12000  # Limite de texto novo enviado a cada resumo incremental
     max_memories_per_query: int = 10
     memory_relevance_threshold: float = 0.6
     memory_decay_rate: float = 0.01  # Per day
+    dedup_similarity_threshold: float = 0.92  # Novas memórias acima desta similaridade são mescladas (0 desativa)
     cleanup_age_days: int = 90
     
 class RAGConfig(BaseModel):
@@ -79,6 +81,10 @@ class SystemConfig(BaseModel):
     default_tenant_id: Optional[str] = None
     default_agent_id: Optional[str] = None
     max_conversation_length: int = 100
+    # Compactação do histórico: ao atingir o limite, as mensagens antigas são movidas para
+    # armazenamento frio e substituídas por um resumo, em vez de arquivar a conversa
+    history_compaction_enabled: bool = False
+    history_compaction_keep_messages: int = 20
     conversation_timeout_minutes: int = 60
     enable_escalation_to_human: bool = True
     continuation_delay_in_seconds: int = 5
@@ -111,6 +117,8 @@ class SystemConfig(BaseModel):
             self.memory.memory_db_path = os.getenv("MEMORY_DB_PATH")
         if os.getenv("MEMORY_USE_LOCAL_STORAGE"):
             self.memory.use_local_storage = os.getenv("MEMORY_USE_LOCAL_STORAGE").lower() == "true"
+        if os.getenv("MEMORY_DEDUP_SIMILARITY_THRESHOLD"):
+            self.memory.dedup_similarity_threshold = float(os.getenv("MEMORY_DEDUP_SIMILARITY_THRESHOLD"))
             
         # RAG
         if os.getenv("RAG_ENABLED"):
@@ -129,6 +137,10 @@ class SystemConfig(BaseModel):
             self.default_agent_id = os.getenv("DEFAULT_AGENT_ID")
         if os.getenv("ENABLE_HUMAN_ESCALATION"):
             self.enable_escalation_to_human = os.getenv("ENABLE_HUMAN_ESCALATION").lower() == "true"
+        if os.getenv("HISTORY_COMPACTION_ENABLED"):
+            self.history_compaction_enabled = os.getenv("HISTORY_COMPACTION_ENABLED").lower() == "true"
+        if os.getenv("HISTORY_COMPACTION_KEEP_MESSAGES"):
+            self.history_compaction_keep_messages = int(os.getenv("HISTORY_COMPACTION_KEEP_MESSAGES"))
     
     def load_from_file(self, file_path: str) -> None:
         """Load configuration from a JSON file."""
@@ -0,0 +1,106 @@
+# app/services/embedding_registry.py
+import json
+import os
+import threading
+from typing import Dict, Optional
+import logging
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.embedding_registry")
+
+REGISTRY_FILE = "embedding_dimensions.json"
+
+# Dimensões publicadas dos modelos de embedding usados pelos serviços LLM
+KNOWN_EMBEDDING_DIMENSIONS: Dict[str, int] = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "models/embedding-001": 768,
+    "models/text-embedding-004": 768,
+    # DeepSeek não tem API de embeddings; o fallback local gera vetores de 1536 posições
+    "deepseek-embedding": 1536,
+}
+
+
+class EmbeddingDimensionRegistry:
+    """
+    Registro de dimensões de embedding por provedor/modelo.
+    
+    Consultado na inicialização dos índices de memória para evitar uma chamada
+    de embedding só para descobrir a dimensão. As dimensões descobertas por
+    sondagem são persistidas em `embedding_dimensions.json`, junto aos índices.
+    """
+    
+    def __init__(self, base_path: str):
+        self.path = os.path.join(base_path, REGISTRY_FILE)
+        self._dimensions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+    
+    @staticmethod
+    def key_for(llm_service) -> str:
+        """Chave do registro: '<classe do serviço>:<modelo de embedding>'."""
+        return f"{type(llm_service).__name__}:{getattr(llm_service, 'embedding_model', None) or 'unknown'}"
+    
+    def get(self, llm_service) -> Optional[int]:
+        """Retorna a dimensão conhecida para o serviço, sem chamadas de rede."""
+        dimensions = self._dimensions.get(self.key_for(llm_service))
+        if dimensions:
+            return dimensions
+        
+        return KNOWN_EMBEDDING_DIMENSIONS.get(getattr(llm_service, "embedding_model", None))
+    
+    def set(self, llm_service, dimensions: int) -> None:
+        """Registra (e persiste) a dimensão observada para o serviço."""
+        key = self.key_for(llm_service)
+        if self._dimensions.get(key) == dimensions:
+            return
+        
+        with self._lock:
+            self._dimensions[key] = dimensions
+            self._save()
+    
+    async def resolve(self, llm_service) -> int:
+        """
+        Retorna a dimensão do embedding do serviço, sondando o modelo apenas
+        quando ela não está no registro nem nas especificações conhecidas.
+        """
+        dimensions = self.get(llm_service)
+        if dimensions:
+            return dimensions
+        
+        logger.info(f"Dimensão de embedding desconhecida para {self.key_for(llm_service)}, sondando o modelo")
+        dimensions = len(await llm_service.get_embeddings("test"))
+        self.set(llm_service, dimensions)
+        return dimensions
+    
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        
+        try:
+            with open(self.path, "r") as f:
+                self._dimensions = {key: int(value) for key, value in json.load(f).items()}
+        except Exception as e:
+            logger.warning(f"Erro ao carregar registro de dimensões de embedding {self.path}: {e}")
+    
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._dimensions, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Erro ao gravar registro de dimensões de embedding {self.path}: {e}")
+
+
+# Um registro por diretório de índices
+_registries: Dict[str, EmbeddingDimensionRegistry] = {}
+
+def get_embedding_registry(base_path: str) -> EmbeddingDimensionRegistry:
+    """Obtém o registro de dimensões de embedding para o diretório informado."""
+    if base_path not in _registries:
+        _registries[base_path] = EmbeddingDimensionRegistry(base_path)
+    
+    return _registries[base_path]
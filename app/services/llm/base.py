@@ -1,10 +1,29 @@
 # app/services/llm/base.py
+import asyncio
+import logging
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional, Tuple
 
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.llm.base")
+
 class LLMService(ABC):
     """Interface abstrata para serviços LLM."""
     
+    # Tipo do provedor (mesmo valor de LLMProvider.provider_type)
+    provider_type: Optional[str] = None
+    
+    # Modelo usado por get_embeddings (chave do registro de dimensões de embedding)
+    embedding_model: Optional[str] = None
+    
+    # Limites de get_embeddings_batch: textos e tokens (estimados) por requisição,
+    # requisições simultâneas e tentativas por lote. Provedores com endpoint em lote
+    # aumentam `embedding_batch_size` e sobrescrevem `_embed_batch`.
+    embedding_batch_size: int = 1
+    embedding_batch_max_tokens: int = 8000
+    embedding_concurrency: int = 4
+    embedding_max_retries: int = 3
+    
     @abstractmethod
     async def generate_response(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """Gera uma resposta a partir de mensagens."""
@@ -22,6 +41,64 @@ class LLMService(ABC):
         """Obtém embeddings para um texto."""
         pass
     
+    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Obtém embeddings para vários textos, na mesma ordem de `texts`.
+        
+        Os textos são agrupados em lotes limitados por quantidade e por tokens,
+        enviados com concorrência limitada e com novas tentativas por lote.
+        """
+        if not texts:
+            return []
+        
+        semaphore = asyncio.Semaphore(self.embedding_concurrency)
+        
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_batch_with_retries(batch)
+        
+        results = await asyncio.gather(*(embed(batch) for batch in self._embedding_batches(texts)))
+        return [embedding for batch in results for embedding in batch]
+    
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de um lote. Padrão: uma chamada a get_embeddings por texto."""
+        return list(await asyncio.gather(*(self.get_embeddings(text) for text in texts)))
+    
+    async def _embed_batch_with_retries(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(1, self.embedding_max_retries + 1):
+            try:
+                embeddings = await self._embed_batch(texts)
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"{len(embeddings)} embeddings retornados para {len(texts)} textos")
+                return embeddings
+            except Exception as e:
+                logger.warning(f"Erro ao obter embeddings em lote (tentativa {attempt}/{self.embedding_max_retries}): {e}")
+                if attempt < self.embedding_max_retries:
+                    await asyncio.sleep(min(2 ** (attempt - 1), 30))
+        
+        # Último recurso: chamadas individuais (com o fallback de cada provedor)
+        return [await self.get_embeddings(text) for text in texts]
+    
+    def _estimate_embedding_tokens(self, text: str) -> int:
+        """Estimativa rápida de tokens para o agrupamento em lotes (~4 caracteres por token)."""
+        return len(text) // 4 + 1
+    
+    def _embedding_batches(self, texts: List[str]) -> List[List[str]]:
+        """Agrupa os textos em lotes respeitando `embedding_batch_size` e `embedding_batch_max_tokens`."""
+        batches = []
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = self._estimate_embedding_tokens(text)
+            if batch and (len(batch) >= self.embedding_batch_size or batch_tokens + tokens > self.embedding_batch_max_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        
+        if batch:
+            batches.append(batch)
+        return batches
+    
     @abstractmethod
     async def count_tokens(self, text: str) -> int:
        """Conta tokens em um texto."""
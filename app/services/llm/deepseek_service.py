@@ -11,6 +11,11 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.llm.deepseek_service")
 
 class DeepSeekService(LLMService):
+    provider_type = "deepseek"
+    embedding_model = "deepseek-embedding"
+    embedding_batch_size = 64
+    embedding_batch_max_tokens = 100000
+    
     def __init__(self, api_key: str, model: str = "deepseek-chat", base_url: str = None):
         self.api_key = api_key
         self.model = model
@@ -250,7 +255,7 @@ class DeepSeekService(LLMService):
             
             # Tentar usar endpoint de embeddings se disponível
             payload = {
-                "model": "deepseek-embedding",  # Modelo hipotético
+                "model": self.embedding_model,  # Modelo hipotético
                 "input": text[:8000]  # Truncar para evitar limites
             }
             
@@ -276,6 +281,41 @@ class DeepSeekService(LLMService):
             # Em produção, você poderia usar outro serviço de embeddings
             return self._generate_simple_embedding(text)
 
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings de um lote em uma única requisição. Sem API de embeddings disponível,
+        usa o embedding simples local para todos os textos (sem novas tentativas).
+        """
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/embeddings",
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                },
+                json={
+                    "model": self.embedding_model,
+                    "input": [text[:8000] for text in texts]
+                },
+                timeout=30.0
+            )
+        
+        # Limite de taxa ou erro do servidor: propagar para nova tentativa
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        
+        if response.status_code != 200:
+            logger.warning(f"DeepSeek embeddings not available (status {response.status_code}), using fallback")
+            return [self._generate_simple_embedding(text) for text in texts]
+        
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+    
+    def _estimate_embedding_tokens(self, text: str) -> int:
+        if self.tokenizer:
+            return len(self.tokenizer.encode(text[:8000]))
+        return super()._estimate_embedding_tokens(text[:8000])
+
     def _generate_simple_embedding(self, text: str) -> List[float]:
         """
         Gera um embedding simples baseado em características do texto.
@@ -0,0 +1,145 @@
+# app/services/llm/embedding_batcher.py
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.llm.embedding_batcher")
+
+
+class _PendingBatch:
+    """Textos aguardando envio para um mesmo provedor/modelo/chave."""
+    
+    def __init__(self, llm_service, loop: asyncio.AbstractEventLoop):
+        self.llm_service = llm_service
+        self.loop = loop
+        self.texts: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingMicroBatcher:
+    """
+    Agrupa pedidos de embedding de um único texto feitos por requisições concorrentes.
+    
+    Pedidos para o mesmo provedor, modelo e chave de API que chegam dentro de
+    `window` segundos (ou até `max_batch_size` textos) são enviados em uma única
+    chamada a `get_embeddings_batch`, e cada corrotina recebe o seu embedding.
+    
+    Os lotes são separados por event loop (o loop principal e os loops de
+    `asyncio.run` em threads auxiliares), e o estado compartilhado é protegido por
+    lock. Timer, futures e envio de cada lote rodam sempre no loop que o criou.
+    """
+    
+    def __init__(self, window: float = 0.01, max_batch_size: int = 64):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Tuple[Any, ...], _PendingBatch] = {}
+        self._metrics = {"requests": 0, "batches": 0}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key_for(llm_service) -> Tuple[Any, ...]:
+        return (
+            type(llm_service).__name__,
+            getattr(llm_service, "embedding_model", None),
+            getattr(llm_service, "api_key", None)
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Pedidos recebidos, chamadas em lote feitas e textos aguardando envio."""
+        with self._lock:
+            return {
+                **self._metrics,
+                "pending": sum(len(batch.texts) for batch in self._pending.values())
+            }
+    
+    async def get_embedding(self, llm_service, text: str) -> List[float]:
+        """Embedding de `text`, enviado junto com os demais pedidos da janela atual."""
+        loop = asyncio.get_running_loop()
+        key = (loop, *self.key_for(llm_service))
+        
+        future = loop.create_future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _PendingBatch(llm_service, loop)
+                batch.timer = loop.call_later(self.window, self._flush, key)
+            
+            batch.texts.append(text)
+            batch.futures.append(future)
+            self._metrics["requests"] += 1
+            full = len(batch.texts) >= self.max_batch_size
+        
+        if full:
+            self._flush(key)
+        
+        return await future
+    
+    def _flush(self, key: Tuple[Any, ...]) -> None:
+        with self._lock:
+            batch = self._pending.pop(key, None)
+            if batch is None:
+                return
+            self._metrics["batches"] += 1
+        
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        
+        if running_loop is batch.loop:
+            if batch.timer is not None:
+                batch.timer.cancel()
+            batch.loop.create_task(self._send(batch))
+        else:
+            # Chamado fora do loop do lote: agendar no loop dono dos futures e do timer
+            if batch.timer is not None:
+                batch.loop.call_soon_threadsafe(batch.timer.cancel)
+            asyncio.run_coroutine_threadsafe(self._send(batch), batch.loop)
+    
+    async def _send(self, batch: _PendingBatch) -> None:
+        try:
+            if len(batch.texts) == 1:
+                embeddings = [await batch.llm_service.get_embeddings(batch.texts[0])]
+            else:
+                embeddings = await batch.llm_service.get_embeddings_batch(batch.texts)
+        except Exception as e:
+            logger.error(f"Erro ao obter lote de {len(batch.texts)} embeddings: {e}")
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for future, embedding in zip(batch.futures, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+# Singleton do batcher
+_embedding_batcher: Optional[EmbeddingMicroBatcher] = None
+
+def get_embedding_batcher() -> EmbeddingMicroBatcher:
+    """Obtém a instância global do agrupador de embeddings."""
+    global _embedding_batcher
+    
+    if _embedding_batcher is None:
+        _embedding_batcher = EmbeddingMicroBatcher(
+            window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
+        )
+    
+    return _embedding_batcher
+
+async def get_embedding(llm_service, text: str) -> List[float]:
+    """
+    Embedding de um texto, agrupado com os pedidos concorrentes quando o
+    micro-batching está habilitado (EMBEDDING_BATCH_ENABLED).
+    """
+    if not settings.EMBEDDING_BATCH_ENABLED:
+        return await llm_service.get_embeddings(text)
+    
+    return await get_embedding_batcher().get_embedding(llm_service, text)
@@ -0,0 +1,54 @@
+# app/services/llm/embeddings.py
+import asyncio
+from typing import List
+import logging
+
+from langchain.embeddings.base import Embeddings
+
+from app.services.llm.base import LLMService
+from app.services.llm.embedding_batcher import get_embedding
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.llm.embeddings")
+
+
+class LLMEmbeddingAdapter(Embeddings):
+    """
+    Adaptador de embeddings compatível com os vectorstores do LangChain (FAISS),
+    usando o serviço LLM do tenant em vez de um modelo fixo.
+    
+    Os documentos são enviados em lote via `get_embeddings_batch`. No event loop use
+    `aembed_documents`/`aembed_query` (ou calcule os vetores antes e use
+    `FAISS.from_embeddings`/`add_embeddings`); os métodos síncronos, exigidos pelo
+    FAISS, são reservados a threads de trabalho (asyncio.to_thread/run_in_executor).
+    """
+    
+    def __init__(self, llm_service: LLMService):
+        self.llm_service = llm_service
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.llm_service.get_embeddings_batch(list(texts))
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        return await get_embedding(self.llm_service, text)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._run(self.aembed_documents(texts))
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._run(self.aembed_query(text))
+    
+    @staticmethod
+    def _run(coro):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Thread sem event loop (ex.: asyncio.to_thread/run_in_executor)
+            return asyncio.run(coro)
+        
+        # Esperar o resultado aqui bloquearia o event loop durante a chamada ao provedor
+        coro.close()
+        raise RuntimeError(
+            "Embeddings síncronos chamados dentro do event loop: use aembed_documents/aembed_query "
+            "ou chame via asyncio.to_thread"
+        )
@@ -9,6 +9,8 @@ from app.services.llm.deepseek_service import DeepSeekService
 from app.db.models.llm_provider import LLMProvider
 from app.db.models.llm_model import LLMModel
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import logging
 
@@ -32,6 +34,11 @@ class LLMServiceFactory:
         
         print(f"[DEBUG] LLMServiceFactory.create_service: tenant_id: {tenant_id}, provider_id: {provider_id}, model_id: {model_id}")
         
+        # Sessão assíncrona (fluxo de mensagens): consultas sem bloquear o event loop
+        if isinstance(db, AsyncSession):
+            provider, model, api_key = await LLMServiceFactory._load_config_async(db, tenant_id, provider_id, model_id)
+            return LLMServiceFactory._build_service(provider, model, api_key)
+        
         # Verificar se db é uma instância de Session e não Depends
         if not isinstance(db, Session):
             logger.error(f"Parâmetro db inválido: {type(db)}")
@@ -99,6 +106,77 @@ class LLMServiceFactory:
             except Exception as e:
                 logger.error(f"Erro ao obter model {model_id}: {e}")
         
+        return LLMServiceFactory._build_service(provider, model, api_key)
+    
+    @staticmethod
+    async def _load_config_async(db: AsyncSession, tenant_id: Optional[Union[int, str]] = None,
+                                 provider_id: Optional[int] = None,
+                                 model_id: Optional[int] = None):
+        """
+        Versão assíncrona da resolução de provider, modelo e API key.
+        Mesma precedência da versão síncrona: tenant < provider_id < model_id.
+        """
+        provider = None
+        model = None
+        api_key = None
+        
+        # Converter tenant_id para int se for string
+        if isinstance(tenant_id, str) and tenant_id.isdigit():
+            tenant_id = int(tenant_id)
+        
+        async def _first_active_model(provider_obj):
+            if not provider_obj:
+                return None
+            result = await db.execute(
+                select(LLMModel).where(LLMModel.provider_id == provider_obj.id, LLMModel.is_active == True).limit(1)
+            )
+            return result.scalars().first()
+        
+        if tenant_id:
+            try:
+                tenant = await db.get(Tenant, tenant_id)
+                if tenant:
+                    if tenant.default_llm_model_id:
+                        model = await db.get(LLMModel, tenant.default_llm_model_id)
+                        provider = await db.get(LLMProvider, model.provider_id) if model else None
+                    elif tenant.default_llm_provider_id:
+                        provider = await db.get(LLMProvider, tenant.default_llm_provider_id)
+                        model = await _first_active_model(provider)
+                    
+                    # Usar API key específica do tenant ou a global
+                    if provider:
+                        api_key = tenant.llm_api_key or get_api_key_for_provider(provider.provider_type)
+                    else:
+                        api_key = tenant.llm_api_key or get_api_key_for_provider("openai")
+            except Exception as e:
+                logger.error(f"Erro ao obter configurações do tenant {tenant_id}: {e}")
+                logger.exception(e)
+        
+        if provider_id:
+            try:
+                provider_obj = await db.get(LLMProvider, provider_id)
+                if provider_obj:
+                    provider = provider_obj
+                    model = await _first_active_model(provider)
+                    api_key = get_api_key_for_provider(provider.provider_type)
+            except Exception as e:
+                logger.error(f"Erro ao obter provider {provider_id}: {e}")
+        
+        if model_id:
+            try:
+                model_obj = await db.get(LLMModel, model_id)
+                if model_obj:
+                    model = model_obj
+                    provider = await db.get(LLMProvider, model.provider_id)
+                    api_key = get_api_key_for_provider(provider.provider_type) if provider else get_api_key_for_provider("openai")
+            except Exception as e:
+                logger.error(f"Erro ao obter model {model_id}: {e}")
+        
+        return provider, model, api_key
+    
+    @staticmethod
+    def _build_service(provider, model, api_key) -> LLMService:
+        """Cria o serviço LLM adequado para o provider e modelo resolvidos."""
         # Criar serviço adequado
         if not provider or not model:
             # Fallback para OpenAI
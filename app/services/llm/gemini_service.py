@@ -13,6 +13,12 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.llm.gemini_service")
 
 class GeminiService(LLMService):
+    provider_type = "gemini"
+    embedding_model = "models/embedding-001"
+    # embed_content aceita até 100 textos por chamada
+    embedding_batch_size = 100
+    embedding_batch_max_tokens = 200000
+    
     def __init__(self, api_key: str, model: str = "gemini-1.5-flash", base_url: str = None):
         self.api_key = api_key
         self.model = model
@@ -592,7 +598,7 @@ class GeminiService(LLMService):
         try:
             # Usar o modelo de embedding do Gemini
             result = genai.embed_content(
-                model="models/embedding-001",
+                model=self.embedding_model,
                 content=text,
                 task_type="retrieval_document"
             )
@@ -603,6 +609,24 @@ class GeminiService(LLMService):
             import random
             return [random.random() for _ in range(768)]
 
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de um lote em uma única chamada a embed_content (content como lista)."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            self._get_embeddings_batch_sync,
+            texts
+        )
+    
+    def _get_embeddings_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        """Método síncrono para obter embeddings em lote (erros propagados para novas tentativas)."""
+        result = genai.embed_content(
+            model=self.embedding_model,
+            content=texts,
+            task_type="retrieval_document"
+        )
+        return result['embedding']
+
     def _convert_to_gemini_format(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
         """
         Converte mensagens do formato OpenAI para o formato Gemini.
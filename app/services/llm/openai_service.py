@@ -12,6 +12,12 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.llm.openai_service")
     
 class OpenAIService(LLMService):
+    provider_type = "openai"
+    embedding_model = "text-embedding-ada-002"
+    # Endpoint de embeddings aceita uma lista de entradas por requisição
+    embedding_batch_size = 256
+    embedding_batch_max_tokens = 100000
+    
     def __init__(self, api_key: str, model: str = "gpt-4o-mini", base_url: str = None):
         self.api_key = api_key
         self.model = model
@@ -185,7 +191,7 @@ class OpenAIService(LLMService):
                         "Authorization": f"Bearer {self.api_key}"
                     },
                     json={
-                        "model": "text-embedding-ada-002",
+                        "model": self.embedding_model,
                         "input": text[:8000]  # Truncate to avoid token limits
                     },
                     timeout=10.0
@@ -198,6 +204,30 @@ class OpenAIService(LLMService):
             import random
             return [random.random() for _ in range(1536)]
         
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de um lote em uma única requisição (input como lista)."""
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                "https://api.openai.com/v1/embeddings",
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                },
+                json={
+                    "model": self.embedding_model,
+                    "input": [text[:8000] for text in texts]  # Truncate to avoid token limits
+                },
+                timeout=30.0
+            )
+            response.raise_for_status()
+            data = sorted(response.json()["data"], key=lambda item: item["index"])
+            return [item["embedding"] for item in data]
+    
+    def _estimate_embedding_tokens(self, text: str) -> int:
+        if self.tokenizer:
+            return len(self.tokenizer.encode(text[:8000]))
+        return super()._estimate_embedding_tokens(text[:8000])
+        
     async def generate_response_with_audio(
         self, 
         messages: List[Dict[str, str]], 
@@ -11,10 +11,17 @@ import json
 import hashlib
 import asyncio
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import httpx
 from langchain_community.vectorstores import FAISS
 from app.core.config import Settings, settings
+from app.services.memory_index_store import (
+    CURRENT_POINTER, SNAPSHOTS_DIR, PrecomputedEmbeddings, get_memory_index_store, resolve_index_dir
+)
+from app.services.embedding_registry import get_embedding_registry
+from app.services.llm.embedding_batcher import get_embedding
+from app.services.memory_fallback import get_fallback_memory_index
+from app.core.redis import get_redis
 from langchain.schema import Document
 
 logging.basicConfig(level=logging.DEBUG)
@@ -38,8 +45,9 @@ class MemoryEntry(BaseModel):
     metadata: Dict[str, Any] = {}
     embedding: Optional[List[float]] = None
     importance: float = 0.5
-    created_at: float = time.time()
-    last_accessed: float = time.time()
+    # Carimbados na criação de cada entrada (não na importação do módulo)
+    created_at: float = Field(default_factory=time.time)
+    last_accessed: float = Field(default_factory=time.time)
     access_count: int = 0
 
 class ConversationSummary(BaseModel):
@@ -52,14 +60,19 @@ class ConversationSummary(BaseModel):
     key_points: List[str]
     entities: Dict[str, Any]
     sentiment: str
-    created_at: float = time.time()
+    created_at: float = Field(default_factory=time.time)
 
 class MemoryService:
     """Service for managing long-term memory."""
     
     def __init__(self, llm_service, db_connection_string=None, 
-             vector_db_url=None, vector_db_path=None, use_local_storage=True):
+             vector_db_url=None, vector_db_path=None, use_local_storage=True,
+             decay_rate: float = 0.01, relevance_threshold: float = 0.6,
+             dedup_threshold: Optional[float] = 0.92):
         self.llm = llm_service
+        self.decay_rate = decay_rate  # Decaimento da recência por dia sem acesso
+        self.relevance_threshold = relevance_threshold  # Similaridade mínima para retornar uma memória
+        self.dedup_threshold = dedup_threshold  # Similaridade a partir da qual uma nova memória é mesclada à existente
         self.db_url = db_connection_string
         self.vector_db_url = vector_db_url
         self.vector_db_path = vector_db_path or settings.VECTOR_DB_PATH
@@ -70,33 +83,46 @@ class MemoryService:
         self.embedding_dimensions = {}  # {tenant_id: dimension_size}
         
         # In-memory fallback
-        self._memory_entries = []
-        self._summaries = []
+        self._fallback_index = get_fallback_memory_index()
         
     async def _init_faiss_index(self, tenant_id: str):
         """
         Inicializa o índice FAISS para um tenant específico, garantindo consistência dimensional.
         """
-        # Verificar se já existe índice para este tenant
-        if tenant_id in self.faiss_indices:
-            return self.faiss_indices[tenant_id]
+        # Índice já carregado no processo (compartilhado entre instâncias do serviço)
+        tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{tenant_id}")
+        index_store = get_memory_index_store()
+        shared_index = index_store.get(tenant_vector_path)
+        
+        # Já verificado por esta instância (e ainda não descartado do cache compartilhado)
+        if shared_index is not None and self.faiss_indices.get(tenant_id) is shared_index:
+            return shared_index
         
         try:
+            # Dimensão do embedding atual (registro local; só sonda o modelo se desconhecida)
+            current_dimensions = await get_embedding_registry(self.vector_db_path).resolve(self.llm)
+            
+            if shared_index is not None:
+                if shared_index.index.d == current_dimensions:
+                    self.faiss_indices[tenant_id] = shared_index
+                    self.embedding_dimensions[tenant_id] = current_dimensions
+                    return shared_index
+                
+                # Modelo de embedding do tenant mudou: recarregar (e recriar) a partir do disco
+                logger.warning(f"Cached FAISS index for tenant {tenant_id} has {shared_index.index.d}D embeddings, expected {current_dimensions}D. Reloading.")
+                await asyncio.to_thread(index_store.discard, tenant_vector_path)
+            
             from langchain_community.vectorstores import FAISS
             from langchain.schema import Document
             import numpy as np
             
             # Criar diretório específico para o tenant
-            tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{tenant_id}")
             os.makedirs(tenant_vector_path, exist_ok=True)
             
-            index_file = os.path.join(tenant_vector_path, "index.faiss")
+            index_dir = resolve_index_dir(tenant_vector_path)
+            index_file = os.path.join(index_dir, "index.faiss")
             metadata_file = os.path.join(tenant_vector_path, "embedding_info.json")
             
-            # Obter informações sobre dimensões do embedding atual
-            test_embedding = await self._get_embedding("test")
-            current_dimensions = len(test_embedding)
-            
             # Verificar se existe índice e se as dimensões são compatíveis
             if os.path.exists(index_file) and os.path.exists(metadata_file):
                 try:
@@ -110,15 +136,20 @@ class MemoryService:
                     # Verificar compatibilidade dimensional
                     if stored_dimensions == current_dimensions:
                         # Dimensões compatíveis, carregar índice existente
-                        embedding_adapter = self._create_embedding_adapter()
-                        
-                        faiss_index = FAISS.load_local(
-                            tenant_vector_path,
-                            embedding_adapter,
+                        faiss_index = await asyncio.to_thread(
+                            FAISS.load_local,
+                            index_dir,
+                            PrecomputedEmbeddings(),
                             "index",
                             allow_dangerous_deserialization=True
                         )
                         
+                        # Registrar no cache compartilhado, reaplicando memórias do log pendente
+                        await asyncio.to_thread(
+                            index_store.register, tenant_vector_path, faiss_index, self._create_embedding_adapter()
+                        )
+                        faiss_index = index_store.get(tenant_vector_path)
+                        
                         self.faiss_indices[tenant_id] = faiss_index
                         self.embedding_dimensions[tenant_id] = current_dimensions
                         
@@ -133,10 +164,13 @@ class MemoryService:
                         backup_dir = os.path.join(tenant_vector_path, f"backup_{int(time.time())}")
                         os.makedirs(backup_dir, exist_ok=True)
                         
-                        if os.path.exists(index_file):
-                            shutil.move(index_file, os.path.join(backup_dir, "index.faiss"))
-                        if os.path.exists(f"{tenant_vector_path}/index.pkl"):
-                            shutil.move(f"{tenant_vector_path}/index.pkl", os.path.join(backup_dir, "index.pkl"))
+                        for filename in ("index.faiss", "index.pkl"):
+                            if os.path.exists(os.path.join(index_dir, filename)):
+                                shutil.move(os.path.join(index_dir, filename), os.path.join(backup_dir, filename))
+                        # Snapshots e log pendente pertencem ao índice antigo
+                        for name in (CURRENT_POINTER, SNAPSHOTS_DIR, "pending.log", "pending.log.flushing"):
+                            if os.path.exists(os.path.join(tenant_vector_path, name)):
+                                shutil.move(os.path.join(tenant_vector_path, name), os.path.join(backup_dir, name))
                         
                 except Exception as e:
                     logger.warning(f"Error loading existing index for tenant {tenant_id}: {e}")
@@ -155,16 +189,19 @@ class MemoryService:
                 }
             )
             
-            # Criar índice FAISS
-            faiss_index = FAISS.from_documents([temp_doc], embedding_adapter)
-            
-            # Salvar índice
-            faiss_index.save_local(tenant_vector_path, "index")
+            # Criar índice FAISS com o vetor calculado no loop (sem o adaptador síncrono)
+            vectors = await embedding_adapter.aembed_documents([temp_doc.page_content])
+            faiss_index = FAISS.from_embeddings(
+                [(temp_doc.page_content, vectors[0])],
+                PrecomputedEmbeddings(),
+                metadatas=[temp_doc.metadata]
+            )
             
             # Salvar metadados do embedding
             embedding_metadata = {
                 'dimensions': current_dimensions,
                 'llm_type': type(self.llm).__name__,
+                'embedding_model': getattr(self.llm, 'embedding_model', None),
                 'created_at': time.time(),
                 'tenant_id': tenant_id
             }
@@ -172,7 +209,10 @@ class MemoryService:
             with open(metadata_file, 'w') as f:
                 json.dump(embedding_metadata, f, indent=2)
             
-            # Armazenar em cache
+            # Armazenar em cache e gravar o primeiro snapshot
+            await asyncio.to_thread(index_store.register, tenant_vector_path, faiss_index)
+            await asyncio.to_thread(index_store.flush, tenant_vector_path, True)
+            faiss_index = index_store.get(tenant_vector_path)
             self.faiss_indices[tenant_id] = faiss_index
             self.embedding_dimensions[tenant_id] = current_dimensions
             
@@ -385,28 +425,50 @@ class MemoryService:
     #     return entry.id
     
     def _create_embedding_adapter(self):
-        """Cria um adaptador compatível com FAISS"""
-        from langchain_openai import OpenAIEmbeddings
-        
-        # Usar OpenAI Embeddings diretamente - sem nest_asyncio
-        openai_api_key_from_env = os.getenv("OPENAI_API_KEY", "")
-        return OpenAIEmbeddings(
-            openai_api_key=openai_api_key_from_env,
-            model="text-embedding-ada-002"
-        )
+        """Cria um adaptador compatível com FAISS (embeddings do serviço LLM do tenant)"""
+        from app.services.llm.embeddings import LLMEmbeddingAdapter
+        return LLMEmbeddingAdapter(self.llm)
+    
+    async def add_memories(self, entries: List[MemoryEntry]) -> List[str]:
+        """
+        Adiciona várias memórias, gerando os embeddings em lote.
+        
+        Args:
+            entries: The memory entries to add
+                
+        Returns:
+            The IDs of the added (or merged) memories, in order
+        """
+        pending = [entry for entry in entries if entry.embedding is None]
+        if pending:
+            embeddings = await self.llm.get_embeddings_batch([entry.content for entry in pending])
+            for entry, embedding in zip(pending, embeddings):
+                entry.embedding = embedding
+            if embeddings and embeddings[0] and self.vector_db_path:
+                get_embedding_registry(self.vector_db_path).set(self.llm, len(embeddings[0]))
+        
+        # Gravação sequencial: a deduplicação considera as memórias gravadas antes no mesmo lote
+        return [await self.add_memory(entry) for entry in entries]
     
     async def add_memory(self, entry: MemoryEntry) -> str:
         """
         Adds a new memory entry to the system.
         
+        Quase duplicatas (mesmo usuário e tipo, similaridade >= dedup_threshold) não
+        geram um novo vetor: a memória existente é atualizada e o seu ID é retornado.
+        
         Args:
             entry: The memory entry to add
                 
         Returns:
-            The ID of the added memory
+            The ID of the added memory (or of the existing memory it was merged into)
         """
-        # Generate embedding for this memory for retrieval later
-        entry.embedding = await self._get_embedding(entry.content)
+        # Generate embedding for this memory for retrieval later (add_memories já os gera em lote)
+        if entry.embedding is None:
+            entry.embedding = await self._get_embedding(entry.content)
+        
+        # O perfil em cache do usuário deixa de refletir suas memórias
+        await self._invalidate_user_profile(entry.tenant_id, entry.user_id)
         
         # Usar serviço vetorial HTTP se configurado e não estiver usando armazenamento local
         if self.vector_db_url and not self.use_local_storage:
@@ -434,6 +496,25 @@ class MemoryService:
                 if faiss_index:
                     from langchain.schema import Document
                     
+                    tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{entry.tenant_id}")
+                    index_store = get_memory_index_store()
+                    
+                    # Deduplicação: reforçar a memória existente em vez de adicionar outro vetor
+                    if self.dedup_threshold:
+                        merged_id = await asyncio.to_thread(
+                            index_store.merge_duplicate,
+                            tenant_vector_path,
+                            entry.user_id,
+                            entry.embedding,
+                            entry.type.value,
+                            self.dedup_threshold,
+                            entry.importance,
+                            entry.metadata
+                        )
+                        if merged_id:
+                            logger.debug(f"Memória {entry.id} mesclada à memória existente {merged_id}")
+                            return merged_id
+                    
                     # Converter MemoryEntry para Document
                     doc = Document(
                         page_content=entry.content,
@@ -450,19 +531,25 @@ class MemoryService:
                         }
                     )
                     
-                    # Adicionar documento ao índice específico do tenant
-                    faiss_index.add_documents([doc])
-                    
-                    # Salvar alterações
-                    tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{entry.tenant_id}")
-                    faiss_index.save_local(tenant_vector_path, "index")
+                    # Adicionar ao índice em memória + log pendente; o índice completo
+                    # é gravado em disco em lote pelo MemoryIndexStore (write-behind).
+                    # O embedding já calculado é reutilizado (sem nova chamada ao provedor).
+                    await asyncio.to_thread(
+                        index_store.add_documents, tenant_vector_path, [doc], [entry.embedding]
+                    )
                     
                     return entry.id
             except Exception as e:
                 logger.error(f"Error storing memory in FAISS for tenant {entry.tenant_id}: {e}")
         
         # Fallback para in-memory
-        self._memory_entries.append(entry)
+        if self.dedup_threshold:
+            merged = self._fallback_index.merge_duplicate(entry, self.dedup_threshold)
+            if merged is not None:
+                logger.debug(f"Memória {entry.id} mesclada à memória existente {merged.id}")
+                return merged.id
+        
+        self._fallback_index.add(entry)
         return entry.id
     
     async def recall_memories(
@@ -528,13 +615,17 @@ class MemoryService:
                 faiss_index = await self._init_faiss_index(tenant_id)
                 
                 if faiss_index:
-                    # Realizar busca por similaridade
-                    docs_with_scores = faiss_index.similarity_search_with_score(
-                        query, k=limit * 3
+                    # Busca restrita às memórias do usuário (não compete com os demais usuários do tenant).
+                    # Candidatos extras para a etapa de re-ranqueamento.
+                    tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{tenant_id}")
+                    index_store = get_memory_index_store()
+                    docs_with_scores = await asyncio.to_thread(
+                        index_store.search_user, tenant_vector_path, user_id, query_embedding, limit * 3
                     )
                     
                     # Filtrar e processar resultados
-                    filtered_results = []
+                    candidates = []
+                    docs_by_entry = {}
                     for doc, score in docs_with_scores:
                         doc_tenant_id = doc.metadata.get("tenant_id")
                         doc_user_id = doc.metadata.get("user_id")
@@ -548,85 +639,139 @@ class MemoryService:
                                     continue
                             
                             # Converter de Document para MemoryEntry
-                            try:
-                                entry_metadata = json.loads(doc.metadata.get("metadata", "{}"))
-                            except:
-                                entry_metadata = {}
-                                
-                            entry = MemoryEntry(
-                                id=doc.metadata.get("id", str(uuid.uuid4())),
-                                tenant_id=doc_tenant_id,
-                                user_id=doc_user_id,
-                                type=MemoryType(doc_type) if doc_type else MemoryType.FACT,
-                                content=doc.page_content,
-                                metadata=entry_metadata,
-                                embedding=query_embedding,
-                                importance=doc.metadata.get("importance", 0.5),
-                                created_at=doc.metadata.get("created_at", time.time()),
-                                last_accessed=time.time(),
-                                access_count=doc.metadata.get("access_count", 0) + 1
-                            )
+                            entry = self._document_to_entry(doc, embedding=query_embedding)
                             
-                            relevance = 1.0 / (1.0 + score)
-                            filtered_results.append((entry, relevance))
+                            # score: similaridade de cosseno, mesma escala de relevance_threshold no fallback
+                            candidates.append((entry, score))
+                            docs_by_entry[id(entry)] = doc
                     
-                    # Ordenar por relevância e retornar
-                    filtered_results.sort(key=lambda x: x[1], reverse=True)
-                    return [entry for entry, _ in filtered_results[:limit]]
+                    selected = self._rerank_memories(candidates, limit)
+                    self._mark_accessed(selected)
+                    
+                    # Estatísticas de acesso gravadas em lote no índice (persistidas no próximo flush)
+                    if selected:
+                        await asyncio.to_thread(
+                            index_store.record_access,
+                            tenant_vector_path,
+                            [docs_by_entry[id(entry)] for entry in selected]
+                        )
+                    
+                    return selected
                     
             except Exception as e:
                 logger.error(f"Error searching FAISS index for tenant {tenant_id}: {e}")
         
         # 3. Fallback para busca em memória
-        if not self._memory_entries:
+        if not self._fallback_index:
             return []
         
-        # Filter by tenant and user
-        filtered_entries = [
-            entry for entry in self._memory_entries
-            if entry.tenant_id == tenant_id and entry.user_id == user_id
-        ]
+        # Similaridade de todas as memórias do usuário em um único produto matriz-vetor
+        entries_with_scores = self._fallback_index.search(
+            tenant_id, user_id, query_embedding, memory_types=memory_types, limit=limit * 3
+        )
         
-        # Further filter by memory types if specified
-        if memory_types:
-            filtered_entries = [
-                entry for entry in filtered_entries
-                if entry.type in memory_types
-            ]
+        # Re-ranquear e atualizar estatísticas de acesso (as entradas em memória são atualizadas no lugar)
+        selected = self._rerank_memories(entries_with_scores, limit)
+        self._mark_accessed(selected)
         
-        # Calculate similarity scores
-        entries_with_scores = []
-        for entry in filtered_entries:
-            if entry.embedding:
-                similarity = self._calculate_similarity(query_embedding, entry.embedding)
-                entries_with_scores.append((entry, similarity))
+        return selected
+    
+    @staticmethod
+    def _document_to_entry(doc, embedding: Optional[List[float]] = None) -> MemoryEntry:
+        """Converte um Document do índice FAISS em MemoryEntry."""
+        try:
+            entry_metadata = json.loads(doc.metadata.get("metadata", "{}"))
+        except:
+            entry_metadata = {}
         
-        # Sort by similarity (highest first)
-        entries_with_scores.sort(key=lambda x: x[1], reverse=True)
+        doc_type = doc.metadata.get("type")
+        return MemoryEntry(
+            id=doc.metadata.get("id", str(uuid.uuid4())),
+            tenant_id=doc.metadata.get("tenant_id"),
+            user_id=doc.metadata.get("user_id"),
+            type=MemoryType(doc_type) if doc_type else MemoryType.FACT,
+            content=doc.page_content,
+            metadata=entry_metadata,
+            embedding=embedding,
+            importance=doc.metadata.get("importance", 0.5),
+            created_at=doc.metadata.get("created_at", time.time()),
+            last_accessed=doc.metadata.get("last_accessed", doc.metadata.get("created_at", time.time())),
+            access_count=doc.metadata.get("access_count", 0)
+        )
+    
+    def _rerank_memories(
+        self,
+        candidates: List[tuple],
+        limit: int
+    ) -> List[MemoryEntry]:
+        """
+        Re-ranqueia memórias candidatas combinando similaridade, importância,
+        recência (decaimento exponencial por dia desde o último acesso) e frequência de acesso.
+        Candidatos com similaridade abaixo de `relevance_threshold` são descartados.
         
-        # Update access tracking for retrieved memories
-        for entry, _ in entries_with_scores[:limit]:
-            entry.last_accessed = time.time()
-            entry.access_count += 1
+        Args:
+            candidates: Lista de (MemoryEntry, similaridade)
+            limit: Número máximo de memórias retornadas
+            
+        Returns:
+            Memórias selecionadas, da mais para a menos relevante
+        """
+        import numpy as np
+        
+        if not candidates:
+            return []
+        
+        entries = [entry for entry, _ in candidates]
+        similarity = np.array([score for _, score in candidates], dtype=np.float32)
+        importance = np.clip(np.array([entry.importance for entry in entries], dtype=np.float32), 0.0, 1.0)
+        age_days = np.maximum(
+            (time.time() - np.array([entry.last_accessed for entry in entries], dtype=np.float64)) / 86400.0, 0.0
+        )
+        access_count = np.array([entry.access_count for entry in entries], dtype=np.float32)
+        
+        recency = np.exp(-self.decay_rate * age_days)
+        scores = (
+            similarity
+            * (0.5 + 0.5 * importance)
+            * (0.5 + 0.5 * recency)
+            * (1.0 + 0.1 * np.log1p(access_count))
+        )
+        scores = np.where(similarity >= self.relevance_threshold, scores, -np.inf)
         
-        # Return top entries
-        return [entry for entry, _ in entries_with_scores[:limit]]
+        order = np.argsort(-scores)[:limit]
+        return [entries[i] for i in order if np.isfinite(scores[i])]
+    
+    @staticmethod
+    def _mark_accessed(entries: List[MemoryEntry]) -> None:
+        """Atualiza as estatísticas de acesso das memórias retornadas."""
+        now = time.time()
+        for entry in entries:
+            entry.last_accessed = now
+            entry.access_count += 1
     
     async def generate_conversation_summary(
         self, 
         conversation_id: str,
         tenant_id: str, 
         user_id: str,
-        messages: List[Dict[str, Any]]
+        messages: List[Dict[str, Any]],
+        previous_summary: Optional[Dict[str, Any]] = None,
+        max_input_chars: Optional[int] = None
     ) -> ConversationSummary:
         """
         Gera resumos hierárquicos de uma conversa.
         
+        Quando `previous_summary` é informado, o resumo é incremental: `messages`
+        deve conter apenas as mensagens novas desde o último resumo, e o LLM
+        atualiza o resumo anterior em vez de reprocessar todo o histórico.
+        
         Args:
             conversation_id: The conversation ID
             tenant_id: The tenant ID
             user_id: The user ID
-            messages: List of messages in the conversation
+            messages: List of messages in the conversation (or new messages, if incremental)
+            previous_summary: Resumo anterior (brief, detailed, key_points, sentiment)
+            max_input_chars: Limite de caracteres das mensagens enviadas ao LLM (mantém as mais recentes)
             
         Returns:
             A ConversationSummary object
@@ -641,128 +786,33 @@ class MemoryService:
             return None
         
         # Convert messages to a single string
-        conversation_text = "\n".join([
-            f"{msg['role'].upper()}: {msg['content']}"
-            for msg in filtered_messages
-        ])
+        conversation_text = self._format_conversation_text(filtered_messages, max_input_chars)
+        
+        # Resumo incremental: enviar o resumo anterior + apenas as mensagens novas
+        if previous_summary:
+            previous_key_points = "\n".join(f"- {point}" for point in previous_summary.get("key_points") or [])
+            conversation_text = (
+                f"RESUMO DA CONVERSA ATÉ AQUI:\n{previous_summary.get('detailed') or previous_summary.get('brief', '')}\n"
+                f"PONTOS-CHAVE ANTERIORES:\n{previous_key_points}\n\n"
+                f"NOVAS MENSAGENS:\n{conversation_text}"
+            )
         
         try:
-            # Generate brief summary (1-2 sentences)
-            brief_summary_prompt = [
-                {"role": "system", "content": "Você é especialista em resumir conversas, diálogos ou parrágrafos em 1 ou 2 frases, capturando a essência."},
-                {"role": "user", "content": f"Resuma esta conversa em 1-2 frases:\n{conversation_text}"}
-            ]
-            brief_summary_response = await self.llm.generate_response(brief_summary_prompt)
-            logger.debug(f"MemoryService.generate_conversation_summary: brief_summary_response: {brief_summary_response}")
-            
-            
-            # Handle tuple response - extract the text part
-            if isinstance(brief_summary_response, tuple):
-                brief_summary = brief_summary_response[0] if brief_summary_response else ""
-            else:
-                brief_summary = brief_summary_response
-            
-            # Ensure it's a string and clean it
-            brief_summary = str(brief_summary).strip() if brief_summary else "Resumo não disponível"
-            
-            logger.debug(f"MemoryService.generate_conversation_summary: brief_summary: {brief_summary}")
-                        
-            # Generate detailed summary (paragraph)
-            detailed_summary_prompt = [
-                {"role": "system", "content": "Você é especialista em resumir conversas em um parágrafo detalhado, porém conciso e objetivo."},
-                {"role": "user", "content": f"Resuma esta conversa em um parágrafo detalhado:\n{conversation_text}"}
-            ]
-            detailed_summary_response = await self.llm.generate_response(detailed_summary_prompt)
-            
-            logger.debug(f"MemoryService.generate_conversation_summary: detailed_summary_response: {detailed_summary_response}")
-            
-            # Handle tuple response - extract the text part
-            if isinstance(detailed_summary_response, tuple):
-                detailed_summary = detailed_summary_response[0] if detailed_summary_response else ""
-                logger.debug(f"MemoryService.generate_conversation_summary: if detailed_summary[0]: {detailed_summary}")
-            else:
-                detailed_summary = detailed_summary_response
-                logger.debug(f"MemoryService.generate_conversation_summary: else detailed_summary: {detailed_summary}")
-            
-            # Ensure it's a string and clean it
-            detailed_summary = str(detailed_summary).strip() if detailed_summary else "Resumo detalhado não disponível"
-            logger.debug(f"MemoryService.generate_conversation_summary: final detailed_summary: {detailed_summary}")
-            
-            # Extract key points
-            key_points_prompt = [
-                {"role": "system", "content": "Você é um especialista em extrair pontos-chave de conversas ou de um texto. Extraia sempre no formato json array. Por exemplo: [\"ponto-chave 1\", \"ponto-chave 2\", \"ponto-chave 3\", \"ponto-chave 4\"]"},
-                {"role": "user", "content": f"Extraia 3 a 5 pontos-chave desta conversa como um JSON array:\n{conversation_text}"}
-            ]
-            key_points_response = await self.llm.generate_response(key_points_prompt)
-            logger.debug(f"MemoryService.generate_conversation_summary: key_points_response: {key_points_response}")
-            
-            # Handle tuple response - extract the text part
-            if isinstance(key_points_response, tuple):
-                key_points_json = key_points_response[0] if key_points_response else "[]"
-                logger.debug(f"MemoryService.generate_conversation_summary: if key_points_response[0]: {key_points_json}")
-            else:
-                key_points_json = key_points_response
-                logger.debug(f"MemoryService.generate_conversation_summary: else key_points_response: {key_points_json}")
-            
-            # Ensure it's a string
-            key_points_json = str(key_points_json).strip() if key_points_json else "[]"
-            logger.debug(f"MemoryService.generate_conversation_summary: final key_points_json: {key_points_json}")
-            
-            # Parse key points from JSON
-            try:
-                key_points = json.loads(key_points_json)
-                if not isinstance(key_points, list):
-                    key_points = ["Falha ao extrair pontos-chave devidamente."]
-            except:
-                key_points = ["Falha ao extrair pontos-chave"]
-            
-            # Extract entities (people, products, etc.)
-            entities_prompt = [
-                {"role": "system", "content": "Você é especialista em extrair entidades (pessoas, produtos, locais, datas, problemas) de conversas. Retorne como JSON."},
-                {"role": "user", "content": f"Extraia entidades desta conversa como um objeto JSON com categorias como chaves:\n{conversation_text}"}
-            ]
-            entities_response = await self.llm.generate_response(entities_prompt)
-            logger.debug(f"MemoryService.generate_conversation_summary: entities_response: {entities_response}")
+            summary_fields = None
             
-            # Handle tuple response - extract the text part
-            if isinstance(entities_response, tuple):
-                entities_json = entities_response[0] if entities_response else "{}"
-                logger.debug(f"MemoryService.generate_conversation_summary: if entities_response[0]: {entities_json}")
-            else:
-                entities_json = entities_response
-                logger.debug(f"MemoryService.generate_conversation_summary: else entities_response: {entities_json}")
-            
-            # Ensure it's a string
-            entities_json = str(entities_json).strip() if entities_json else "{}"
-            logger.debug(f"MemoryService.generate_conversation_summary: final entities_json: {entities_json}")
-            
-            # Parse entities from JSON
-            try:
-                entities = json.loads(entities_json)
-                if not isinstance(entities, dict):
-                    entities = {}
-            except:
-                entities = {}
-            
-            # Analyze sentiment
-            sentiment_prompt = [
-                {"role": "system", "content": "Analise o sentimento desta conversa. Responda apenas uma palavra: positivo, negativo, neutro ou misto."},
-                {"role": "user", "content": f"Determine o sentimento desta conversa:\n{conversation_text}"}
-            ]
-            sentiment_response = await self.llm.generate_response(sentiment_prompt)
-            logger.debug(f"MemoryService.generate_conversation_summary: sentiment_response: {sentiment_response}")
+            # Modo estruturado: uma única chamada retornando todos os campos em JSON
+            if settings.MEMORY_STRUCTURED_SUMMARY:
+                summary_fields = await self._generate_structured_summary(conversation_text)
             
-            # Handle tuple response - extract the text part
-            if isinstance(sentiment_response, tuple):
-                sentiment = sentiment_response[0] if sentiment_response else "neutro"
-                logger.debug(f"MemoryService.generate_conversation_summary: if sentiment_response[0]: {sentiment}")
-            else:
-                sentiment = sentiment_response
-                logger.debug(f"MemoryService.generate_conversation_summary: else sentiment_response: {sentiment}")
+            # Fallback: prompts individuais executados em paralelo
+            if summary_fields is None:
+                summary_fields = await self._generate_summary_fields_concurrently(conversation_text)
             
-            # Ensure it's a string and clean it
-            sentiment = str(sentiment).strip().lower() if sentiment else "neutro"
-            logger.debug(f"MemoryService.generate_conversation_summary: final sentiment: {sentiment}")
+            brief_summary = summary_fields["brief_summary"]
+            detailed_summary = summary_fields["detailed_summary"]
+            key_points = summary_fields["key_points"]
+            entities = summary_fields["entities"]
+            sentiment = summary_fields["sentiment"]
             
             # Create and return summary
             summary = ConversationSummary(
@@ -790,14 +840,17 @@ class MemoryService:
                 except Exception as e:
                     print(f"Error storing summary in vector database: {e}")
                     logging.error(f"Error storing summary in vector database: {e}")
-                    # Fall back to in-memory
             
-            # In-memory fallback
-            self._summaries.append(summary)
+            # Persistir no PostgreSQL (conversation_summaries), gravado em lote em segundo plano
+            try:
+                from app.services.archive_writer import get_archive_writer
+                get_archive_writer().enqueue_summary(summary)
+            except Exception as e:
+                logger.error(f"Erro ao enfileirar resumo da conversa {conversation_id}: {e}")
             
             # Extract memories from this conversation
-            await self._extract_memories_from_conversation(
-                conversation_id, tenant_id, user_id, 
+            await self._schedule_memory_extraction(
+                conversation_id, tenant_id, user_id,
                 filtered_messages, summary
             )
             
@@ -808,6 +861,10 @@ class MemoryService:
             import traceback
             traceback.print_exc()
             
+            # No modo incremental, manter o resumo anterior para a próxima tentativa
+            if previous_summary:
+                return None
+            
             # Return a minimal summary in case of error
             return ConversationSummary(
                 conversation_id=conversation_id,
@@ -821,10 +878,248 @@ class MemoryService:
                 created_at=time.time()
             )
     
+    async def _schedule_memory_extraction(
+        self,
+        conversation_id: str,
+        tenant_id: str,
+        user_id: str,
+        messages: List[Dict[str, Any]],
+        summary: ConversationSummary
+    ) -> None:
+        """
+        Enfileira a extração de memórias para o worker em lote (fora do horário de pico).
+        Sem a fila (desativada ou Redis indisponível), extrai imediatamente.
+        """
+        if settings.MEMORY_EXTRACTION_BATCH_ENABLED:
+            try:
+                from app.services.memory_extraction import get_memory_extraction_queue
+                await get_memory_extraction_queue().enqueue(
+                    conversation_id, tenant_id, user_id, messages, summary
+                )
+                return
+            except Exception as e:
+                logger.error(f"Erro ao enfileirar extração de memórias da conversa {conversation_id}, extraindo agora: {e}")
+        
+        await self._extract_memories_from_conversation(
+            conversation_id, tenant_id, user_id,
+            messages, summary
+        )
+    
+    @staticmethod
+    def fit_summary_batch(messages: List[Dict[str, Any]], max_chars: Optional[int] = None) -> int:
+        """
+        Número de mensagens, a partir da mais antiga, cujo texto cabe em `max_chars`
+        (mesma formatação de `_format_conversation_text`). Inclui sempre ao menos uma
+        mensagem para que o resumo incremental avance.
+        """
+        if not max_chars:
+            return len(messages)
+        
+        total = 0
+        for count, msg in enumerate(messages):
+            if msg.get("role") not in ["user", "assistant"]:
+                continue
+            
+            line_length = len(f"{msg['role'].upper()}: {msg['content']}") + 1
+            if total and total + line_length > max_chars:
+                return count
+            total += line_length
+        
+        return len(messages)
+    
+    @staticmethod
+    def _format_conversation_text(messages: List[Dict[str, Any]], max_chars: Optional[int] = None) -> str:
+        """
+        Converte mensagens em texto. Se `max_chars` for informado, mantém apenas as
+        mensagens mais recentes que cabem no limite.
+        """
+        lines = [f"{msg['role'].upper()}: {msg['content']}" for msg in messages]
+        if not max_chars:
+            return "\n".join(lines)
+        
+        kept = []
+        total = 0
+        for line in reversed(lines):
+            if kept and total + len(line) + 1 > max_chars:
+                break
+            kept.append(line[-max_chars:])
+            total += len(line) + 1
+        
+        if len(kept) < len(lines):
+            logger.debug(f"Texto da conversa truncado: {len(lines) - len(kept)} mensagens antigas omitidas")
+        
+        return "\n".join(reversed(kept))
+    
+    @staticmethod
+    def _response_text(response, default: str = "") -> str:
+        """Extrai o texto de uma resposta do LLM (que pode vir como tupla (texto, uso))."""
+        if isinstance(response, tuple):
+            response = response[0] if response else default
+        
+        return str(response).strip() if response else default
+    
+    @staticmethod
+    def _parse_json_response(text: str):
+        """Faz o parse de JSON retornado pelo LLM, removendo blocos ```json quando presentes."""
+        cleaned = text.strip()
+        if cleaned.startswith("```"):
+            cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
+            cleaned = cleaned.rsplit("```", 1)[0]
+        
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError:
+            # Tentar isolar o primeiro objeto/array JSON do texto
+            for open_char, close_char in (("{", "}"), ("[", "]")):
+                start = cleaned.find(open_char)
+                end = cleaned.rfind(close_char)
+                if start != -1 and end > start:
+                    try:
+                        return json.loads(cleaned[start:end + 1])
+                    except json.JSONDecodeError:
+                        continue
+            raise
+    
+    @staticmethod
+    def _validate_summary_fields(data: Any) -> Dict[str, Any]:
+        """Valida e normaliza os campos do resumo estruturado. Lança ValueError se inválido."""
+        if not isinstance(data, dict):
+            raise ValueError("Resposta estruturada não é um objeto JSON")
+        
+        brief_summary = data.get("brief_summary")
+        detailed_summary = data.get("detailed_summary")
+        if not isinstance(brief_summary, str) or not brief_summary.strip():
+            raise ValueError("Campo brief_summary ausente ou vazio")
+        if not isinstance(detailed_summary, str) or not detailed_summary.strip():
+            raise ValueError("Campo detailed_summary ausente ou vazio")
+        
+        key_points = data.get("key_points")
+        if not isinstance(key_points, list):
+            raise ValueError("Campo key_points deve ser uma lista")
+        
+        entities = data.get("entities") or {}
+        if not isinstance(entities, dict):
+            entities = {}
+        
+        sentiment = str(data.get("sentiment") or "neutro").strip().lower()
+        if sentiment not in ("positivo", "negativo", "neutro", "misto"):
+            sentiment = "neutro"
+        
+        return {
+            "brief_summary": brief_summary.strip(),
+            "detailed_summary": detailed_summary.strip(),
+            "key_points": [str(point) for point in key_points],
+            "entities": entities,
+            "sentiment": sentiment
+        }
+    
+    async def _generate_structured_summary(self, conversation_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Gera todos os campos do resumo em uma única chamada ao LLM (saída JSON).
+        Tenta novamente uma vez se o JSON for inválido. Retorna None em caso de falha.
+        """
+        prompt = [
+            {"role": "system", "content": (
+                "Você é especialista em resumir conversas. Se um resumo anterior for fornecido, atualize-o incorporando as novas mensagens. "
+                "Responda APENAS com um objeto JSON válido, sem texto adicional, "
+                "com exatamente estes campos:\n"
+                "{\"brief_summary\": \"resumo em 1-2 frases capturando a essência\", "
+                "\"detailed_summary\": \"um parágrafo detalhado, porém conciso e objetivo\", "
+                "\"key_points\": [\"3 a 5 pontos-chave\"], "
+                "\"entities\": {\"categoria\": [\"entidades (pessoas, produtos, locais, datas, problemas)\"]}, "
+                "\"sentiment\": \"positivo | negativo | neutro | misto\"}"
+            )},
+            {"role": "user", "content": f"Resuma esta conversa:\n{conversation_text}"}
+        ]
+        
+        # Texto da última resposta: None se a chamada ao LLM falhou antes de responder
+        response_text = None
+        for attempt in range(2):
+            try:
+                response = await self.llm.generate_response(prompt)
+                response_text = self._response_text(response)
+                logger.debug(f"MemoryService._generate_structured_summary: response (tentativa {attempt + 1}): {response_text}")
+                
+                return self._validate_summary_fields(self._parse_json_response(response_text))
+            except Exception as e:
+                logger.warning(f"Resumo estruturado inválido (tentativa {attempt + 1}/2): {e}")
+                if attempt == 0 and response_text is not None:
+                    # Reenviar pedindo correção do formato
+                    prompt = prompt + [
+                        {"role": "assistant", "content": response_text},
+                        {"role": "user", "content": f"A resposta anterior não é um JSON válido ({e}). Responda novamente apenas com o objeto JSON no formato solicitado."}
+                    ]
+        
+        return None
+    
+    async def _generate_summary_fields_concurrently(self, conversation_text: str) -> Dict[str, Any]:
+        """Gera os campos do resumo com prompts individuais executados em paralelo."""
+        brief_summary_prompt = [
+            {"role": "system", "content": "Você é especialista em resumir conversas, diálogos ou parrágrafos em 1 ou 2 frases, capturando a essência."},
+            {"role": "user", "content": f"Resuma esta conversa em 1-2 frases:\n{conversation_text}"}
+        ]
+        detailed_summary_prompt = [
+            {"role": "system", "content": "Você é especialista em resumir conversas em um parágrafo detalhado, porém conciso e objetivo."},
+            {"role": "user", "content": f"Resuma esta conversa em um parágrafo detalhado:\n{conversation_text}"}
+        ]
+        key_points_prompt = [
+            {"role": "system", "content": "Você é um especialista em extrair pontos-chave de conversas ou de um texto. Extraia sempre no formato json array. Por exemplo: [\"ponto-chave 1\", \"ponto-chave 2\", \"ponto-chave 3\", \"ponto-chave 4\"]"},
+            {"role": "user", "content": f"Extraia 3 a 5 pontos-chave desta conversa como um JSON array:\n{conversation_text}"}
+        ]
+        entities_prompt = [
+            {"role": "system", "content": "Você é especialista em extrair entidades (pessoas, produtos, locais, datas, problemas) de conversas. Retorne como JSON."},
+            {"role": "user", "content": f"Extraia entidades desta conversa como um objeto JSON com categorias como chaves:\n{conversation_text}"}
+        ]
+        sentiment_prompt = [
+            {"role": "system", "content": "Analise o sentimento desta conversa. Responda apenas uma palavra: positivo, negativo, neutro ou misto."},
+            {"role": "user", "content": f"Determine o sentimento desta conversa:\n{conversation_text}"}
+        ]
+        
+        responses = await asyncio.gather(
+            self.llm.generate_response(brief_summary_prompt),
+            self.llm.generate_response(detailed_summary_prompt),
+            self.llm.generate_response(key_points_prompt),
+            self.llm.generate_response(entities_prompt),
+            self.llm.generate_response(sentiment_prompt),
+            return_exceptions=True
+        )
+        brief_response, detailed_response, key_points_response, entities_response, sentiment_response = [
+            None if isinstance(response, Exception) else response for response in responses
+        ]
+        logger.debug(f"MemoryService._generate_summary_fields_concurrently: responses: {responses}")
+        
+        # Parse key points from JSON
+        try:
+            key_points = self._parse_json_response(self._response_text(key_points_response, "[]"))
+            if not isinstance(key_points, list):
+                key_points = ["Falha ao extrair pontos-chave devidamente."]
+        except:
+            key_points = ["Falha ao extrair pontos-chave"]
+        
+        # Parse entities from JSON
+        try:
+            entities = self._parse_json_response(self._response_text(entities_response, "{}"))
+            if not isinstance(entities, dict):
+                entities = {}
+        except:
+            entities = {}
+        
+        return {
+            "brief_summary": self._response_text(brief_response, "Resumo não disponível"),
+            "detailed_summary": self._response_text(detailed_response, "Resumo detalhado não disponível"),
+            "key_points": key_points,
+            "entities": entities,
+            "sentiment": self._response_text(sentiment_response, "neutro").lower()
+        }
+    
     async def get_user_profile(self, tenant_id: str, user_id: str) -> Dict[str, Any]:
         """
         Builds a user profile based on memories.
         
+        O perfil é montado em uma única passada pelas memórias do usuário, agrupadas
+        por tipo (sem busca vetorial), e mantido em cache no Redis até que uma nova
+        memória do usuário seja adicionada.
+        
         Args:
             tenant_id: The tenant ID
             user_id: The user ID
@@ -832,40 +1127,63 @@ class MemoryService:
         Returns:
             A dictionary with user profile information
         """
-        # Recall all user preferences
-        preferences = await self.recall_memories(
-            tenant_id=tenant_id,
-            user_id=user_id,
-            query="user preferences",
-            memory_types=[MemoryType.USER_PREFERENCE],
-            limit=20
-        )
+        cache_key = self._user_profile_cache_key(tenant_id, user_id)
+        try:
+            redis_client = await get_redis()
+            cached = await redis_client.get(cache_key)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            redis_client = None
+            logger.warning(f"Erro ao ler cache do perfil do usuário {user_id}: {e}")
         
-        # Recall past issues
-        issues = await self.recall_memories(
-            tenant_id=tenant_id,
-            user_id=user_id,
-            query="user issues problems complaints",
-            memory_types=[MemoryType.ISSUE],
-            limit=10
-        )
+        entries = await self._get_user_entries(tenant_id, user_id)
         
-        # Recall important facts about user
-        facts = await self.recall_memories(
-            tenant_id=tenant_id,
-            user_id=user_id,
-            query="important user facts details",
-            memory_types=[MemoryType.FACT],
-            limit=10
-        )
+        if entries is None:
+            # Serviço vetorial HTTP: sem listagem por tipo, usar buscas em paralelo
+            preferences, issues, facts = await asyncio.gather(
+                self.recall_memories(tenant_id, user_id, "user preferences", [MemoryType.USER_PREFERENCE], limit=20),
+                self.recall_memories(tenant_id, user_id, "user issues problems complaints", [MemoryType.ISSUE], limit=10),
+                self.recall_memories(tenant_id, user_id, "important user facts details", [MemoryType.FACT], limit=10)
+            )
+            conversations = []
+        else:
+            by_type: Dict[MemoryType, List[MemoryEntry]] = {memory_type: [] for memory_type in MemoryType}
+            for entry in entries:
+                by_type[entry.type].append(entry)
+            
+            # Mais importantes e mais recentes primeiro
+            for memory_type, typed_entries in by_type.items():
+                typed_entries.sort(key=lambda e: (e.importance, e.last_accessed), reverse=True)
+            
+            preferences = by_type[MemoryType.USER_PREFERENCE][:20]
+            issues = by_type[MemoryType.ISSUE][:10]
+            facts = by_type[MemoryType.FACT][:10]
+            conversations = sorted(by_type[MemoryType.CONVERSATION], key=lambda e: e.created_at, reverse=True)[:5]
         
-        # Get recent conversation summaries
-        recent_summaries = [
-            s for s in self._summaries
-            if s.tenant_id == tenant_id and s.user_id == user_id
-        ]
-        recent_summaries.sort(key=lambda x: x.created_at, reverse=True)
-        recent_summaries = recent_summaries[:5]
+        # Resumos recentes: tabela conversation_summaries (uma consulta indexada);
+        # memórias do tipo CONVERSATION se o banco estiver indisponível
+        try:
+            recent_conversations = [
+                {
+                    "id": record.conversation_id,
+                    "summary": record.brief_summary,
+                    "sentiment": record.sentiment,
+                    "timestamp": record.created_at.timestamp()
+                }
+                for record in await self.get_recent_summaries(tenant_id, user_id, limit=5)
+            ]
+        except Exception as e:
+            logger.warning(f"Erro ao consultar resumos do usuário {user_id}: {e}")
+            recent_conversations = [
+                {
+                    "id": c.metadata.get("conversation_id"),
+                    "summary": c.metadata.get("brief_summary", c.content),
+                    "sentiment": c.metadata.get("sentiment"),
+                    "timestamp": c.created_at
+                }
+                for c in conversations
+            ]
         
         # Build profile
         profile = {
@@ -873,19 +1191,88 @@ class MemoryService:
             "preferences": [p.content for p in preferences],
             "issues": [i.content for i in issues],
             "facts": [f.content for f in facts],
-            "recent_conversations": [
-                {
-                    "id": s.conversation_id,
-                    "summary": s.brief_summary,
-                    "sentiment": s.sentiment,
-                    "timestamp": s.created_at
-                }
-                for s in recent_summaries
-            ]
+            "recent_conversations": recent_conversations
         }
         
+        if redis_client:
+            try:
+                await redis_client.set(cache_key, json.dumps(profile), ex=settings.MEMORY_PROFILE_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Erro ao gravar cache do perfil do usuário {user_id}: {e}")
+        
         return profile
     
+    async def get_recent_summaries(self, tenant_id: str, user_id: str, limit: int = 5) -> list:
+        """
+        Resumos mais recentes das conversas de um usuário (tabela conversation_summaries).
+        
+        Returns:
+            Lista de ConversationSummaryRecord, do mais recente para o mais antigo
+        """
+        from sqlalchemy import select
+        from app.db.models.conversation_summary import ConversationSummaryRecord
+        from app.db.session import AsyncSessionLocal
+        
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ConversationSummaryRecord)
+                .where(
+                    ConversationSummaryRecord.tenant_id == str(tenant_id),
+                    ConversationSummaryRecord.user_id == user_id
+                )
+                .order_by(ConversationSummaryRecord.created_at.desc())
+                .limit(limit)
+            )
+            return list(result.scalars().all())
+    
+    async def get_stored_summary(self, conversation_id: str, tenant_id: str):
+        """Resumo persistido de uma conversa (ou None)."""
+        from sqlalchemy import select
+        from app.db.models.conversation_summary import ConversationSummaryRecord
+        from app.db.session import AsyncSessionLocal
+        
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ConversationSummaryRecord).where(
+                    ConversationSummaryRecord.conversation_id == conversation_id,
+                    ConversationSummaryRecord.tenant_id == str(tenant_id)
+                )
+            )
+            return result.scalar_one_or_none()
+    
+    async def _get_user_entries(self, tenant_id: str, user_id: str) -> Optional[List[MemoryEntry]]:
+        """
+        Lista todas as memórias de um usuário, sem busca vetorial.
+        Retorna None quando o armazenamento (serviço HTTP) não permite listagem.
+        """
+        if self.use_local_storage and self.vector_db_path:
+            try:
+                faiss_index = await self._init_faiss_index(tenant_id)
+                if faiss_index:
+                    tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{tenant_id}")
+                    docs = await asyncio.to_thread(
+                        get_memory_index_store().user_documents, tenant_vector_path, user_id
+                    )
+                    return [self._document_to_entry(doc) for doc in docs]
+            except Exception as e:
+                logger.error(f"Error listing FAISS memories for user {user_id}: {e}")
+        elif self.vector_db_url:
+            return None
+        
+        return self._fallback_index.user_entries(tenant_id, user_id)
+    
+    @staticmethod
+    def _user_profile_cache_key(tenant_id: str, user_id: str) -> str:
+        return f"memory:user_profile:{tenant_id}:{user_id}"
+    
+    async def _invalidate_user_profile(self, tenant_id: str, user_id: str) -> None:
+        """Remove o perfil do usuário do cache (nova memória adicionada)."""
+        try:
+            redis_client = await get_redis()
+            await redis_client.delete(self._user_profile_cache_key(tenant_id, user_id))
+        except Exception as e:
+            logger.warning(f"Erro ao invalidar cache do perfil do usuário {user_id}: {e}")
+    
     # async def _extract_memories_from_conversation(
     #     self, 
     #     conversation_id: str,
@@ -1039,6 +1426,9 @@ class MemoryService:
             for msg in messages
         ])
         
+        # Memórias extraídas, gravadas juntas no final (embeddings em lote)
+        extracted_memories = []
+        
         try:
             # Extract user preferences
             preferences_prompt = [
@@ -1111,7 +1501,7 @@ class MemoryService:
                             "valor": pref["valor"]
                         }
                     )
-                    await self.add_memory(memory)
+                    extracted_memories.append(memory)
             except json.JSONDecodeError as e:
                 logging.warning(f"Erro ao parsear preferências JSON: {e}")
             except Exception as e:
@@ -1188,7 +1578,7 @@ class MemoryService:
                             "detalhes": issue["detalhes"]
                         }
                     )
-                    await self.add_memory(memory)
+                    extracted_memories.append(memory)
 
             except json.JSONDecodeError as e:
                 logger.error(f"Falha ao decodificar JSON de issues: {e}\nConteúdo: {issues_json}")
@@ -1267,7 +1657,7 @@ class MemoryService:
                             "detalhes": fact["detalhes"]
                         }
                     )
-                    await self.add_memory(memory)
+                    extracted_memories.append(memory)
 
             except json.JSONDecodeError as e:
                 logging.warning(f"Erro ao decodificar JSON de fatos: {e}")
@@ -1290,7 +1680,8 @@ class MemoryService:
                     "entities": summary.entities
                 }
             )
-            await self.add_memory(summary_memory)
+            extracted_memories.append(summary_memory)
+            await self.add_memories(extracted_memories)
             logger.debug(f"MemoryService._extract_memories_from_conversation: [DEBUG] Memória de resumo da conversa {conversation_id} armazenadas. ID: {summary_memory_id}. \nbrief_summary: {summary.brief_summary}\nkey_points: {summary.key_points}\nsentiment: {summary.sentiment}\nentities: {summary.entities}")
             
             logging.info(f"Memórias extraídas e armazenadas para conversa {conversation_id}")
@@ -1313,7 +1704,14 @@ class MemoryService:
         # In a real implementation, this would call an embedding model
         # For now, we'll use a simple placeholder
         
-        return await self.llm.get_embeddings(text)
+        # Agrupado com os pedidos concorrentes de outras requisições (micro-batching)
+        embedding = await get_embedding(self.llm, text)
+        
+        # Manter o registro de dimensões alinhado com o que o modelo realmente retorna
+        if embedding and self.vector_db_path:
+            get_embedding_registry(self.vector_db_path).set(self.llm, len(embedding))
+        
+        return embedding
         
         # # recuperando a chave API da OpenAI para uso no embedding -- {self.llm.api_key}
         # try:
@@ -1392,18 +1790,99 @@ class MemoryService:
             except Exception as e:
                 print(f"Error cleaning memories from vector database: {e}")
         
+        removed = 0
+        
+        # Índices FAISS locais: tombstones + compactação
+        if self.use_local_storage and self.vector_db_path:
+            report = await self.compact_memory_indices(tenant_id, days_threshold)
+            removed += sum(item["expired"] for item in report.values())
+        
         # In-memory fallback
         if tenant_id:
-            old_count = len(self._memory_entries)
-            self._memory_entries = [
-                entry for entry in self._memory_entries
-                if not (entry.tenant_id == tenant_id and entry.last_accessed < timestamp_threshold)
-            ]
-            return old_count - len(self._memory_entries)
+            removed += self._fallback_index.remove_where(
+                lambda entry: entry.tenant_id == tenant_id and entry.last_accessed < timestamp_threshold
+            )
         else:
-            old_count = len(self._memory_entries)
-            self._memory_entries = [
-                entry for entry in self._memory_entries
-                if entry.last_accessed >= timestamp_threshold
+            removed += self._fallback_index.remove_where(
+                lambda entry: entry.last_accessed < timestamp_threshold
+            )
+        
+        return removed
+    
+    async def compact_memory_indices(
+        self,
+        tenant_id: Optional[str] = None,
+        days_threshold: int = 90,
+        min_tombstone_ratio: Optional[float] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Manutenção dos índices FAISS locais de memória.
+        
+        Marca como tombstone as memórias sem acesso há mais de `days_threshold` dias e
+        reconstrói o índice sem elas quando a proporção de tombstones atinge
+        `min_tombstone_ratio`, trocando os arquivos atomicamente. Não faz chamadas de embedding.
+        
+        Args:
+            tenant_id: Tenant a processar (todos os índices locais se omitido)
+            days_threshold: Idade (dias sem acesso) para expirar uma memória
+            min_tombstone_ratio: Proporção mínima de tombstones para compactar
+                (padrão: settings.MEMORY_COMPACTION_MIN_TOMBSTONE_RATIO)
+            
+        Returns:
+            {tenant_id: {"expired": memórias expiradas, "reclaimed": vetores removidos do índice}}
+        """
+        if min_tombstone_ratio is None:
+            min_tombstone_ratio = settings.MEMORY_COMPACTION_MIN_TOMBSTONE_RATIO
+        
+        timestamp_threshold = time.time() - (days_threshold * 24 * 60 * 60)
+        index_store = get_memory_index_store()
+        
+        if tenant_id:
+            tenant_ids = [str(tenant_id)]
+        elif os.path.isdir(self.vector_db_path):
+            tenant_ids = [
+                name[len("tenant_"):] for name in os.listdir(self.vector_db_path)
+                if name.startswith("tenant_") and os.path.isdir(os.path.join(self.vector_db_path, name))
             ]
-            return old_count - len(self._memory_entries)
\ No newline at end of file
+        else:
+            tenant_ids = []
+        
+        report = {}
+        for tid in tenant_ids:
+            tenant_vector_path = os.path.join(self.vector_db_path, f"tenant_{tid}")
+            try:
+                loaded_for_maintenance = not index_store.is_loaded(tenant_vector_path)
+                if loaded_for_maintenance:
+                    index_dir = resolve_index_dir(tenant_vector_path)
+                    if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+                        continue
+                    
+                    # Carregar sem passar pelo LLM: a manutenção não gera embeddings
+                    from langchain_community.vectorstores import FAISS
+                    faiss_index = await asyncio.to_thread(
+                        FAISS.load_local,
+                        index_dir,
+                        PrecomputedEmbeddings(),
+                        "index",
+                        allow_dangerous_deserialization=True
+                    )
+                    await asyncio.to_thread(
+                        index_store.register, tenant_vector_path, faiss_index, self._create_embedding_adapter()
+                    )
+                
+                expired = await asyncio.to_thread(index_store.expire, tenant_vector_path, timestamp_threshold)
+                reclaimed = await asyncio.to_thread(index_store.compact, tenant_vector_path, min_tombstone_ratio)
+                if expired and not reclaimed:
+                    # Tombstones abaixo do limiar de compactação: persistir as marcações
+                    await asyncio.to_thread(index_store.flush, tenant_vector_path)
+                
+                if loaded_for_maintenance:
+                    # Não manter em memória índices de tenants sem uso (só carregados para a manutenção)
+                    await asyncio.to_thread(index_store.discard, tenant_vector_path)
+                
+                report[tid] = {"expired": expired, "reclaimed": reclaimed}
+                logger.info(f"Manutenção de memórias do tenant {tid}: {expired} expiradas, {reclaimed} vetores removidos do índice")
+            except Exception as e:
+                logger.error(f"Erro na manutenção do índice de memórias do tenant {tid}: {e}")
+        
+        return report
\ No newline at end of file
@@ -0,0 +1,315 @@
+# app/services/memory_extraction.py
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.memory_extraction")
+
+QUEUE_KEY = "memory:extraction:queue"
+SUMMARIES_KEY = "memory:extraction:summaries"
+MESSAGES_KEY = "memory:extraction:messages:{conversation_id}"
+CLAIM_KEY = "memory:extraction:claim:{conversation_id}"
+ATTEMPTS_KEY = "memory:extraction:attempts"
+FAILED_KEY = "memory:extraction:failed"
+
+# Enfileiramento: a conversa só entra na fila se não estiver no dead letter
+# KEYS: mensagens, resumos, fila, dead letter | ARGV: conversa, job, score, mensagens...
+ENQUEUE_SCRIPT = """
+if #ARGV > 3 then
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, 4))
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+if not redis.call('ZSCORE', KEYS[4], ARGV[1]) then
+    redis.call('ZADD', KEYS[3], 'NX', ARGV[3], ARGV[1])
+end
+"""
+
+# Checkpoint atômico: um enqueue concorrente (rpush + hset + zadd) não pode
+# acontecer entre a verificação das mensagens restantes e a remoção da conversa
+# KEYS: mensagens, resumos, fila, tentativas | ARGV: conversa, processadas, score
+FINISH_SCRIPT = """
+if tonumber(ARGV[2]) > 0 then
+    redis.call('LTRIM', KEYS[1], ARGV[2], -1)
+end
+redis.call('HDEL', KEYS[4], ARGV[1])
+if redis.call('LLEN', KEYS[1]) > 0 then
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+    return 1
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+return 0
+"""
+
+# Falha na extração: volta para o fim da fila ou, após `max_attempts`, vai para o dead letter
+# KEYS: fila, tentativas, dead letter | ARGV: conversa, score, max_attempts
+FAIL_SCRIPT = """
+local attempts = redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+if attempts >= tonumber(ARGV[3]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[1])
+end
+return attempts
+"""
+
+
+def parse_offpeak_window(window: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Converte a janela de baixa demanda no formato "HH-HH" (ex.: "22-6") em (início, fim).
+    Retorna None (sem restrição de horário) se a janela estiver vazia ou inválida.
+    """
+    if not window:
+        return None
+    
+    try:
+        start, end = (int(part) % 24 for part in window.split("-", 1))
+        return start, end
+    except ValueError:
+        logger.warning(f"Janela de extração inválida '{window}', processando a qualquer hora")
+        return None
+
+
+class MemoryExtractionQueue:
+    """
+    Fila de extração de memórias processada fora do fluxo de mensagens.
+    
+    A geração de resumo apenas enfileira as mensagens novas da conversa; a extração
+    (preferências, problemas, fatos) é feita depois por um worker, com concorrência
+    limitada e, opcionalmente, só na janela de baixa demanda, para não disputar o
+    rate limit do provedor com as respostas ao vivo.
+    
+    Estado no Redis:
+    - `memory:extraction:queue`: sorted set com uma entrada por conversa (deduplicação)
+    - `memory:extraction:messages:{id}`: lista de mensagens ainda não processadas
+    - `memory:extraction:summaries`: último resumo de cada conversa pendente
+    - `memory:extraction:attempts`: falhas consecutivas de cada conversa
+    - `memory:extraction:failed`: dead letter (sorted set) das conversas que falharam
+      `max_attempts` vezes; suas mensagens continuam guardadas até `requeue_failed`
+    
+    As mensagens só saem da lista depois de processadas (checkpoint), e cada conversa
+    é reservada com um claim com TTL: se o worker cair, ela volta a ser processada.
+    """
+    
+    def __init__(
+        self,
+        concurrency: int = 2,
+        batch_size: int = 20,
+        offpeak_window: Optional[str] = None,
+        claim_ttl: int = 900,
+        max_attempts: int = 5
+    ):
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.offpeak_window = parse_offpeak_window(offpeak_window)
+        self.claim_ttl = claim_ttl
+        self.max_attempts = max(1, max_attempts)
+    
+    def is_offpeak(self, now: Optional[datetime] = None) -> bool:
+        """Indica se o horário atual está dentro da janela de processamento."""
+        if self.offpeak_window is None:
+            return True
+        
+        hour = (now or datetime.now()).hour
+        start, end = self.offpeak_window
+        if start <= end:
+            return start <= hour < end
+        # Janela que atravessa a meia-noite (ex.: 22-6)
+        return hour >= start or hour < end
+    
+    async def enqueue(
+        self,
+        conversation_id: str,
+        tenant_id: str,
+        user_id: str,
+        messages: List[Dict[str, Any]],
+        summary
+    ) -> None:
+        """
+        Enfileira as mensagens novas de uma conversa para extração de memórias.
+        
+        Chamadas repetidas para a mesma conversa acumulam as mensagens e substituem
+        o resumo, de modo que a conversa é processada uma única vez. Conversas no
+        dead letter só acumulam as mensagens: voltam à fila com `requeue_failed`.
+        """
+        redis_client = await get_redis()
+        job = {
+            "tenant_id": str(tenant_id),
+            "user_id": user_id,
+            "summary": summary.dict() if summary else None
+        }
+        
+        # NX: mantém a posição original da conversa na fila
+        await redis_client.eval(
+            ENQUEUE_SCRIPT,
+            4,
+            MESSAGES_KEY.format(conversation_id=conversation_id), SUMMARIES_KEY, QUEUE_KEY, FAILED_KEY,
+            conversation_id,
+            json.dumps(job, default=str),
+            time.time(),
+            *[json.dumps(message, default=str) for message in messages]
+        )
+    
+    async def pending_count(self) -> int:
+        """Número de conversas aguardando extração."""
+        redis_client = await get_redis()
+        return await redis_client.zcard(QUEUE_KEY)
+    
+    async def failed_count(self) -> int:
+        """Número de conversas no dead letter."""
+        redis_client = await get_redis()
+        return await redis_client.zcard(FAILED_KEY)
+    
+    async def requeue_failed(self) -> int:
+        """Devolve à fila as conversas do dead letter (com o contador de falhas zerado)."""
+        redis_client = await get_redis()
+        conversation_ids = await redis_client.zrange(FAILED_KEY, 0, -1)
+        if not conversation_ids:
+            return 0
+        
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zrem(FAILED_KEY, *conversation_ids)
+        pipe.zadd(QUEUE_KEY, {cid: time.time() for cid in conversation_ids}, nx=True)
+        await pipe.execute()
+        
+        logger.info(f"Extração de memórias: {len(conversation_ids)} conversas devolvidas à fila")
+        return len(conversation_ids)
+    
+    async def run_once(self, force: bool = False) -> int:
+        """
+        Processa um lote de conversas da fila.
+        
+        Args:
+            force: Ignora a janela de baixa demanda
+        
+        Returns:
+            Número de conversas processadas
+        """
+        if not force and not self.is_offpeak():
+            return 0
+        
+        redis_client = await get_redis()
+        conversation_ids = [
+            cid.decode() if isinstance(cid, bytes) else cid
+            for cid in await redis_client.zrange(QUEUE_KEY, 0, self.batch_size - 1)
+        ]
+        if not conversation_ids:
+            return 0
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def process(conversation_id: str) -> bool:
+            async with semaphore:
+                return await self._process_conversation(redis_client, conversation_id)
+        
+        results = await asyncio.gather(*(process(cid) for cid in conversation_ids))
+        processed = sum(1 for result in results if result)
+        logger.info(f"Extração de memórias: {processed}/{len(conversation_ids)} conversas processadas")
+        return processed
+    
+    async def drain(self, force: bool = False) -> int:
+        """Processa a fila até esvaziá-la (ou até sair da janela de baixa demanda)."""
+        total = 0
+        while True:
+            processed = await self.run_once(force=force)
+            if not processed:
+                return total
+            total += processed
+    
+    async def _process_conversation(self, redis_client, conversation_id: str) -> bool:
+        """Extrai as memórias de uma conversa e remove da fila o que foi processado."""
+        claim_key = CLAIM_KEY.format(conversation_id=conversation_id)
+        # Outro worker já está processando esta conversa
+        if not await redis_client.set(claim_key, "1", nx=True, ex=self.claim_ttl):
+            return False
+        
+        messages_key = MESSAGES_KEY.format(conversation_id=conversation_id)
+        try:
+            raw_job = await redis_client.hget(SUMMARIES_KEY, conversation_id)
+            raw_messages = await redis_client.lrange(messages_key, 0, -1)
+            
+            if raw_job is None:
+                await self._finish(redis_client, conversation_id, messages_key, len(raw_messages))
+                return False
+            
+            job = json.loads(raw_job)
+            messages = [json.loads(message) for message in raw_messages]
+            
+            if messages:
+                await self._extract(conversation_id, job, messages)
+            
+            # Checkpoint: descarta apenas as mensagens processadas
+            await self._finish(redis_client, conversation_id, messages_key, len(raw_messages))
+            return True
+        except Exception as e:
+            logger.error(f"Erro na extração de memórias da conversa {conversation_id}: {e}")
+            # Vai para o fim da fila para não bloquear as demais conversas (ou para o dead letter)
+            attempts = await redis_client.eval(
+                FAIL_SCRIPT, 3, QUEUE_KEY, ATTEMPTS_KEY, FAILED_KEY,
+                conversation_id, time.time(), self.max_attempts
+            )
+            if int(attempts) >= self.max_attempts:
+                logger.error(f"Conversa {conversation_id} movida para o dead letter após {attempts} falhas de extração")
+            return False
+        finally:
+            await redis_client.delete(claim_key)
+    
+    async def _finish(self, redis_client, conversation_id: str, messages_key: str, processed: int) -> None:
+        # Mensagens enfileiradas durante o processamento: a conversa volta para o fim da fila
+        await redis_client.eval(
+            FINISH_SCRIPT, 4, messages_key, SUMMARIES_KEY, QUEUE_KEY, ATTEMPTS_KEY,
+            conversation_id, processed, time.time()
+        )
+    
+    async def _extract(self, conversation_id: str, job: Dict[str, Any], messages: List[Dict[str, Any]]) -> None:
+        from app.db.session import AsyncSessionLocal
+        from app.services.config import load_system_config
+        from app.services.llm.factory import LLMServiceFactory
+        from app.services.memory import ConversationSummary, MemoryService
+        
+        tenant_id = job["tenant_id"]
+        async with AsyncSessionLocal() as db:
+            llm_service = await LLMServiceFactory.create_service(db, tenant_id=tenant_id)
+        
+        memory_config = load_system_config().apply_tenant_overrides(tenant_id).memory
+        memory_service = MemoryService(
+            llm_service,
+            vector_db_url=memory_config.vector_db_url,
+            vector_db_path=memory_config.memory_db_path or settings.MEMORY_DB_PATH,
+            use_local_storage=memory_config.use_local_storage,
+            decay_rate=memory_config.memory_decay_rate,
+            relevance_threshold=memory_config.memory_relevance_threshold,
+            dedup_threshold=memory_config.dedup_similarity_threshold
+        )
+        
+        summary = ConversationSummary(**job["summary"]) if job.get("summary") else None
+        await memory_service._extract_memories_from_conversation(
+            conversation_id, tenant_id, job["user_id"], messages, summary
+        )
+
+
+# Singleton da fila
+_extraction_queue: Optional[MemoryExtractionQueue] = None
+
+def get_memory_extraction_queue() -> MemoryExtractionQueue:
+    """Obtém a instância global da fila de extração de memórias."""
+    global _extraction_queue
+    
+    if _extraction_queue is None:
+        _extraction_queue = MemoryExtractionQueue(
+            concurrency=settings.MEMORY_EXTRACTION_CONCURRENCY,
+            batch_size=settings.MEMORY_EXTRACTION_BATCH_SIZE,
+            offpeak_window=settings.MEMORY_EXTRACTION_OFFPEAK_HOURS,
+            max_attempts=settings.MEMORY_EXTRACTION_MAX_ATTEMPTS
+        )
+    
+    return _extraction_queue
@@ -0,0 +1,318 @@
+# app/services/memory_fallback.py
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.memory_index_store import merge_importance
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.memory_fallback")
+
+
+class _UserPartition:
+    """Memórias de um usuário com os embeddings em uma matriz float32 contígua."""
+    
+    def __init__(self, dimensions: int, initial_capacity: int = 64):
+        self.dimensions = dimensions
+        self.entries: List = []
+        self.matrix = np.zeros((initial_capacity, dimensions), dtype=np.float32)
+        self.norms = np.zeros(initial_capacity, dtype=np.float32)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.norms.nbytes
+    
+    def append(self, entry, vector: np.ndarray) -> None:
+        size = len(self.entries)
+        if size == self.matrix.shape[0]:
+            # Crescimento geométrico para manter o custo amortizado O(1) por inserção
+            self.matrix = np.resize(self.matrix, (size * 2, self.dimensions))
+            self.norms = np.resize(self.norms, size * 2)
+        
+        self.matrix[size] = vector
+        self.norms[size] = np.linalg.norm(vector)
+        self.entries.append(entry)
+    
+    def remove_at(self, position: int):
+        """Remove a memória na posição informada (troca com a última). Retorna a entrada removida."""
+        last = len(self.entries) - 1
+        removed = self.entries[position]
+        if position != last:
+            self.matrix[position] = self.matrix[last]
+            self.norms[position] = self.norms[last]
+            self.entries[position] = self.entries[last]
+        self.entries.pop()
+        return removed
+    
+    def least_recently_used(self) -> int:
+        """Posição da memória acessada há mais tempo."""
+        return min(range(len(self.entries)), key=lambda i: self.entries[i].last_accessed)
+    
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Similaridade de cosseno de todas as memórias com a consulta (um produto matriz-vetor)."""
+        size = len(self.entries)
+        query_norm = np.linalg.norm(query)
+        if not size or query_norm == 0:
+            return np.zeros(size, dtype=np.float32)
+        
+        denominators = self.norms[:size] * query_norm
+        dots = self.matrix[:size] @ query
+        return np.divide(dots, denominators, out=np.zeros(size, dtype=np.float32), where=denominators > 0)
+
+
+class FallbackMemoryIndex:
+    """
+    Índice em memória usado quando nem o serviço vetorial nem o FAISS estão disponíveis.
+    
+    As memórias são particionadas por (tenant, usuário) e a busca pontua todas as
+    entradas da partição com um único produto matriz-vetor, selecionando o top-k
+    com `argpartition`. Os embeddings ficam apenas na matriz float32 da partição.
+    
+    O índice é limitado por cotas por usuário, por tenant e no total; ao exceder uma
+    cota, a memória acessada há mais tempo (LRU) é descartada.
+    """
+    
+    def __init__(
+        self,
+        max_entries_per_user: Optional[int] = None,
+        max_entries_per_tenant: Optional[int] = None,
+        max_entries_total: Optional[int] = None
+    ):
+        self.max_entries_per_user = max_entries_per_user
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.max_entries_total = max_entries_total
+        # Partições em ordem de uso (a usada há mais tempo primeiro)
+        self._partitions: "OrderedDict[Tuple[str, str], _UserPartition]" = OrderedDict()
+        self._tenant_counts: Dict[str, int] = {}
+        self._size = 0
+        self._metrics = {
+            "added": 0,
+            "searches": 0,
+            "merged_duplicates": 0,
+            "evicted_user_quota": 0,
+            "evicted_tenant_quota": 0,
+            "evicted_total_quota": 0
+        }
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __bool__(self) -> bool:
+        return self._size > 0
+    
+    def entries(self) -> Iterator:
+        """Itera sobre todas as memórias armazenadas."""
+        for partition in self._partitions.values():
+            yield from partition.entries
+    
+    def user_entries(self, tenant_id: str, user_id: str) -> List:
+        """Todas as memórias de um usuário."""
+        partition = self._partitions.get((tenant_id, user_id))
+        return list(partition.entries) if partition else []
+    
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de uso do fallback (entradas, memória ocupada e descartes por cota)."""
+        return {
+            "entries": self._size,
+            "partitions": len(self._partitions),
+            "tenants": len(self._tenant_counts),
+            "bytes": sum(partition.nbytes for partition in self._partitions.values()),
+            "limits": {
+                "per_user": self.max_entries_per_user,
+                "per_tenant": self.max_entries_per_tenant,
+                "total": self.max_entries_total
+            },
+            **self._metrics
+        }
+    
+    def add(self, entry) -> None:
+        """Adiciona uma memória (entradas sem embedding não são armazenadas para busca)."""
+        if not entry.embedding:
+            logger.debug(f"Memória {entry.id} sem embedding ignorada no índice em memória")
+            return
+        
+        vector = np.asarray(entry.embedding, dtype=np.float32)
+        # O embedding fica só na matriz float32 (a lista de floats Python ocupa bem mais)
+        entry.embedding = None
+        
+        key = (entry.tenant_id, entry.user_id)
+        partition = self._partitions.get(key)
+        
+        if partition is not None and partition.dimensions != vector.shape[0]:
+            # Mudança de modelo de embedding: vetores antigos não são comparáveis
+            logger.warning(f"Dimensão de embedding alterada para {key}: {partition.dimensions} -> {vector.shape[0]}. Partição recriada.")
+            self._drop_partition(key)
+            partition = None
+        
+        if partition is None:
+            partition = self._partitions[key] = _UserPartition(vector.shape[0])
+        
+        partition.append(entry, vector)
+        self._partitions.move_to_end(key)
+        self._tenant_counts[entry.tenant_id] = self._tenant_counts.get(entry.tenant_id, 0) + 1
+        self._size += 1
+        self._metrics["added"] += 1
+        
+        self._enforce_quotas(key)
+    
+    def search(
+        self,
+        tenant_id: str,
+        user_id: str,
+        query_embedding: List[float],
+        memory_types: Optional[List] = None,
+        limit: int = 5
+    ) -> List[Tuple[object, float]]:
+        """
+        Retorna as `limit` memórias mais similares do usuário, da mais para a menos similar.
+        """
+        key = (tenant_id, user_id)
+        partition = self._partitions.get(key)
+        if not partition or limit <= 0:
+            return []
+        
+        self._metrics["searches"] += 1
+        self._partitions.move_to_end(key)
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != partition.dimensions:
+            return []
+        
+        scores = partition.scores(query)
+        
+        if memory_types:
+            allowed = np.fromiter(
+                (entry.type in memory_types for entry in partition.entries),
+                dtype=bool,
+                count=len(partition)
+            )
+            scores = np.where(allowed, scores, -np.inf)
+            candidates = int(allowed.sum())
+        else:
+            candidates = len(partition)
+        
+        k = min(limit, candidates)
+        if k == 0:
+            return []
+        
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        
+        return [(partition.entries[i], float(scores[i])) for i in top if np.isfinite(scores[i])][:k]
+    
+    def merge_duplicate(self, entry, threshold: float) -> Optional[object]:
+        """
+        Se o usuário já tem uma memória do mesmo tipo com similaridade >= `threshold`
+        com `entry`, atualiza essa memória no lugar (importância, access_count e
+        metadados) e a retorna. Caso contrário retorna None.
+        """
+        partition = self._partitions.get((entry.tenant_id, entry.user_id))
+        if not partition or not entry.embedding:
+            return None
+        
+        query = np.asarray(entry.embedding, dtype=np.float32)
+        if query.shape[0] != partition.dimensions:
+            return None
+        
+        scores = partition.scores(query)
+        same_type = np.fromiter(
+            (existing.type == entry.type for existing in partition.entries),
+            dtype=bool,
+            count=len(partition)
+        )
+        scores = np.where(same_type, scores, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        
+        existing = partition.entries[best]
+        existing.importance = merge_importance(existing.importance, entry.importance)
+        existing.access_count += 1
+        existing.last_accessed = time.time()
+        existing.metadata = {
+            **existing.metadata,
+            **entry.metadata,
+            "merged_count": existing.metadata.get("merged_count", 0) + 1
+        }
+        self._metrics["merged_duplicates"] += 1
+        return existing
+    
+    def remove_where(self, predicate: Callable[[object], bool]) -> int:
+        """Remove as memórias que satisfazem `predicate`. Retorna quantas foram removidas."""
+        removed = 0
+        for key, partition in list(self._partitions.items()):
+            positions = [i for i, entry in enumerate(partition.entries) if predicate(entry)]
+            # De trás para frente: remove_at move a última entrada para a posição removida
+            for position in reversed(positions):
+                self._remove(key, position)
+            removed += len(positions)
+        
+        return removed
+    
+    def _enforce_quotas(self, key: Tuple[str, str]) -> None:
+        """Descarta memórias LRU até que as cotas por usuário, tenant e total sejam respeitadas."""
+        tenant_id = key[0]
+        
+        while self.max_entries_per_user and key in self._partitions and len(self._partitions[key]) > self.max_entries_per_user:
+            self._remove(key, self._partitions[key].least_recently_used())
+            self._metrics["evicted_user_quota"] += 1
+        
+        while self.max_entries_per_tenant and self._tenant_counts.get(tenant_id, 0) > self.max_entries_per_tenant:
+            # Partição do tenant usada há mais tempo
+            victim = next(k for k in self._partitions if k[0] == tenant_id)
+            self._remove(victim, self._partitions[victim].least_recently_used())
+            self._metrics["evicted_tenant_quota"] += 1
+        
+        while self.max_entries_total and self._size > self.max_entries_total:
+            victim = next(iter(self._partitions))
+            self._remove(victim, self._partitions[victim].least_recently_used())
+            self._metrics["evicted_total_quota"] += 1
+    
+    def _remove(self, key: Tuple[str, str], position: int) -> None:
+        partition = self._partitions[key]
+        partition.remove_at(position)
+        self._size -= 1
+        self._tenant_counts[key[0]] -= 1
+        
+        if not partition.entries:
+            del self._partitions[key]
+        if not self._tenant_counts[key[0]]:
+            del self._tenant_counts[key[0]]
+    
+    def _drop_partition(self, key: Tuple[str, str]) -> None:
+        partition = self._partitions.pop(key, None)
+        if partition is None:
+            return
+        
+        self._size -= len(partition)
+        self._tenant_counts[key[0]] -= len(partition)
+        if not self._tenant_counts[key[0]]:
+            del self._tenant_counts[key[0]]
+
+
+# Índice compartilhado pelo processo (o MemoryService é criado a cada requisição)
+_fallback_index: Optional[FallbackMemoryIndex] = None
+
+def get_fallback_memory_index() -> FallbackMemoryIndex:
+    """Obtém o índice em memória global, limitado pelas cotas configuradas."""
+    global _fallback_index
+    
+    if _fallback_index is None:
+        _fallback_index = FallbackMemoryIndex(
+            max_entries_per_user=settings.MEMORY_FALLBACK_MAX_PER_USER,
+            max_entries_per_tenant=settings.MEMORY_FALLBACK_MAX_PER_TENANT,
+            max_entries_total=settings.MEMORY_FALLBACK_MAX_TOTAL
+        )
+    
+    return _fallback_index
+
+def get_fallback_memory_stats() -> Dict[str, Any]:
+    """Métricas do fallback em memória (para o health check)."""
+    return get_fallback_memory_index().stats()
@@ -0,0 +1,768 @@
+# app/services/memory_index_store.py
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from langchain.embeddings.base import Embeddings
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("app.services.memory_index_store")
+
+PENDING_LOG = "pending.log"
+FLUSHING_LOG = "pending.log.flushing"
+# Ponteiro para o snapshot atual do índice (snapshots/<versão>/index.faiss + index.pkl)
+CURRENT_POINTER = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+# Trava do processo dono do diretório de memórias (API ou comando de manutenção)
+OWNER_LOCK = ".owner.lock"
+
+
+def acquire_storage_lock(storage_path: str):
+    """
+    Trava exclusiva (flock) do diretório de memórias para o processo atual.
+    
+    O write-behind mantém índices e logs pendentes em memória, então apenas um
+    processo pode gravar nos diretórios `tenant_*`. A trava é liberada quando o
+    arquivo retornado é fechado ou o processo termina.
+    
+    Returns:
+        O arquivo da trava (mantê-lo aberto), ou None se outro processo a detém
+    """
+    import fcntl
+    
+    os.makedirs(storage_path, exist_ok=True)
+    lock_file = open(os.path.join(storage_path, OWNER_LOCK), "a+")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def resolve_index_dir(path: str) -> str:
+    """
+    Diretório com os arquivos do índice atual do tenant: o snapshot apontado por
+    CURRENT, ou o próprio diretório do tenant (layout antigo, sem snapshots).
+    """
+    try:
+        with open(os.path.join(path, CURRENT_POINTER), "r", encoding="utf-8") as pointer:
+            version = pointer.read().strip()
+    except FileNotFoundError:
+        return path
+    
+    snapshot_dir = os.path.join(path, SNAPSHOTS_DIR, version)
+    return snapshot_dir if version and os.path.isdir(snapshot_dir) else path
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """
+    Função de embedding dos índices compartilhados: os vetores são sempre calculados
+    antes (pelo serviço LLM da requisição) e passados explicitamente ao índice.
+    """
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError("Índice de memórias compartilhado: informe os embeddings já calculados")
+    
+    def embed_query(self, text: str) -> List[float]:
+        raise RuntimeError("Índice de memórias compartilhado: informe o embedding da consulta já calculado")
+
+
+def merge_importance(current: float, incoming: float, boost: float = 0.1) -> float:
+    """Importância de uma memória reforçada por uma duplicata: a maior das duas, mais um reforço."""
+    return min(1.0, max(current or 0.0, incoming or 0.0) + boost)
+
+
+class _TenantIndex:
+    """Índice FAISS de um tenant com o estado de escrita pendente."""
+    
+    def __init__(self, path: str, index):
+        self.path = path
+        self.index = index
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+        # Estatísticas de acesso alteradas desde o último flush (não vão para o log)
+        self.stats_dirty = False
+        # Posições no índice FAISS por usuário, para buscas restritas ao usuário
+        self.user_ids: Dict[str, List[int]] = {}
+        self.last_used = time.monotonic()
+        # Removido do cache: escritas devem recarregar o índice
+        self.evicted = False
+    
+    def document_at(self, position: int):
+        """Documento armazenado na posição `position` do índice FAISS (ou None)."""
+        docstore_id = self.index.index_to_docstore_id.get(position)
+        doc = self.index.docstore.search(docstore_id) if docstore_id else None
+        return None if doc is None or isinstance(doc, str) else doc
+    
+    def track_positions(self, start: int = 0) -> None:
+        """Atualiza o mapa usuário -> posições a partir da posição `start` do índice."""
+        if start == 0:
+            self.user_ids = {}
+        
+        for position in range(start, self.index.index.ntotal):
+            doc = self.document_at(position)
+            # Memórias expiradas (tombstones) não participam das buscas
+            if doc is None or doc.metadata.get("deleted"):
+                continue
+            user_id = doc.metadata.get("user_id")
+            if user_id:
+                self.user_ids.setdefault(user_id, []).append(position)
+
+
+class MemoryIndexStore:
+    """
+    Cache compartilhado dos índices FAISS de memória, com persistência write-behind.
+    
+    Cada documento novo é adicionado ao índice em memória e registrado em um log
+    append-only (`pending.log`) no diretório do tenant. O índice completo só é
+    regravado em disco quando o número de pendências atinge `flush_batch_size` ou
+    após `flush_interval` segundos, em um novo snapshot (`snapshots/<versão>/`) que
+    passa a valer com a troca atômica do ponteiro `CURRENT`.
+    Ao carregar um índice, as entradas do log ainda não persistidas são reaplicadas.
+    
+    Os índices são compartilhados entre requisições de serviços LLM diferentes, por
+    isso não guardam a função de embedding de nenhuma delas: os vetores são sempre
+    informados pelo chamador.
+    
+    No máximo `max_loaded` índices ficam carregados: ao registrar um novo, o usado
+    há mais tempo (LRU) é gravado e descartado, assim como, no flush periódico, os
+    índices sem uso há `idle_ttl` segundos.
+    
+    O write-behind só é correto com um único processo por diretório de memórias:
+    o índice em memória e o log pendente de um processo não são vistos pelos demais,
+    e o próximo flush de um sobrescreveria o snapshot do outro. A API e os comandos
+    de manutenção disputam o diretório com `acquire_storage_lock`.
+    """
+    
+    def __init__(
+        self,
+        flush_batch_size: int = 50,
+        flush_interval: float = 30.0,
+        max_loaded: Optional[int] = None,
+        idle_ttl: Optional[float] = None
+    ):
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval = flush_interval
+        self.max_loaded = max_loaded
+        self.idle_ttl = idle_ttl
+        # Índices em ordem de uso (o usado há mais tempo primeiro)
+        self._indices: "OrderedDict[str, _TenantIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _entry(self, path: str) -> Optional[_TenantIndex]:
+        """Índice carregado para o diretório, marcado como o usado mais recentemente."""
+        with self._lock:
+            entry = self._indices.get(path)
+            if entry is not None:
+                self._indices.move_to_end(path)
+                entry.last_used = time.monotonic()
+        return entry
+    
+    def get(self, path: str):
+        """Retorna o índice carregado para o diretório, ou None."""
+        entry = self._entry(path)
+        return entry.index if entry else None
+    
+    def is_loaded(self, path: str) -> bool:
+        """Se o índice do diretório está carregado (sem contar como uso para o LRU)."""
+        return path in self._indices
+    
+    def discard(self, path: str) -> bool:
+        """
+        Grava as pendências e remove o índice do cache (ex.: o modelo de embedding do
+        tenant mudou, ou o índice foi carregado só para manutenção). Bloqueante.
+        
+        Returns:
+            False se o índice tinha pendências e a gravação falhou (ele continua carregado)
+        """
+        entry = self._indices.get(path)
+        if entry is None:
+            return True
+        
+        with entry.lock:
+            if (entry.pending or entry.stats_dirty) and not self._flush(entry):
+                return False
+            
+            with self._lock:
+                if self._indices.get(path) is entry:
+                    del self._indices[path]
+            entry.evicted = True
+        
+        return True
+    
+    def evict(self) -> int:
+        """
+        Descarta os índices sem uso há mais de `idle_ttl` segundos e, acima de
+        `max_loaded`, os usados há mais tempo. Retorna quantos foram descartados.
+        """
+        now = time.monotonic()
+        with self._lock:
+            paths = list(self._indices.keys())
+            idle = [
+                path for path in paths
+                if self.idle_ttl and now - self._indices[path].last_used >= self.idle_ttl
+            ]
+            excess = len(paths) - len(idle) - (self.max_loaded or len(paths))
+            lru = [path for path in paths if path not in idle][:max(excess, 0)]
+        
+        evicted = 0
+        for path in idle + lru:
+            evicted += int(self.discard(path))
+        
+        if evicted:
+            logger.debug(f"{evicted} índices de memória descartados do cache ({len(self._indices)} carregados)")
+        return evicted
+    
+    def register(self, path: str, index, embeddings: Optional[Embeddings] = None) -> None:
+        """
+        Registra um índice recém-carregado/criado e reaplica o log pendente.
+        Bloqueante: chamar via asyncio.to_thread.
+        
+        Args:
+            path: Diretório do índice do tenant
+            index: Índice FAISS (LangChain)
+            embeddings: Usado só para reaplicar entradas antigas do log gravadas sem vetor
+        """
+        with self._lock:
+            if path in self._indices:
+                return
+            # O índice compartilhado não mantém o serviço LLM de quem o carregou
+            index.embedding_function = PrecomputedEmbeddings()
+            entry = _TenantIndex(path, index)
+            self._indices[path] = entry
+        
+        with entry.lock:
+            entry.track_positions()
+            recovered = self._recover(entry, embeddings)
+            if recovered:
+                logger.info(f"{recovered} memórias recuperadas do log pendente em {path}")
+                self._flush(entry)
+        
+        if self.max_loaded and len(self._indices) > self.max_loaded:
+            self.evict()
+    
+    def add_documents(self, path: str, docs: List[Any], embeddings: List[List[float]]) -> None:
+        """
+        Adiciona documentos ao índice em memória e ao log append-only.
+        Bloqueante (pode gravar o índice): chamar via asyncio.to_thread.
+        
+        Args:
+            path: Diretório do índice do tenant
+            docs: Documentos LangChain a adicionar
+            embeddings: Embeddings já calculados dos documentos
+        
+        Raises:
+            ValueError: Se os embeddings não tiverem a dimensão do índice
+        """
+        entry = self._entry(path)
+        if entry is None:
+            raise KeyError(f"Índice não registrado: {path}")
+        
+        with entry.lock:
+            if entry.evicted:
+                raise KeyError(f"Índice descartado do cache: {path}")
+            if len(embeddings) != len(docs) or any(len(embedding or []) != entry.index.index.d for embedding in embeddings):
+                raise ValueError(f"Embeddings incompatíveis com o índice em {path} ({entry.index.index.d}D)")
+            
+            start = entry.index.index.ntotal
+            entry.index.add_embeddings(
+                [(doc.page_content, embedding) for doc, embedding in zip(docs, embeddings)],
+                metadatas=[doc.metadata for doc in docs]
+            )
+            entry.track_positions(start)
+            
+            # Registrar no log antes de confirmar a escrita (custo O(1) por memória);
+            # o vetor vai junto para a recuperação não depender do provedor de embeddings
+            with open(os.path.join(path, PENDING_LOG), "a", encoding="utf-8") as log:
+                for doc, embedding in zip(docs, embeddings):
+                    record = {"page_content": doc.page_content, "metadata": doc.metadata, "embedding": [float(value) for value in embedding]}
+                    log.write(json.dumps(record) + "\n")
+                log.flush()
+                os.fsync(log.fileno())
+            
+            entry.pending += len(docs)
+            if self._should_flush(entry):
+                self._flush(entry)
+    
+    def search_user(self, path: str, user_id: str, query_embedding: List[float], k: int) -> List[Tuple[Any, float]]:
+        """
+        Busca por similaridade restrita às memórias de um usuário.
+        
+        Usa um IDSelector do FAISS com as posições do usuário, de modo que o custo e
+        a qualidade da busca não dependem das memórias dos demais usuários do tenant.
+        O embedding da consulta é calculado pelo chamador, fora do lock do índice.
+        Os candidatos são pontuados por similaridade de cosseno (a mesma escala do
+        fallback em memória), e não pela distância L2 do FAISS.
+        Bloqueante: chamar via asyncio.to_thread.
+        
+        Args:
+            path: Diretório do índice do tenant
+            user_id: ID do usuário
+            query_embedding: Embedding da consulta
+            k: Número máximo de resultados
+        
+        Returns:
+            Lista de (Document, similaridade de cosseno), da mais para a menos similar
+        """
+        import numpy as np
+        
+        entry = self._entry(path)
+        if entry is None:
+            raise KeyError(f"Índice não registrado: {path}")
+        
+        vector = np.array([query_embedding], dtype=np.float32)
+        with entry.lock:
+            if not entry.user_ids.get(user_id) or vector.shape[1] != entry.index.index.d:
+                return []
+            
+            positions = [position for position, _ in self._search_user_positions(entry, user_id, vector, k)]
+            similarities = self._cosine_similarities(entry, positions, vector[0])
+            results = [(entry.document_at(position), similarity) for position, similarity in zip(positions, similarities)]
+            return sorted(results, key=lambda result: result[1], reverse=True)
+    
+    def merge_duplicate(
+        self,
+        path: str,
+        user_id: str,
+        embedding: List[float],
+        memory_type: str,
+        threshold: float,
+        importance: float,
+        metadata: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Procura entre as memórias do usuário uma quase duplicata (mesmo tipo e similaridade
+        de cosseno >= `threshold`) e, se houver, a atualiza no lugar em vez de adicionar
+        um novo vetor: importância e access_count aumentam e os metadados são mesclados.
+        Bloqueante: chamar via asyncio.to_thread.
+        
+        Returns:
+            ID da memória existente atualizada, ou None se não houver duplicata
+        """
+        import numpy as np
+        
+        entry = self._entry(path)
+        if entry is None or not embedding:
+            return None
+        
+        with entry.lock:
+            # Sem memórias do usuário, ou embedding de outro modelo (dimensão diferente)
+            if not entry.user_ids.get(user_id) or len(embedding) != entry.index.index.d:
+                return None
+            
+            vector = np.array([embedding], dtype=np.float32)
+            if not np.linalg.norm(vector[0]):
+                return None
+            
+            positions = [position for position, _ in self._search_user_positions(entry, user_id, vector, 3)]
+            best_doc, best_similarity = None, threshold
+            for position, similarity in zip(positions, self._cosine_similarities(entry, positions, vector[0])):
+                doc = entry.document_at(position)
+                if doc.metadata.get("type") != memory_type:
+                    continue
+                
+                if similarity >= best_similarity:
+                    best_doc, best_similarity = doc, similarity
+            
+            if best_doc is None:
+                return None
+            
+            try:
+                merged_metadata = json.loads(best_doc.metadata.get("metadata", "{}"))
+            except (TypeError, json.JSONDecodeError):
+                merged_metadata = {}
+            merged_metadata.update(metadata or {})
+            merged_metadata["merged_count"] = merged_metadata.get("merged_count", 0) + 1
+            
+            best_doc.metadata["metadata"] = json.dumps(merged_metadata)
+            best_doc.metadata["importance"] = merge_importance(best_doc.metadata.get("importance", 0.5), importance)
+            best_doc.metadata["access_count"] = best_doc.metadata.get("access_count", 0) + 1
+            best_doc.metadata["last_accessed"] = time.time()
+            entry.stats_dirty = True
+            
+            return best_doc.metadata.get("id")
+    
+    @staticmethod
+    def _cosine_similarities(entry: _TenantIndex, positions: List[int], query) -> List[float]:
+        """Similaridade de cosseno entre `query` e os vetores armazenados nas posições informadas."""
+        import numpy as np
+        
+        query_norm = np.linalg.norm(query)
+        if not positions or query_norm == 0:
+            return [0.0] * len(positions)
+        
+        vectors = entry.index.index.reconstruct_batch(np.array(positions, dtype=np.int64))
+        denominators = np.linalg.norm(vectors, axis=1) * query_norm
+        dots = vectors @ query
+        return [float(dot / denominator) if denominator else 0.0 for dot, denominator in zip(dots, denominators)]
+    
+    @staticmethod
+    def _search_user_positions(entry: _TenantIndex, user_id: str, vector, k: int) -> List[Tuple[int, float]]:
+        """Busca `vector` entre as posições do usuário. Retorna (posição, distância) em ordem."""
+        import faiss
+        import numpy as np
+        
+        positions = entry.user_ids.get(user_id, [])
+        store = entry.index
+        if getattr(store, "_normalize_L2", False):
+            vector = vector.copy()
+            faiss.normalize_L2(vector)
+        
+        k = min(k, len(positions))
+        ids = np.array(positions, dtype=np.int64)
+        
+        try:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+            distances, indices = store.index.search(vector, k, params=params)
+            distances, indices = distances[0], indices[0]
+        except (AttributeError, TypeError, RuntimeError):
+            # Versões do FAISS sem SearchParameters: distância exata sobre os vetores do usuário
+            vectors = store.index.reconstruct_batch(ids)
+            all_distances = ((vectors - vector) ** 2).sum(axis=1)
+            order = np.argsort(all_distances)[:k]
+            distances, indices = all_distances[order], ids[order]
+        
+        return [
+            (int(position), float(distance))
+            for position, distance in zip(indices, distances)
+            if position >= 0 and entry.document_at(int(position)) is not None
+        ]
+    
+    def user_documents(self, path: str, user_id: str) -> List[Any]:
+        """Todos os documentos (não expirados) de um usuário, sem busca vetorial."""
+        entry = self._entry(path)
+        if entry is None:
+            raise KeyError(f"Índice não registrado: {path}")
+        
+        with entry.lock:
+            docs = [entry.document_at(position) for position in entry.user_ids.get(user_id, [])]
+            return [doc for doc in docs if doc is not None]
+    
+    def record_access(self, path: str, docs: List[Any]) -> None:
+        """
+        Atualiza em lote as estatísticas de acesso (access_count/last_accessed) dos
+        documentos retornados por uma busca. Gravadas em disco no próximo flush periódico.
+        """
+        entry = self._indices.get(path)
+        if entry is None or not docs:
+            return
+        
+        now = time.time()
+        with entry.lock:
+            for doc in docs:
+                doc.metadata["access_count"] = doc.metadata.get("access_count", 0) + 1
+                doc.metadata["last_accessed"] = now
+            entry.stats_dirty = True
+    
+    def expire(self, path: str, older_than: float) -> int:
+        """
+        Marca como tombstone as memórias sem acesso desde `older_than` (timestamp).
+        Elas deixam de aparecer nas buscas imediatamente e são removidas do índice
+        na próxima compactação.
+        
+        Returns:
+            Número de memórias marcadas
+        """
+        entry = self._indices.get(path)
+        if entry is None:
+            return 0
+        
+        expired = 0
+        with entry.lock:
+            for position in range(entry.index.index.ntotal):
+                doc = entry.document_at(position)
+                if doc is None or doc.metadata.get("deleted") or doc.metadata.get("init_doc"):
+                    continue
+                
+                last_accessed = doc.metadata.get("last_accessed", doc.metadata.get("created_at", time.time()))
+                if last_accessed < older_than:
+                    doc.metadata["deleted"] = True
+                    doc.metadata["deleted_at"] = time.time()
+                    expired += 1
+            
+            if expired:
+                entry.track_positions()
+                entry.stats_dirty = True
+        
+        return expired
+    
+    def compact(self, path: str, min_tombstone_ratio: float = 0.0) -> int:
+        """
+        Reconstrói o índice sem os tombstones e o substitui atomicamente.
+        
+        A reconstrução é feita fora do lock, a partir de um snapshot dos vetores;
+        memórias adicionadas durante a reconstrução são incorporadas na troca.
+        Bloqueante: chamar via asyncio.to_thread.
+        
+        Args:
+            path: Diretório do índice do tenant
+            min_tombstone_ratio: Proporção mínima de tombstones para compactar
+        
+        Returns:
+            Número de vetores removidos do índice
+        """
+        from langchain_community.vectorstores import FAISS
+        
+        entry = self._indices.get(path)
+        if entry is None:
+            return 0
+        
+        # Snapshot dos vetores e documentos vivos
+        with entry.lock:
+            old_index = entry.index
+            total = old_index.index.ntotal
+            live = []
+            for position in range(total):
+                doc = entry.document_at(position)
+                if doc is not None and not doc.metadata.get("deleted"):
+                    live.append((position, old_index.index_to_docstore_id[position], doc))
+            
+            reclaimed = total - len(live)
+            if not live or not reclaimed or reclaimed / total < min_tombstone_ratio:
+                return 0
+            
+            vectors = old_index.index.reconstruct_n(0, total)
+        
+        # Reconstrução fora do lock (buscas e inserções continuam no índice atual)
+        new_index = FAISS.from_embeddings(
+            text_embeddings=[(doc.page_content, vectors[position]) for position, _, doc in live],
+            embedding=old_index.embedding_function,
+            metadatas=[dict(doc.metadata) for _, _, doc in live],
+            ids=[docstore_id for _, docstore_id, _ in live],
+            normalize_L2=getattr(old_index, "_normalize_L2", False),
+            distance_strategy=old_index.distance_strategy
+        )
+        
+        with entry.lock:
+            # Metadados atualizados durante a reconstrução (acessos, novos tombstones)
+            for _, docstore_id, doc in live:
+                new_index.docstore.search(docstore_id).metadata = dict(doc.metadata)
+            
+            # Memórias adicionadas ao índice antigo durante a reconstrução
+            added_positions = range(total, entry.index.index.ntotal)
+            if added_positions:
+                added = [
+                    (position, entry.index.index_to_docstore_id[position], entry.document_at(position))
+                    for position in added_positions
+                ]
+                added = [item for item in added if item[2] is not None]
+                if added:
+                    new_index.add_embeddings(
+                        [(doc.page_content, entry.index.index.reconstruct(position)) for position, _, doc in added],
+                        metadatas=[dict(doc.metadata) for _, _, doc in added],
+                        ids=[docstore_id for _, docstore_id, _ in added]
+                    )
+            
+            entry.index = new_index
+            entry.track_positions()
+            self._flush(entry)
+        
+        logger.info(f"Índice de memórias em {path} compactado: {reclaimed} vetores removidos, {new_index.index.ntotal} restantes")
+        return reclaimed
+    
+    def flush(self, path: str, force: bool = False) -> bool:
+        """Grava o índice de um tenant se houver pendências (ou se `force`)."""
+        entry = self._indices.get(path)
+        if entry is None:
+            return False
+        
+        with entry.lock:
+            if not entry.pending and not entry.stats_dirty and not force:
+                return False
+            return self._flush(entry)
+    
+    def flush_due(self) -> int:
+        """
+        Grava os índices cujo intervalo de flush expirou e descarta os ociosos.
+        Retorna quantos foram gravados.
+        """
+        flushed = 0
+        with self._lock:
+            entries = list(self._indices.values())
+        for entry in entries:
+            with entry.lock:
+                if (entry.pending or entry.stats_dirty) and self._should_flush(entry):
+                    flushed += int(self._flush(entry))
+        
+        self.evict()
+        return flushed
+    
+    def flush_all(self) -> int:
+        """Grava todos os índices com pendências (usado no encerramento)."""
+        flushed = 0
+        with self._lock:
+            entries = list(self._indices.values())
+        for entry in entries:
+            with entry.lock:
+                if entry.pending or entry.stats_dirty:
+                    flushed += int(self._flush(entry))
+        return flushed
+    
+    def _should_flush(self, entry: _TenantIndex) -> bool:
+        return (
+            entry.pending >= self.flush_batch_size
+            or time.monotonic() - entry.last_flush >= self.flush_interval
+        )
+    
+    def _flush(self, entry: _TenantIndex) -> bool:
+        """
+        Grava o índice em um novo snapshot, troca o ponteiro CURRENT atomicamente e
+        descarta o log aplicado. Leitores veem sempre um par index.faiss/index.pkl completo.
+        """
+        pending_log = os.path.join(entry.path, PENDING_LOG)
+        flushing_log = os.path.join(entry.path, FLUSHING_LOG)
+        snapshots_dir = os.path.join(entry.path, SNAPSHOTS_DIR)
+        
+        try:
+            # O log é rotacionado antes da gravação; em caso de falha ele é reaplicado na recuperação
+            if os.path.exists(pending_log):
+                if os.path.exists(flushing_log):
+                    with open(flushing_log, "a", encoding="utf-8") as target, open(pending_log, "r", encoding="utf-8") as source:
+                        shutil.copyfileobj(source, target)
+                    os.remove(pending_log)
+                else:
+                    os.replace(pending_log, flushing_log)
+            
+            previous_dir = resolve_index_dir(entry.path)
+            version = f"v{time.time_ns()}"
+            entry.index.save_local(os.path.join(snapshots_dir, version), "index")
+            self._swap_pointer(entry.path, version)
+            self._remove_old_snapshots(entry.path, keep={version, os.path.basename(previous_dir)})
+            
+            if os.path.exists(flushing_log):
+                os.remove(flushing_log)
+            
+            logger.debug(f"Índice de memórias gravado em {entry.path} ({entry.pending} pendências, snapshot {version})")
+            entry.pending = 0
+            entry.stats_dirty = False
+            entry.last_flush = time.monotonic()
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar índice de memórias em {entry.path}: {e}")
+            return False
+    
+    @staticmethod
+    def _swap_pointer(path: str, version: str) -> None:
+        """Aponta CURRENT para `version` com os.replace (atômico) após o fsync do conteúdo."""
+        pointer = os.path.join(path, CURRENT_POINTER)
+        tmp_pointer = f"{pointer}.tmp"
+        with open(tmp_pointer, "w", encoding="utf-8") as target:
+            target.write(version)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_pointer, pointer)
+        
+        # Persistir a entrada do diretório (sem suporte em alguns sistemas de arquivos)
+        try:
+            dir_fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _remove_old_snapshots(path: str, keep: set) -> None:
+        """
+        Remove os snapshots antigos e os arquivos do layout sem snapshots. O snapshot
+        anterior é mantido para leitores que ainda o estejam carregando.
+        """
+        snapshots_dir = os.path.join(path, SNAPSHOTS_DIR)
+        for name in os.listdir(snapshots_dir):
+            if name not in keep:
+                shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+        
+        for filename in ("index.faiss", "index.pkl"):
+            legacy_file = os.path.join(path, filename)
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+        shutil.rmtree(os.path.join(path, ".flush_tmp"), ignore_errors=True)
+    
+    def _recover(self, entry: _TenantIndex, embeddings: Optional[Embeddings] = None) -> int:
+        """
+        Reaplica ao índice as entradas do log que ainda não estão persistidas, com os
+        vetores gravados no log. Entradas antigas, sem vetor, usam `embeddings`.
+        """
+        from langchain.schema import Document
+        
+        records = []
+        for filename in (FLUSHING_LOG, PENDING_LOG):
+            log_path = os.path.join(entry.path, filename)
+            if not os.path.exists(log_path):
+                continue
+            
+            with open(log_path, "r", encoding="utf-8") as log:
+                for line in log:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Última linha incompleta (falha durante a escrita)
+                        logger.warning(f"Entrada inválida ignorada no log {log_path}")
+        
+        if not records:
+            return 0
+        
+        existing_ids = {
+            doc.metadata.get("id")
+            for doc in getattr(entry.index.docstore, "_dict", {}).values()
+        }
+        pending = [record for record in records if record.get("metadata", {}).get("id") not in existing_ids]
+        docs = [Document(page_content=record["page_content"], metadata=record["metadata"]) for record in pending]
+        
+        if docs:
+            vectors = [record.get("embedding") for record in pending]
+            missing = [position for position, vector in enumerate(vectors) if not vector]
+            if missing:
+                if embeddings is None:
+                    raise ValueError(f"Log pendente em {entry.path} sem embeddings e sem função para gerá-los")
+                for position, vector in zip(missing, embeddings.embed_documents([docs[i].page_content for i in missing])):
+                    vectors[position] = vector
+            
+            start = entry.index.index.ntotal
+            entry.index.add_embeddings(
+                [(doc.page_content, vector) for doc, vector in zip(docs, vectors)],
+                metadatas=[doc.metadata for doc in docs]
+            )
+            entry.track_positions(start)
+            entry.pending += len(docs)
+        else:
+            # Log já aplicado: basta descartá-lo
+            for filename in (FLUSHING_LOG, PENDING_LOG):
+                log_path = os.path.join(entry.path, filename)
+                if os.path.exists(log_path):
+                    os.remove(log_path)
+        
+        return len(docs)
+
+
+# Singleton do store
+_memory_index_store: Optional[MemoryIndexStore] = None
+
+def get_memory_index_store() -> MemoryIndexStore:
+    """Obtém a instância global do store de índices de memória."""
+    global _memory_index_store
+    
+    if _memory_index_store is None:
+        _memory_index_store = MemoryIndexStore(
+            flush_batch_size=settings.MEMORY_FLUSH_BATCH_SIZE,
+            flush_interval=settings.MEMORY_FLUSH_INTERVAL,
+            max_loaded=settings.MEMORY_INDEX_MAX_LOADED,
+            idle_ttl=settings.MEMORY_INDEX_IDLE_TTL
+        )
+    
+    return _memory_index_store
@@ -16,13 +16,16 @@ from app.services.config import SystemConfig, load_system_config
 import logging
 
 from app.services.agent import Agent, AgentType
-from app.services.token_counter import TokenCounterService
+from app.services.token_counter import TokenCounterService, get_downgrade_model
 #from app.services.rag import RAGService
 from app.db.models.conversation import ConversationState, AgentScore
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.orchestrator")
 
+# Resumos em andamento por conversa quando não há Redis (conversation_id -> início)
+_local_summaries_in_progress: Dict[str, float] = {}
+
 # class ConversationState(BaseModel):
 #     conversation_id: str
 #     tenant_id: str
@@ -62,7 +65,10 @@ class AgentOrchestrator:
                 llm_service, 
                 vector_db_url=self.config.memory.vector_db_url,
                 vector_db_path=self.config.memory.memory_db_path or settings.MEMORY_DB_PATH,
-                use_local_storage=self.config.memory.use_local_storage
+                use_local_storage=self.config.memory.use_local_storage,
+                decay_rate=self.config.memory.memory_decay_rate,
+                relevance_threshold=self.config.memory.memory_relevance_threshold,
+                dedup_threshold=self.config.memory.dedup_similarity_threshold
             )
         else:
             self.memory_service = None
@@ -281,7 +287,7 @@ class AgentOrchestrator:
         
         # Verificar se deve restaurar agente comercial mesmo sem timeout
         if not new_conversation_created:  # Só se não criou conversa nova por timeout
-            current_agent = self.agent_service.get_agent(state.current_agent_id)
+            current_agent = await self.agent_service.get_agent_async(state.current_agent_id)
             
             # Se está com agente geral MAS há contexto comercial, tentar transferir
             if current_agent.type == AgentType.GENERAL:
@@ -299,7 +305,7 @@ class AgentOrchestrator:
                                 saved_commercial_agent_id = saved_commercial_agent_id.decode('utf-8')
                             
                             # Verificar se agente ainda existe e está ativo
-                            commercial_agent = self.agent_service.get_agent(saved_commercial_agent_id)
+                            commercial_agent = await self.agent_service.get_agent_async(saved_commercial_agent_id)
                             if commercial_agent and commercial_agent.active:
                                 # Forçar transferência para agente comercial
                                 state.current_agent_id = saved_commercial_agent_id
@@ -319,8 +325,16 @@ class AgentOrchestrator:
         # Apply tenant-specific config overrides
         tenant_config = self.config.apply_tenant_overrides(state.tenant_id)
         
+        # Compactar o histórico em vez de arquivar a conversa (se habilitado)
+        length_limit = tenant_config.max_conversation_length
+        if tenant_config.history_compaction_enabled and len(state.history) >= length_limit:
+            if not await self._compact_history(state, tenant_config):
+                # O resumo ainda não cobre o trecho a compactar: tentar de novo nas próximas
+                # mensagens e só arquivar se o histórico dobrar de tamanho
+                length_limit *= 2
+        
         # Check conversation length limit
-        if len(state.history) >= tenant_config.max_conversation_length:
+        if len(state.history) >= length_limit:
             logger.info(f"process_message > Conversation {conversation_id} reached message limit. Creating new conversation.")
             print(f"process_message > Conversation {conversation_id} reached message limit. Creating new conversation.")
             # Set reason for archiving
@@ -353,7 +367,7 @@ class AgentOrchestrator:
         current_time = time.time()
         time_diff_minutes = (current_time - last_update_time) / 60
         
-        current_agent = self.agent_service.get_agent(state.current_agent_id)
+        current_agent = await self.agent_service.get_agent_async(state.current_agent_id)
         agent_timeout_minutes = self._get_timeout_for_agent(current_agent)
 
         if time_diff_minutes > agent_timeout_minutes:
@@ -418,7 +432,7 @@ class AgentOrchestrator:
         
         # AQUI: Verificar automaticamente se a mensagem do usuário indica necessidade de escalação
         current_agent_id = state.current_agent_id
-        current_agent = self.agent_service.get_agent(current_agent_id)
+        current_agent = await self.agent_service.get_agent_async(current_agent_id)
         
         if current_agent.human_escalation_enabled and tenant_config.enable_escalation_to_human:
             auto_escalation_keywords = [
@@ -495,7 +509,7 @@ class AgentOrchestrator:
             
             # Update current agent
             state.current_agent_id = transfer_to_id
-            current_agent = self.agent_service.get_agent(transfer_to_id)
+            current_agent = await self.agent_service.get_agent_async(transfer_to_id)
             logger.info(f"process_message > Updated current agent to {transfer_to_id} and name {current_agent.name}")    
             
             #Salvar mapeamento de agente comercial**
@@ -507,7 +521,7 @@ class AgentOrchestrator:
                 )
                 logger.info(f"process_message > Saved commercial agent mapping for user {state.user_id}: {transfer_to_id}")
                 
-            transferred_agent = self.agent_service.get_agent(transfer_to_id)
+            transferred_agent = await self.agent_service.get_agent_async(transfer_to_id)
             if (transferred_agent.type == AgentType.SPECIALIST and 
                 any(s in transferred_agent.specialties for s in ["comercial", "commercial", "sales", "sale", "marketing"])):
                 
@@ -521,7 +535,7 @@ class AgentOrchestrator:
         else:
             logger.info(f"process_message > Not transferring conversation {conversation_id} from agent {current_agent_id}.")
             # Update current agent
-            current_agent = self.agent_service.get_agent(current_agent_id)
+            current_agent = await self.agent_service.get_agent_async(current_agent_id)
         
         # Retrieve RAG context based on agent settings and config
         rag_context = []
@@ -582,18 +596,33 @@ class AgentOrchestrator:
         last_summary_at = state.metadata.get("last_summary_at", 0)
         time_since_summary = time.time() - last_summary_at
         
+        # Resumo antecipado pedido pela compactação (com espera após uma falha)
+        last_error_at = (state.metadata.get("last_summary_error") or {}).get("timestamp", 0)
+        summary_requested = (
+            state.metadata.get("summary_requested", False)
+            and time.time() - last_error_at > tenant_config.memory.summary_time_threshold
+        )
+        
         if (tenant_config.memory.enabled and 
             (message_count % tenant_config.memory.summary_frequency == 0 or 
-            time_since_summary > tenant_config.memory.summary_time_threshold)):
+            time_since_summary > tenant_config.memory.summary_time_threshold or
+            summary_requested)):
             should_summarize = True
 
         if should_summarize and self.memory_service:
             try:
-                # Generate summary in the background
-                asyncio.create_task(self._generate_and_store_summary(state))
-                
-                # Update metadata
-                state.metadata["last_summary_at"] = time.time()
+                # Um resumo por conversa de cada vez: todos partem da mesma marca
+                if await self._start_summary(state.conversation_id):
+                    # Generate summary in the background
+                    asyncio.create_task(self._generate_and_store_summary(
+                        state, max_input_chars=tenant_config.memory.summary_max_input_chars
+                    ))
+                    
+                    # Update metadata
+                    state.metadata["last_summary_at"] = time.time()
+                    state.metadata.pop("summary_requested", None)
+                else:
+                    logger.debug(f"Resumo da conversa {conversation_id} já em andamento, novo resumo não agendado")
             except Exception as e:
                 logging.error(f"Erro ao agendar geração de resumo: {str(e)}")
                 # Continue sem interromper o fluxo principal
@@ -601,29 +630,55 @@ class AgentOrchestrator:
         # Prepare prompt with history, context, memories and audio
         prompt = self._prepare_prompt(state, current_agent, rag_context, memory_context, contact_id, audio_data, current_message=message)
         
-        # Get response from LLM - sempre usar método de texto já que áudio foi transcrito
-        response, token_usage = await self.llm.generate_response(prompt)
+        # Verificação prévia de limites de tokens (rejeitar ou usar modelo alternativo)
+        limit_check = {"allowed": True, "action": "allow"}
+        original_model = None
+        if self.token_counter_service:
+            limit_check = await self.token_counter_service.check_pre_flight_limits(
+                tenant_id=int(state.tenant_id),
+                agent_id=current_agent.id
+            )
+            if limit_check["action"] == "downgrade":
+                # Só usar um modelo alternativo do mesmo provedor do serviço
+                downgrade_model = get_downgrade_model(getattr(self.llm, 'provider_type', None))
+                if downgrade_model and hasattr(self.llm, 'model'):
+                    original_model = self.llm.model
+                    self.llm.model = downgrade_model
+                    logger.info(f"Limite de tokens excedido, usando modelo {self.llm.model} em vez de {original_model}")
+                else:
+                    logger.warning(
+                        f"Sem modelo alternativo para o provedor {getattr(self.llm, 'provider_type', None)}, "
+                        f"downgrade tratado como rejeição"
+                    )
+                    limit_check = {**limit_check, "allowed": False, "action": "reject"}
+        
+        try:
+            if limit_check["allowed"]:
+                # Get response from LLM - sempre usar método de texto já que áudio foi transcrito
+                response, token_usage = await self.llm.generate_response(prompt)
+            else:
+                logger.warning(f"Limite de tokens excedido para tenant {state.tenant_id}, requisição rejeitada")
+                response, token_usage = settings.TOKEN_LIMIT_REJECT_MESSAGE, None
+            # Modelo efetivamente usado, para o registro de uso abaixo
+            used_model = getattr(self.llm, 'model', None)
+        finally:
+            # Restaurar o modelo mesmo se a chamada ao LLM falhar
+            if original_model is not None:
+                self.llm.model = original_model
 
         # Registrar uso de tokens - Implementação melhorada
-        if hasattr(self, 'token_counter_service') and self.token_counter_service:
+        if hasattr(self, 'token_counter_service') and self.token_counter_service and token_usage:
             try:
                 # Obter informações do modelo
                 model_id = getattr(self.llm, 'model_id', None)
                 
                 # Se model_id não estiver disponível, tentar obter por nome
-                if model_id is None and hasattr(self.llm, 'model'):
+                if model_id is None and used_model:
                     # Tenta encontrar o modelo pelo nome no banco de dados
                     try:
-                        model_name = self.llm.model
-                        from app.db.models.llm_model import LLMModel
-                        db_session = getattr(self.token_counter_service, 'db', None)
-                        if db_session:
-                            model = db_session.query(LLMModel).filter(LLMModel.model_id == model_name).first()
-                            if model:
-                                model_id = model.id
-                            else:
-                                # Se não encontrar, usa ID 1 como fallback
-                                model_id = 1
+                        model_name = used_model
+                        # Se não encontrar, usa ID 1 como fallback
+                        model_id = await self.token_counter_service.get_model_id_by_name(model_name) or 1
                     except Exception as e:
                         # Logar erro mas continuar
                         print(f"Erro ao buscar modelo por nome: {e}")
@@ -772,7 +827,7 @@ class AgentOrchestrator:
                 else:
                     # Look for human agents
                     try:
-                        agents = await self.agent_service.get_agents_by_tenant(state.tenant_id)
+                        agents = await self.agent_service.get_agents_by_tenant_async(state.tenant_id)
                         human_agents = [a for a in agents if a.type == AgentType.HUMAN]
                         
                         if human_agents:
@@ -919,7 +974,7 @@ class AgentOrchestrator:
         target_specialties = specialist_mapping.get(specialist_type, [specialist_type])
         
         # Buscar agentes relacionados
-        agents = self.agent_service.get_agents_by_tenant_and_relationship_with_current_agent(
+        agents = await self.agent_service.get_agents_by_tenant_and_relationship_with_current_agent_async(
             tenant_id, current_agent.id
         )
         
@@ -985,6 +1040,14 @@ class AgentOrchestrator:
         # Prepare conversation history
         messages = [{"role": "system", "content": system_prompt}]
         
+        # Resumo das mensagens antigas removidas pela compactação do histórico
+        compacted_summary = state.metadata.get("compacted_summary")
+        if compacted_summary:
+            messages.append({
+                "role": "system",
+                "content": f"Resumo das mensagens anteriores desta conversa:\n{compacted_summary.get('content', '')}"
+            })
+        
         # ✅ CORREÇÃO: Extrair histórico ANTES da mensagem atual
         history = []
         for msg in state.history[-20:]:  # Get last 20 messages
@@ -1157,12 +1220,16 @@ class AgentOrchestrator:
     #         except Exception as save_error:
     #             logging.error(f"Erro adicional ao salvar estado após falha de resumo: {str(save_error)}")
     
-    async def _generate_and_store_summary(self, state: ConversationState) -> None:
+    async def _generate_and_store_summary(self, state: ConversationState, max_input_chars: Optional[int] = None) -> None:
         """
         Gera e armazena um resumo da conversa.
         
+        O resumo é incremental: apenas as mensagens posteriores à marca
+        `summary_watermark` são enviadas ao LLM junto com o resumo anterior.
+        
         Args:
             state: Estado da conversa
+            max_input_chars: Limite de caracteres das mensagens novas enviadas ao LLM
         """
         try:
             # Verificar se o serviço de memória está ativo
@@ -1170,31 +1237,52 @@ class AgentOrchestrator:
                 logging.warning(f"Tentativa de gerar resumo, mas o serviço de memória não está ativo")
                 return
             
-            logger.info(f"Gerando resumo para a conversa {state.conversation_id}")
+            # Capturar o trecho a resumir antes de qualquer await (o histórico continua crescendo).
+            # A marca é absoluta: history_offset conta as mensagens já removidas pela compactação.
+            offset = state.metadata.get("history_offset", 0)
+            absolute_watermark = state.metadata.get("summary_watermark", 0)
+            watermark = max(absolute_watermark - offset, 0)
+            if watermark > len(state.history):
+                watermark = 0
+            # Mensagens mais antigas primeiro: a marca avança só até a última mensagem
+            # enviada; o que não couber no limite fica para o próximo resumo
+            pending = state.history[watermark:]
+            new_watermark = watermark + self.memory_service.fit_summary_batch(pending, max_input_chars)
+            new_messages = state.history[watermark:new_watermark]
+            previous_summary = state.metadata.get("last_summary") if absolute_watermark else None
+            
+            if not new_messages:
+                return
+            
+            logger.info(f"Gerando resumo para a conversa {state.conversation_id} (mensagens {watermark}-{new_watermark})")
+            if new_watermark < len(pending) + watermark:
+                logger.info(f"Limite de entrada do resumo atingido: {len(pending) + watermark - new_watermark} mensagens ficam para o próximo resumo")
             
             # Gerar resumo
             summary = await self.memory_service.generate_conversation_summary(
                 conversation_id=state.conversation_id,
                 tenant_id=state.tenant_id,
                 user_id=state.user_id,
-                messages=state.history
+                messages=new_messages,
+                previous_summary=previous_summary,
+                max_input_chars=max_input_chars
             )
             
             if not summary:
                 logging.warning(f"Falha ao gerar resumo para conversa {state.conversation_id}")
                 return
             
-            # Armazenar o resumo nos metadados do estado
-            state.metadata["last_summary"] = {
-                "brief": summary.brief_summary,
-                "detailed": summary.detailed_summary,
-                "key_points": summary.key_points,
-                "sentiment": summary.sentiment,
-                "generated_at": time.time()
-            }
-            
-            # Salvar estado atualizado
-            await self.save_conversation_state(state)
+            # Armazenar o resumo nos metadados do estado (e no estado mais recente salvo)
+            await self._save_summary_metadata(state, {
+                "last_summary": {
+                    "brief": summary.brief_summary,
+                    "detailed": summary.detailed_summary,
+                    "key_points": summary.key_points,
+                    "sentiment": summary.sentiment,
+                    "generated_at": time.time()
+                },
+                "summary_watermark": offset + new_watermark
+            })
             
             logger.info(f"Resumo gerado e armazenado para conversa {state.conversation_id}")
             
@@ -1205,20 +1293,162 @@ class AgentOrchestrator:
             import traceback
             logging.error(f"Stack trace completo: {traceback.format_exc()}")
             
-            # Registrar o erro nos metadados
-            state.metadata["last_summary_error"] = {
-                "error": str(e),
-                "timestamp": time.time(),
-                "error_type": type(e).__name__
-            }
-            
-            # Salvar estado mesmo com erro
+            # Registrar o erro nos metadados e salvar o estado mesmo com erro
             try:
-                await self.save_conversation_state(state)
+                await self._save_summary_metadata(state, {
+                    "last_summary_error": {
+                        "error": str(e),
+                        "timestamp": time.time(),
+                        "error_type": type(e).__name__
+                    }
+                })
             except Exception as save_error:
                 logging.error(f"Erro adicional ao salvar estado após falha de resumo: {str(save_error)}")
+        finally:
+            await self._finish_summary(state.conversation_id)
+    
+    async def _start_summary(self, conversation_id: str) -> bool:
+        """
+        Marca o resumo da conversa como em andamento. Retorna False se já houver um.
+        
+        A marca (com o horário de início) expira após MEMORY_SUMMARY_IN_PROGRESS_TTL
+        segundos, para que um resumo interrompido não bloqueie os seguintes.
+        """
+        ttl = settings.MEMORY_SUMMARY_IN_PROGRESS_TTL
+        if self.redis:
+            started = await self.redis.set(
+                f"summary_in_progress:{conversation_id}", time.time(), nx=True, ex=ttl
+            )
+            return bool(started)
+        
+        now = time.time()
+        started_at = _local_summaries_in_progress.get(conversation_id)
+        if started_at is not None and now - started_at < ttl:
+            return False
+        _local_summaries_in_progress[conversation_id] = now
+        return True
+    
+    async def _finish_summary(self, conversation_id: str) -> None:
+        """Remove a marca de resumo em andamento da conversa."""
+        try:
+            if self.redis:
+                await self.redis.delete(f"summary_in_progress:{conversation_id}")
+            else:
+                _local_summaries_in_progress.pop(conversation_id, None)
+        except Exception as e:
+            logger.warning(f"Erro ao liberar marca de resumo da conversa {conversation_id}: {e}")
+    
+    async def _save_summary_metadata(self, state: ConversationState, values: Dict[str, Any]) -> None:
+        """
+        Grava os campos do resumo no estado e no estado mais recente da conversa no Redis.
+        
+        O resumo roda em segundo plano: salvar o objeto capturado no início sobrescreveria
+        mensagens e compactações feitas enquanto o LLM respondia. A marca do resumo é
+        absoluta (inclui history_offset), então vale também para o estado recarregado.
+        """
+        state.metadata.update(values)
+        
+        latest = await self.get_conversation_state(state.conversation_id)
+        if latest is None:
+            latest = state
+        elif "summary_watermark" in values and values["summary_watermark"] < latest.metadata.get("summary_watermark", 0):
+            # Um resumo mais recente já foi gravado
+            return
+        else:
+            latest.metadata.update(values)
+        
+        await self.save_conversation_state(latest)
 
 
+    async def _compact_history(self, state: ConversationState, tenant_config: SystemConfig) -> bool:
+        """
+        Compacta o histórico de uma conversa longa.
+        
+        As mensagens mais antigas (além das `history_compaction_keep_messages` mais
+        recentes) já cobertas pelo resumo incremental são gravadas em armazenamento frio
+        (conversation_segments) e substituídas, no estado ativo, por esse resumo. Nenhuma
+        chamada ao LLM é feita aqui: se o resumo ainda não cobre o trecho, a compactação
+        espera o próximo resumo em segundo plano.
+        
+        Args:
+            state: Estado da conversa
+            tenant_config: Configuração do tenant
+            
+        Returns:
+            True se o histórico foi compactado
+        """
+        keep = max(tenant_config.history_compaction_keep_messages, 1)
+        if not self.memory_service:
+            return False
+        
+        try:
+            offset = state.metadata.get("history_offset", 0)
+            last_summary = state.metadata.get("last_summary")
+            # Compactar apenas o que o resumo existente já cobre
+            covered = state.metadata.get("summary_watermark", 0) - offset if last_summary else 0
+            cut = min(len(state.history) - keep, covered)
+            if cut <= 0:
+                logger.info(f"Resumo ainda não cobre o histórico da conversa {state.conversation_id}, compactação adiada")
+                # Antecipar o próximo resumo em segundo plano (se nenhum estiver em andamento)
+                state.metadata["summary_requested"] = True
+                return False
+            
+            # O índice do segmento é a posição absoluta da primeira mensagem: uma nova
+            # tentativa do mesmo trecho não gera um segmento duplicado
+            segment_index = offset
+            
+            # O trecho só sai do Redis depois de gravado no banco
+            if not await self._store_history_segment(state, state.history[:cut], segment_index):
+                return False
+            
+            state.history = state.history[cut:]
+            state.metadata["history_offset"] = offset + cut
+            state.metadata["compacted_segments"] = state.metadata.get("compacted_segments", 0) + 1
+            state.metadata["compacted_summary"] = {
+                "content": last_summary.get("detailed") or last_summary.get("brief", ""),
+                "key_points": last_summary.get("key_points", []),
+                "compacted_messages": offset + cut,
+                "updated_at": time.time()
+            }
+            
+            await self.save_conversation_state(state)
+            
+            logger.info(f"Conversa {state.conversation_id} compactada: {cut} mensagens movidas para o segmento {segment_index}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao compactar histórico da conversa {state.conversation_id}: {e}")
+            return False
+    
+    async def _store_history_segment(self, state: ConversationState, messages: List[Dict[str, Any]], segment_index: int) -> bool:
+        """
+        Grava um trecho do histórico em conversation_segments (sessão assíncrona).
+        Idempotente: se o segmento já existe, considera-o gravado.
+        
+        Returns:
+            True se o trecho está gravado no banco
+        """
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        from app.db.models.conversation_segment import ConversationSegment
+        from app.db.session import AsyncSessionLocal
+        
+        stmt = pg_insert(ConversationSegment).values(
+            conversation_id=state.conversation_id,
+            tenant_id=str(state.tenant_id),
+            user_id=state.user_id,
+            segment_index=segment_index,
+            messages=messages,
+            message_count=len(messages)
+        ).on_conflict_do_nothing(constraint="uq_conversation_segments_index")
+        
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar segmento {segment_index} da conversa {state.conversation_id}: {e}")
+            return False
+    
     # Add method to get user profile with memories
     async def get_user_profile(self, tenant_id: str, user_id: str) -> Dict[str, Any]:
         """
@@ -1243,7 +1473,7 @@ class AgentOrchestrator:
                         last_commercial_agent_id = last_commercial_agent_id.decode('utf-8')
                     
                     # Verificar se o agente ainda existe e está ativo
-                    commercial_agent = self.agent_service.get_agent(last_commercial_agent_id)
+                    commercial_agent = await self.agent_service.get_agent_async(last_commercial_agent_id)
                     if commercial_agent and commercial_agent.active:
                         agent_id = last_commercial_agent_id
                         logger.info(f"Restored commercial agent {agent_id} for user {user_id}")
@@ -1256,7 +1486,7 @@ class AgentOrchestrator:
             
             # **SE NÃO ENCONTROU AGENTE COMERCIAL, buscar agente primário**
             if not agent_id:
-                agents = await self.agent_service.get_agents_by_tenant(tenant_id)
+                agents = await self.agent_service.get_agents_by_tenant_async(tenant_id)
                 general_agents = [a for a in agents if a.type == AgentType.GENERAL]
                 
                 if not general_agents:
@@ -1342,7 +1572,7 @@ class AgentOrchestrator:
         if not transfer_config.enabled:
             logger.info("evaluate_agent_transfer > Transfers disabled")
             # Return only current agent with max score
-            current_agent = self.agent_service.get_agent(state.current_agent_id)
+            current_agent = await self.agent_service.get_agent_async(state.current_agent_id)
             return [AgentScore(
                 agent_id=current_agent.id,
                 score=1.0,
@@ -1350,7 +1580,7 @@ class AgentOrchestrator:
             )]
         
         # Get current agent
-        current_agent = self.agent_service.get_agent(state.current_agent_id)
+        current_agent = await self.agent_service.get_agent_async(state.current_agent_id)
         logger.info("evaluate_agent_transfer > Current agent id: %s", current_agent.id)
         
         # NOVA VALIDAÇÃO: Verificar se a mensagem é muito simples para transferência
@@ -1431,7 +1661,7 @@ class AgentOrchestrator:
         recent_messages = state.history[-5:] if len(state.history) >= 5 else state.history[:]
         
         # Get all agents for this tenant
-        all_agents = self.agent_service.get_agents_by_tenant_and_relationship_with_current_agent(state.tenant_id, state.current_agent_id)
+        all_agents = await self.agent_service.get_agents_by_tenant_and_relationship_with_current_agent_async(state.tenant_id, state.current_agent_id)
         logger.info("evaluate_agent_transfer > All agents in tenant: %s", all_agents)
         
         # Initialize scores
@@ -2393,39 +2623,16 @@ class AgentOrchestrator:
     async def _archive_conversation(self, state: ConversationState) -> None:
         """
         Arquiva uma conversa para armazenamento persistente no PostgreSQL.
+        A gravação é feita em lote pelo ConversationArchiveWriter, fora do event loop.
         
         Args:
             state: O estado da conversa a ser arquivado
         """
         try:
-            from app.db.models.archived_conversation import ArchivedConversation
-            from app.db.session import SessionLocal
-            
-            # Criar uma sessão do banco de dados
-            db = SessionLocal()
+            from app.services.archive_writer import get_archive_writer
             
-            try:
-                # Criar o objeto do modelo
-                archived_conversation = ArchivedConversation(
-                    conversation_id=state.conversation_id,
-                    tenant_id=state.tenant_id,
-                    user_id=state.user_id,
-                    history=state.history,  # PostgreSQL JSONB pode armazenar diretamente
-                    meta_data=state.metadata,  # PostgreSQL JSONB pode armazenar diretamente
-                    message_count=len(state.history),
-                    archive_reason=state.metadata.get("archive_reason", "unknown"),
-                    archived_at=datetime.utcnow()
-                )
-                
-                # Adicionar e salvar no banco de dados
-                db.add(archived_conversation)
-                db.commit()
-                
-                logger.info(f"Conversa {state.conversation_id} arquivada com sucesso no banco de dados")
-                print(f"Conversa {state.conversation_id} arquivada com sucesso no banco de dados")
-            finally:
-                db.close()
-                
+            if get_archive_writer().enqueue(state):
+                logger.info(f"Conversa {state.conversation_id} enfileirada para arquivamento")
         except Exception as e:
             print(f"Erro ao arquivar conversa {state.conversation_id}: {e}")
             logger.error(f"Falha ao arquivar conversa {state.conversation_id}: {e}")
@@ -2492,7 +2699,7 @@ class AgentOrchestrator:
                     saved_agent_id = saved_agent_id.decode('utf-8')
                 
                 # Verificar se agente ainda existe e está ativo
-                agent = self.agent_service.get_agent(saved_agent_id)
+                agent = await self.agent_service.get_agent_async(saved_agent_id)
                 if agent and agent.active:
                     return saved_agent_id
                 else:
@@ -1,15 +1,18 @@
 # \app\services\rag_faiss.py
 import asyncio
+import hashlib
 import logging
+import multiprocessing
 import os
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 import httpx
-from langchain_openai import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.document_loaders import TextLoader, PyPDFLoader
 from langchain.schema import Document
 from app.core.config import Settings, settings
+from app.services.llm.embeddings import LLMEmbeddingAdapter
 from app.services.llm.factory import LLMServiceFactory
 from app.db.session import SessionLocal
 
@@ -17,6 +20,87 @@ from app.db.session import SessionLocal
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.rag")
 
+# Extensões suportadas na indexação de documentos
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+
+
+def _file_hash(file_path: str) -> str:
+    """SHA-256 do conteúdo de um arquivo."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _content_hash(text: str) -> str:
+    """SHA-256 do texto de um chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _load_and_split_file(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    known_hash: Optional[str] = None
+) -> Tuple[str, Optional[List[Tuple[str, Dict[str, Any]]]]]:
+    """
+    Carrega e divide um arquivo em chunks (executado no pool de processos).
+    
+    Retorna (hash do arquivo, chunks), com cada chunk como (texto, metadados) e os
+    hashes do arquivo e do chunk nos metadados. Se o hash do arquivo for igual a
+    `known_hash` (arquivo já indexado sem alterações), não faz o parsing e retorna chunks None.
+    """
+    file_hash = _file_hash(file_path)
+    if file_hash == known_hash:
+        return file_hash, None
+    
+    _, ext = os.path.splitext(file_path)
+    if ext.lower() == ".pdf":
+        loader = PyPDFLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding='utf-8')
+    
+    text_splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = text_splitter.split_documents(loader.load())
+    return file_hash, [
+        (chunk.page_content, {**chunk.metadata, "content_hash": _content_hash(chunk.page_content), "file_hash": file_hash})
+        for chunk in chunks
+    ]
+
+
+def _relative_path(file_path: str, documents_dir: str) -> str:
+    """Caminho do arquivo relativo ao diretório indexado (separador "/"), chave do catálogo."""
+    return os.path.relpath(file_path, documents_dir).replace(os.sep, "/")
+
+
+# Pool de processos compartilhado para parsing de documentos (PDFs são CPU-bound)
+_ingest_pool: Optional[ProcessPoolExecutor] = None
+
+def get_ingest_pool() -> ProcessPoolExecutor:
+    """
+    Obtém o pool de processos usado na indexação de documentos (criado na inicialização
+    da aplicação). Os processos são iniciados com "spawn": o fork de um processo com
+    threads (writer de arquivamento, asyncio.to_thread, locks de logging) pode travar os filhos.
+    """
+    global _ingest_pool
+    
+    if _ingest_pool is None:
+        _ingest_pool = ProcessPoolExecutor(
+            max_workers=settings.RAG_INGEST_WORKERS or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    
+    return _ingest_pool
+
+def shutdown_ingest_pool():
+    """Encerra o pool de processos de indexação."""
+    global _ingest_pool
+    
+    if _ingest_pool is not None:
+        _ingest_pool.shutdown(wait=False, cancel_futures=True)
+        _ingest_pool = None
+
 class RAGServiceFAISS:
     """
     Serviço de Retrieval-Augmented Generation (RAG) com suporte multi-tenant usando FAISS
@@ -39,6 +123,7 @@ class RAGServiceFAISS:
         # Inicializar o embedding model de forma assíncrona
         # Não inicializamos imediatamente para permitir a inicialização
         # adequada com o LLM do tenant
+        self.llm_service = None
         self.embeddings = None
         self.vectorstore = None
         
@@ -49,11 +134,15 @@ class RAGServiceFAISS:
             # para garantir que usamos os embeddings corretos
             pass
         
-    def _create_faiss_from_documents(self, texts, embeddings):
+    def _create_faiss_from_documents(self, texts, vectors):
         """
-        A synchronous method to create FAISS from documents
+        A synchronous method to create FAISS from documents and their precomputed embeddings
         """
-        return FAISS.from_documents(texts, embeddings)
+        return FAISS.from_embeddings(
+            [(doc.page_content, vector) for doc, vector in zip(texts, vectors)],
+            self.embeddings,
+            metadatas=[doc.metadata for doc in texts]
+        )
 
     def _update_faiss_index(self, texts):
         """
@@ -77,69 +166,14 @@ class RAGServiceFAISS:
             return
         
         # Usar o factory para criar o serviço LLM correto para o tenant
-        llm_service = await LLMServiceFactory.create_service(self.db, tenant_id=self.tenant_id)
-        
-        # Option 1: Use a direct implementation of OpenAIEmbeddings (most reliable)
-        # This is the preferred option for a production environment
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=llm_service.api_key,
-            model="text-embedding-ada-002"
-        )
+        self.llm_service = await LLMServiceFactory.create_service(self.db, tenant_id=self.tenant_id)
         
-        
-    class EmbeddingAdapter:
-        def __init__(self, llm_service):
-            self.llm_service = llm_service
-            self._loop = asyncio.get_event_loop()
-        
-        async def async_embed_documents(self, texts):
-            """Async method to get embeddings for documents"""
-            embeddings = []
-            for text in texts:
-                embedding = await self.llm_service.get_embeddings(text)
-                embeddings.append(embedding)
-            return embeddings
-        
-        async def async_embed_query(self, text):
-            """Async method to get embedding for a single query"""
-            return await self.llm_service.get_embeddings(text)
-        
-        # Synchronous methods required by FAISS
-        def embed_documents(self, texts):
-            """
-            Synchronous method that uses run_in_executor to call the async method
-            without creating a new event loop
-            """
-            # Use a ThreadPoolExecutor to run the async method in a separate thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = self._loop.run_in_executor(
-                    executor,
-                    lambda: asyncio.run_coroutine_threadsafe(
-                        self.async_embed_documents(texts), 
-                        self._loop
-                    ).result()
-                )
-                # Get result from future
-                return self._loop.run_until_complete(future)
-        
-        def embed_query(self, text):
-            """
-            Synchronous method that uses run_in_executor to call the async method
-            without creating a new event loop
-            """
-            # Use a ThreadPoolExecutor to run the async method in a separate thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = self._loop.run_in_executor(
-                    executor,
-                    lambda: asyncio.run_coroutine_threadsafe(
-                        self.async_embed_query(text), 
-                        self._loop
-                    ).result()
-                )
-                # Get result from future
-                return self._loop.run_until_complete(future)
+        # Embeddings do provedor do tenant (documentos em lote via get_embeddings_batch)
+        self.embeddings = LLMEmbeddingAdapter(self.llm_service)
+    
+    async def _embed_documents(self, texts: List[Document]) -> List[List[float]]:
+        """Gera os embeddings dos chunks em lote, fora das operações síncronas do FAISS."""
+        return await self.llm_service.get_embeddings_batch([doc.page_content for doc in texts])
     
     async def load_vectorstore(self):
         """
@@ -169,9 +203,20 @@ class RAGServiceFAISS:
                 return False
         return False
     
-    async def index_documents(self, documents_dir: str, category: str = None, tenant_id: int = None) -> int:
+    async def index_documents(self, documents_dir: str, category: str = None, tenant_id: int = None) -> Dict[str, int]:
         """
-        Indexa documentos de um diretório para o vectorstore, mantendo os documentos existentes
+        Indexa documentos de um diretório para o vectorstore, mantendo os documentos existentes.
+        
+        Os arquivos são processados em paralelo em um pool de processos e os chunks são
+        indexados em lotes à medida que ficam prontos (RAG_INGEST_WORKERS, RAG_INGEST_BATCH_SIZE).
+        
+        A indexação é incremental por hash de conteúdo: arquivos já indexados sem alteração
+        (mesmo caminho relativo a `documents_dir`, categoria e hash) são ignorados; em arquivos alterados, apenas os chunks
+        novos são embutidos e os chunks antigos que deixaram de existir são removidos; chunks
+        idênticos a outros já indexados na categoria não são duplicados.
+        
+        Returns:
+            Contagem de chunks: {"added", "skipped", "replaced"}
         """
         # Permitir substituir o tenant_id no método
         if tenant_id is not None:
@@ -194,78 +239,175 @@ class RAGServiceFAISS:
                     print("Falha ao carregar vectorstore existente. Será criado um novo.")
                     self.vectorstore = None
         
-        # Dicionário de carregadores por extensão
-        loaders = {
-            ".txt": (lambda path: TextLoader(path, encoding='utf-8')),
-            ".md": (lambda path: TextLoader(path, encoding='utf-8')),
-            ".pdf": (lambda path: PyPDFLoader(path)),
-        }
+        # Arquivos suportados do diretório
+        file_paths = [
+            os.path.join(root, file)
+            for root, _, files in os.walk(documents_dir)
+            for file in files
+            if os.path.splitext(file)[1].lower() in SUPPORTED_EXTENSIONS
+        ]
+        report = {"added": 0, "skipped": 0, "replaced": 0}
+        if not file_paths:
+            return report
+        
+        # Catálogo dos arquivos e chunks já indexados (hashes nos metadados do docstore)
+        catalog, chunk_hashes = await asyncio.to_thread(self._build_index_catalog, category)
+        stale_ids: List[str] = []
+        metadata_updated = False
+        
+        # Pipeline em streaming: arquivos são carregados/divididos em paralelo no pool de
+        # processos; os chunks são embutidos em lotes e adicionados ao índice à medida que
+        # chegam. Apenas alguns arquivos e um lote de chunks ficam em memória por vez.
+        loop = asyncio.get_event_loop()
+        pool = get_ingest_pool()
+        max_in_flight = max(1, (settings.RAG_INGEST_WORKERS or os.cpu_count() or 1) * 2)
+        batch_size = settings.RAG_INGEST_BATCH_SIZE
+        
+        pending = {}  # future -> caminho do arquivo
+        buffer: List[Document] = []
+        remaining = iter(file_paths)
+        
+        def submit_next() -> bool:
+            file_path = next(remaining, None)
+            if file_path is None:
+                return False
+            known = catalog.get(_relative_path(file_path, documents_dir))
+            pending[loop.run_in_executor(
+                pool, _load_and_split_file, file_path, 1000, 200, known["file_hash"] if known else None
+            )] = file_path
+            return True
         
-        # Processar cada arquivo no diretório
-        all_documents = []
+        while len(pending) < max_in_flight and submit_next():
+            pass
         
-        for root, _, files in os.walk(documents_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                _, ext = os.path.splitext(file)
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                submit_next()
                 
-                if ext.lower() in loaders:
-                    try:
-                        # Usar o carregador apropriado
-                        loader = loaders[ext.lower()](file_path)
-                        
-                        # Use a non-async method to load documents
-                        documents = loader.load()
-                        
-                        # Adicionar metadados
-                        for doc in documents:
-                            doc.metadata["tenant_id"] = self.tenant_id
-                            doc.metadata["filename"] = file
-                            doc.metadata["source"] = file_path
-                            if category:
-                                doc.metadata["category"] = category
-                        
-                        all_documents.extend(documents)
-                    except Exception as e:
-                        print(f"Erro ao processar arquivo {file_path}: {e}")
-        
-        # Dividir em chunks menores
-        if all_documents:
-            text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            texts = text_splitter.split_documents(all_documents)
-            
-            # Debug: mostrar número de documentos
-            print(f"Processando {len(texts)} novos chunks de documentos.")
-            
-            # Run FAISS operations in a separate thread to avoid event loop issues
-            import concurrent.futures
-            
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                if self.vectorstore is None:
-                    # Se não existir vectorstore, criar um novo
-                    print("Criando novo vectorstore com os documentos processados")
-                    self.vectorstore = await asyncio.get_event_loop().run_in_executor(
-                        executor, self._create_faiss_from_documents, texts, self.embeddings
-                    )
-                    # Salvar alterações
-                    self.vectorstore.save_local(self.vector_db_path, "index")
-                else:
-                    # Se já existir vectorstore, adicionar os novos documentos
-                    print(f"Adicionando novos documentos ao vectorstore existente")
+                try:
+                    file_hash, chunks = future.result()
+                except Exception as e:
+                    print(f"Erro ao processar arquivo {file_path}: {e}")
+                    continue
+                
+                # Arquivos são identificados pelo caminho relativo: nomes iguais em
+                # subdiretórios diferentes são arquivos distintos
+                relative_path = _relative_path(file_path, documents_dir)
+                existing = catalog.get(relative_path)
+                
+                # Arquivo sem alterações desde a última indexação
+                if chunks is None:
+                    report["skipped"] += len(existing["ids"])
+                    continue
+                
+                kept_ids = set()
+                for page_content, metadata in chunks:
+                    content_hash = metadata["content_hash"]
                     
-                    # Versão mais direta: usar add_documents no executor
-                    await asyncio.get_event_loop().run_in_executor(
-                        executor,
-                        lambda: self._safe_add_documents(texts)
-                    )
+                    # Chunk inalterado de uma versão anterior do arquivo: reaproveitado
+                    if existing and content_hash in existing["chunks"]:
+                        kept_ids.add(existing["chunks"][content_hash])
+                        report["skipped"] += 1
+                        continue
+                    
+                    # Chunk idêntico já indexado na categoria (ou repetido neste upload)
+                    if content_hash in chunk_hashes:
+                        report["skipped"] += 1
+                        continue
+                    chunk_hashes.add(content_hash)
                     
-                    # Contar documentos após adição para verificar
-                    doc_count = len(self.vectorstore.docstore._dict.keys())
-                    print(f"Total de documentos após adição: {doc_count}")
+                    # Adicionar metadados
+                    metadata["tenant_id"] = self.tenant_id
+                    metadata["relative_path"] = relative_path
+                    metadata["filename"] = os.path.basename(file_path)  # Apenas para exibição
+                    metadata["source"] = file_path
+                    if category:
+                        metadata["category"] = category
+                    buffer.append(Document(page_content=page_content, metadata=metadata))
+                
+                if existing:
+                    # Versão anterior do arquivo: chunks reaproveitados passam a apontar para o
+                    # novo hash do arquivo; os demais são removidos do índice
+                    for docstore_id in kept_ids:
+                        self.vectorstore.docstore.search(docstore_id).metadata["file_hash"] = file_hash
+                    metadata_updated = metadata_updated or bool(kept_ids)
+                    stale = [docstore_id for docstore_id in existing["ids"] if docstore_id not in kept_ids]
+                    stale_ids.extend(stale)
+                    report["replaced"] += len(stale)
+                
+                while len(buffer) >= batch_size:
+                    report["added"] += await self._index_chunk_batch(buffer[:batch_size])
+                    del buffer[:batch_size]
+        
+        if buffer:
+            report["added"] += await self._index_chunk_batch(buffer)
+        
+        if stale_ids:
+            await asyncio.to_thread(self.vectorstore.delete, stale_ids)
+        
+        # Persistir o índice uma única vez ao final
+        if (report["added"] or report["replaced"] or metadata_updated) and self.vectorstore is not None:
+            await asyncio.to_thread(self.vectorstore.save_local, self.vector_db_path, "index")
+            doc_count = len(self.vectorstore.docstore._dict.keys())
+            print(f"Indexação concluída: {report}. Total de documentos no índice: {doc_count}")
+        
+        return report
+    
+    def _build_index_catalog(self, category: Optional[str]) -> Tuple[Dict[str, Dict[str, Any]], set]:
+        """
+        Catálogo dos arquivos já indexados na categoria, a partir dos metadados do docstore.
+        
+        Returns:
+            ({caminho relativo: {"file_hash", "ids", "chunks": {content_hash: docstore_id}}},
+             hashes de todos os chunks da categoria)
+        """
+        catalog: Dict[str, Dict[str, Any]] = {}
+        chunk_hashes = set()
+        if self.vectorstore is None:
+            return catalog, chunk_hashes
+        
+        for docstore_id in self.vectorstore.index_to_docstore_id.values():
+            doc = self.vectorstore.docstore.search(docstore_id)
+            if doc is None or isinstance(doc, str) or doc.metadata.get("category") != category:
+                continue
             
-            return len(texts)
+            content_hash = doc.metadata.get("content_hash")
+            if content_hash:
+                chunk_hashes.add(content_hash)
+            
+            # Chunks indexados antes do caminho relativo: apenas o nome (arquivos na raiz do upload)
+            relative_path = doc.metadata.get("relative_path") or doc.metadata.get("filename")
+            if not relative_path:
+                continue
+            
+            entry = catalog.setdefault(relative_path, {"file_hash": doc.metadata.get("file_hash"), "ids": [], "chunks": {}})
+            entry["ids"].append(docstore_id)
+            if content_hash:
+                entry["chunks"].setdefault(content_hash, docstore_id)
+            # Chunks indexados antes dos hashes: o arquivo é sempre reprocessado
+            if doc.metadata.get("file_hash") != entry["file_hash"]:
+                entry["file_hash"] = None
+        
+        return catalog, chunk_hashes
+    
+    
+    async def _index_chunk_batch(self, texts: List[Document]) -> int:
+        """Gera os embeddings de um lote de chunks e os adiciona ao índice em memória."""
+        vectors = await self._embed_documents(texts)
         
-        return 0
+        def add():
+            if self.vectorstore is None:
+                self.vectorstore = self._create_faiss_from_documents(texts, vectors)
+            else:
+                self.vectorstore.add_embeddings(
+                    [(doc.page_content, vector) for doc, vector in zip(texts, vectors)],
+                    metadatas=[doc.metadata for doc in texts]
+                )
+        
+        await asyncio.to_thread(add)
+        return len(texts)
         
     async def add_text(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
         """
@@ -288,11 +430,15 @@ class RAGServiceFAISS:
         # Criar documentos com os chunks
         documents = [Document(page_content=chunk, metadata=metadata) for chunk in chunks]
         
-        # Adicionar documentos ao vectorstore
+        # Adicionar documentos ao vectorstore (embeddings gerados em lote)
+        vectors = await self._embed_documents(documents)
         if self.vectorstore is None:
-            self.vectorstore = FAISS.from_documents(documents, self.embeddings)
+            self.vectorstore = self._create_faiss_from_documents(documents, vectors)
         else:
-            self.vectorstore = self.vectorstore.add_documents(documents)
+            self.vectorstore.add_embeddings(
+                [(doc.page_content, vector) for doc, vector in zip(documents, vectors)],
+                metadatas=[doc.metadata for doc in documents]
+            )
         
         # Salvar o vectorstore
         self.vectorstore.save_local(self.vector_db_path, "index")
@@ -310,7 +456,7 @@ class RAGServiceFAISS:
         
         # FAISS não suporta filtragem direta como o Chroma
         # Vamos buscar mais resultados e filtrar depois
-        docs_with_scores = self.vectorstore.similarity_search_with_score(question, k=top_k * 3)
+        docs_with_scores = await self.vectorstore.asimilarity_search_with_score(question, k=top_k * 3)
         
         # Filtrar por metadados
         filtered_docs = []
@@ -566,9 +712,10 @@ class RAGServiceFAISS:
         # Salvar alterações
         self.vectorstore.save_local(self.vector_db_path, "index")
         
-    def _safe_add_documents(self, texts):
+    def _safe_add_documents(self, texts, vectors=None):
         """
-        Adiciona documentos ao FAISS de forma segura e salva após a adição
+        Adiciona documentos ao FAISS de forma segura e salva após a adição.
+        Com `vectors`, usa os embeddings já calculados em vez de gerá-los aqui.
         """
         try:
             # Contar documentos antes
@@ -576,7 +723,13 @@ class RAGServiceFAISS:
             print(f"Documentos antes da adição: {doc_count_before}")
             
             # Adicionar documentos
-            self.vectorstore.add_documents(texts)
+            if vectors is not None:
+                self.vectorstore.add_embeddings(
+                    [(doc.page_content, vector) for doc, vector in zip(texts, vectors)],
+                    metadatas=[doc.metadata for doc in texts]
+                )
+            else:
+                self.vectorstore.add_documents(texts)
             
             # Contar documentos depois
             doc_count_after = len(self.vectorstore.docstore._dict.keys())
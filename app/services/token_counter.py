@@ -4,21 +4,60 @@ from datetime import datetime, timedelta
 import uuid
 from typing import Dict, List, Optional, Tuple, Any
 import httpx
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, and_, or_, extract, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.db.models.token_usage import TokenUsageLimit, TokenUsageLog, TokenUsageAlert
+from app.db.models.token_usage import TokenUsageLimit, TokenUsageLog, TokenUsageAlert, TokenUsageHourly, TokenUsageDaily
 from app.db.models.agent import Agent
 from app.db.models.tenant import Tenant
 from app.db.models.llm_model import LLMModel
 from app.services.notification import NotificationService
 from app.core.config import settings
+from app.core.redis import get_redis
+from app.db.session import AsyncSessionLocal
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("app.services.token_counter")
 
+# Prefixo das chaves de contadores de uso no Redis
+TOKEN_COUNTER_PREFIX = "token_usage"
+# TTL dos contadores (segundos) - mantém o período anterior por um tempo para consultas
+TOKEN_COUNTER_TTL = {
+    "daily": 2 * 24 * 3600,
+    "monthly": 35 * 24 * 3600,
+}
+# Tabelas de agregados e granularidade do date_trunc correspondente
+TOKEN_USAGE_ROLLUPS = (
+    (TokenUsageHourly, "hour"),
+    (TokenUsageDaily, "day"),
+)
+ROLLUP_SUM_COLUMNS = ("request_count", "prompt_tokens", "completion_tokens", "total_tokens", "estimated_cost_usd")
+# Provedores aceitos como prefixo em TOKEN_LIMIT_DOWNGRADE_MODEL
+DOWNGRADE_PROVIDERS = ("openai", "gemini", "deepseek")
+
+
+def get_downgrade_model(provider_type: Optional[str]) -> Optional[str]:
+    """
+    Retorna o modelo alternativo configurado em TOKEN_LIMIT_DOWNGRADE_MODEL para o provedor.
+    
+    Entradas sem provedor ("gpt-4o-mini") valem apenas para a OpenAI, para que um
+    nome de modelo de um provedor nunca seja enviado a outro.
+    """
+    for item in settings.TOKEN_LIMIT_DOWNGRADE_MODEL.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        if provider.strip() not in DOWNGRADE_PROVIDERS:
+            # Sem prefixo de provedor (nomes de fine-tuning da OpenAI também contêm ":")
+            provider, model = "openai", item
+        if provider.strip() == provider_type and model.strip():
+            return model.strip()
+    return None
+
 class TokenCounterService:
     """Serviço para contagem, registro e monitoramento de uso de tokens LLM."""
     
@@ -64,81 +103,385 @@ class TokenCounterService:
         # Calcular total de tokens
         total_tokens = prompt_tokens + completion_tokens
         
-        # Obter informações do modelo para estimar custo
-        model_query = self.db.query(LLMModel).filter(LLMModel.id == model_id)
-        model = model_query.first()
-        
-        # Calcular custo estimado
-        cost_per_1k = model.cost_per_1k_tokens if model else 0.0
-        estimated_cost = (total_tokens / 1000) * cost_per_1k
-        
-        # Criar o registro de uso
-        usage_log = TokenUsageLog(
-            id=uuid.uuid4(),
-            tenant_id=tenant_id,
-            agent_id=agent_id,
-            conversation_id=conversation_id,
-            model_id=model_id,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=total_tokens,
-            estimated_cost_usd=estimated_cost,
-            timestamp=datetime.utcnow()
-        )
+        # Gravação pela sessão assíncrona para não bloquear o event loop
+        async with AsyncSessionLocal() as session:
+            # Obter informações do modelo para estimar custo
+            model = await session.get(LLMModel, model_id)
+            
+            # Calcular custo estimado
+            cost_per_1k = model.cost_per_1k_tokens if model else 0.0
+            estimated_cost = (total_tokens / 1000) * cost_per_1k
+            
+            # Criar o registro de uso
+            usage_log = TokenUsageLog(
+                id=uuid.uuid4(),
+                tenant_id=tenant_id,
+                agent_id=agent_id if isinstance(agent_id, uuid.UUID) else uuid.UUID(str(agent_id)),
+                conversation_id=conversation_id,
+                model_id=model_id,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=total_tokens,
+                estimated_cost_usd=estimated_cost,
+                timestamp=datetime.utcnow()
+            )
+            
+            session.add(usage_log)
+            # Atualizar os agregados na mesma transação do log
+            for stmt in self._build_rollup_upserts(usage_log):
+                await session.execute(stmt)
+            await session.commit()
         
-        self.db.add(usage_log)
-        self.db.commit()
-        self.db.refresh(usage_log)
+        # Atualizar contadores de uso no Redis
+        await self._increment_usage_counters(tenant_id, agent_id, total_tokens, usage_log.timestamp)
         
         # Verificar limites após registrar o uso
         asyncio.create_task(self.check_token_limits(tenant_id, agent_id))
         
         return usage_log
     
-    async def check_token_limits(self, tenant_id: int, agent_id: str = None):
-        """Verifica se os limites de uso de tokens foram atingidos."""
-        # Obter a data atual
+    # ---- Agregados horários/diários ----
+    
+    def _build_rollup_upserts(self, usage_log: TokenUsageLog) -> list:
+        """Monta os INSERT ... ON CONFLICT que somam o registro nos agregados horário e diário."""
+        values = {
+            "tenant_id": usage_log.tenant_id,
+            "agent_id": usage_log.agent_id,
+            "model_id": usage_log.model_id,
+            "request_count": 1,
+            "prompt_tokens": usage_log.prompt_tokens,
+            "completion_tokens": usage_log.completion_tokens,
+            "total_tokens": usage_log.total_tokens,
+            "estimated_cost_usd": usage_log.estimated_cost_usd or 0.0,
+            "updated_at": datetime.utcnow()
+        }
+        
+        statements = []
+        for rollup_model, granularity in TOKEN_USAGE_ROLLUPS:
+            if granularity == "hour":
+                period_start = usage_log.timestamp.replace(minute=0, second=0, microsecond=0)
+            else:
+                period_start = usage_log.timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+            
+            stmt = pg_insert(rollup_model).values(period_start=period_start, **values)
+            table = rollup_model.__table__
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["tenant_id", "agent_id", "model_id", "period_start"],
+                set_={
+                    **{col: table.c[col] + stmt.excluded[col] for col in ROLLUP_SUM_COLUMNS},
+                    "updated_at": stmt.excluded.updated_at
+                }
+            )
+            statements.append(stmt)
+        
+        return statements
+    
+    def backfill_usage_rollups(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Recalcula os agregados a partir de token_usage_logs no intervalo [start_date, end_date).
+        Os buckets do intervalo são sobrescritos, então a operação pode ser repetida com segurança.
+        
+        Returns:
+            Número de buckets gravados por tabela
+        """
+        end_date = end_date or datetime.utcnow()
+        
+        results = {}
+        for rollup_model, granularity in TOKEN_USAGE_ROLLUPS:
+            bucket = func.date_trunc(granularity, TokenUsageLog.timestamp)
+            source = select(
+                TokenUsageLog.tenant_id,
+                TokenUsageLog.agent_id,
+                TokenUsageLog.model_id,
+                bucket,
+                func.count(TokenUsageLog.id),
+                func.sum(TokenUsageLog.prompt_tokens),
+                func.sum(TokenUsageLog.completion_tokens),
+                func.sum(TokenUsageLog.total_tokens),
+                func.coalesce(func.sum(TokenUsageLog.estimated_cost_usd), 0.0),
+                func.now()
+            ).where(
+                TokenUsageLog.timestamp < end_date
+            ).group_by(
+                TokenUsageLog.tenant_id, TokenUsageLog.agent_id, TokenUsageLog.model_id, bucket
+            )
+            
+            if start_date:
+                # Alinhar ao início do dia para não gravar buckets parciais
+                start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+                source = source.where(TokenUsageLog.timestamp >= start)
+            
+            stmt = pg_insert(rollup_model).from_select(
+                ["tenant_id", "agent_id", "model_id", "period_start", *ROLLUP_SUM_COLUMNS, "updated_at"],
+                source
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["tenant_id", "agent_id", "model_id", "period_start"],
+                set_={
+                    **{col: stmt.excluded[col] for col in ROLLUP_SUM_COLUMNS},
+                    "updated_at": stmt.excluded.updated_at
+                }
+            )
+            
+            result = self.db.execute(stmt)
+            results[rollup_model.__tablename__] = result.rowcount
+        
+        self.db.commit()
+        logger.info(f"Backfill dos agregados de tokens concluído: {results}")
+        return results
+    
+    # ---- Contadores de uso no Redis ----
+    
+    def _period_bucket(self, period: str, when: datetime) -> str:
+        """Retorna o identificador do período (dia ou mês) para as chaves de contador."""
+        return when.strftime("%Y%m%d") if period == "daily" else when.strftime("%Y%m")
+    
+    def _counter_key(self, tenant_id: int, agent_id: Optional[str], period: str, when: datetime) -> str:
+        """Monta a chave do contador para o tenant (agent_id=None) ou para o agente."""
+        scope = f"agent:{agent_id}" if agent_id else f"tenant:{tenant_id}"
+        return f"{TOKEN_COUNTER_PREFIX}:{scope}:{period}:{self._period_bucket(period, when)}"
+    
+    def _period_range(self, period: str, when: datetime) -> Tuple[datetime, datetime]:
+        """Retorna o intervalo [início, fim) do período que contém `when`."""
+        if period == "daily":
+            start = when.replace(hour=0, minute=0, second=0, microsecond=0)
+            return start, start + timedelta(days=1)
+        
+        start = when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start.month == 12:
+            end = start.replace(year=start.year + 1, month=1)
+        else:
+            end = start.replace(month=start.month + 1)
+        return start, end
+    
+    async def _sum_usage_from_db(self, tenant_id: int, agent_id: Optional[str], period: str, when: datetime) -> int:
+        """Soma o uso de tokens do período a partir do agregado diário no Postgres."""
+        start, end = self._period_range(period, when)
+        query = select(func.sum(TokenUsageDaily.total_tokens)).where(
+            TokenUsageDaily.tenant_id == tenant_id,
+            TokenUsageDaily.period_start >= start,
+            TokenUsageDaily.period_start < end
+        )
+        if agent_id:
+            query = query.where(TokenUsageDaily.agent_id == agent_id)
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            return int(result.scalar() or 0)
+    
+    async def _increment_usage_counters(self, tenant_id: int, agent_id: Optional[str], total_tokens: int, when: datetime = None):
+        """Incrementa atomicamente os contadores diário/mensal do tenant e do agente."""
+        when = when or datetime.utcnow()
+        scopes = [None, str(agent_id)] if agent_id else [None]
+        
+        try:
+            redis_client = await get_redis()
+            keys = []
+            pipe = redis_client.pipeline(transaction=True)
+            for scope_agent in scopes:
+                for period, ttl in TOKEN_COUNTER_TTL.items():
+                    key = self._counter_key(tenant_id, scope_agent, period, when)
+                    keys.append((key, scope_agent, period))
+                    pipe.incrby(key, total_tokens)
+                    pipe.expire(key, ttl)
+            results = await pipe.execute()
+            
+            # Contador recém-criado (ex.: Redis reiniciado no meio do mês): semear a partir do banco
+            for (key, scope_agent, period), value in zip(keys, results[::2]):
+                if int(value) == total_tokens:
+                    db_total = await self._sum_usage_from_db(tenant_id, scope_agent, period, when)
+                    if db_total > total_tokens:
+                        await redis_client.set(key, db_total, ex=TOKEN_COUNTER_TTL[period])
+        except Exception as e:
+            # Os contadores são reconciliados periodicamente, não interromper o fluxo
+            logger.error(f"Erro ao incrementar contadores de tokens: {e}")
+    
+    async def get_current_usage(self, tenant_id: int, agent_id: Optional[str] = None, period: str = "monthly") -> int:
+        """
+        Obtém o uso do período atual a partir do contador no Redis.
+        Em caso de ausência do contador ou falha no Redis, consulta o banco e semeia o contador.
+        """
+        now = datetime.utcnow()
+        key = self._counter_key(tenant_id, agent_id, period, now)
+        
+        try:
+            redis_client = await get_redis()
+            value = await redis_client.get(key)
+            if value is not None:
+                return int(value)
+        except Exception as e:
+            logger.error(f"Erro ao ler contador de tokens {key}: {e}")
+            return await self._sum_usage_from_db(tenant_id, agent_id, period, now)
+        
+        total = await self._sum_usage_from_db(tenant_id, agent_id, period, now)
+        try:
+            # nx=True para não sobrescrever incrementos concorrentes
+            await redis_client.set(key, total, ex=TOKEN_COUNTER_TTL[period], nx=True)
+        except Exception as e:
+            logger.error(f"Erro ao semear contador de tokens {key}: {e}")
+        
+        return total
+    
+    async def reconcile_usage_counters(self) -> int:
+        """
+        Reconcilia os contadores do Redis com os agregados do Postgres para o dia e mês atuais.
+        As consultas (sessão síncrona) rodam em uma thread para não bloquear o event loop.
+        
+        Returns:
+            Número de contadores atualizados
+        """
         now = datetime.utcnow()
-        current_month = now.month
-        current_year = now.year
-        current_day = now.day
+        counters = await asyncio.to_thread(self._load_usage_counters, now)
         
+        redis_client = await get_redis()
+        pipe = redis_client.pipeline(transaction=False)
+        for key, total, ttl in counters:
+            pipe.set(key, total, ex=ttl)
+        await pipe.execute()
+        
+        logger.info(f"Contadores de tokens reconciliados: {len(counters)}")
+        return len(counters)
+    
+    def _load_usage_counters(self, now: datetime) -> List[Tuple[str, int, int]]:
+        """Totais do dia e do mês atuais por tenant e por agente, como (chave, total, ttl)."""
+        counters = []
+        try:
+            for period, ttl in TOKEN_COUNTER_TTL.items():
+                start, end = self._period_range(period, now)
+                period_filter = and_(TokenUsageDaily.period_start >= start, TokenUsageDaily.period_start < end)
+                
+                tenant_totals = self.db.query(
+                    TokenUsageDaily.tenant_id,
+                    func.sum(TokenUsageDaily.total_tokens)
+                ).filter(period_filter).group_by(TokenUsageDaily.tenant_id).all()
+                
+                agent_totals = self.db.query(
+                    TokenUsageDaily.tenant_id,
+                    TokenUsageDaily.agent_id,
+                    func.sum(TokenUsageDaily.total_tokens)
+                ).filter(period_filter).group_by(TokenUsageDaily.tenant_id, TokenUsageDaily.agent_id).all()
+                
+                for tenant_id, total in tenant_totals:
+                    counters.append((self._counter_key(tenant_id, None, period, now), int(total or 0), ttl))
+                
+                for tenant_id, agent_id, total in agent_totals:
+                    if not agent_id:
+                        continue
+                    counters.append((self._counter_key(tenant_id, str(agent_id), period, now), int(total or 0), ttl))
+        finally:
+            # Liberar a transação de leitura da sessão
+            self.db.rollback()
+        
+        return counters
+    
+    async def get_model_id_by_name(self, model_name: str) -> Optional[int]:
+        """Obtém o ID do LLMModel pelo identificador do modelo (ex.: "gpt-4o-mini")."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(LLMModel.id).where(LLMModel.model_id == model_name).limit(1)
+            )
+            return result.scalar_one_or_none()
+    
+    async def _get_active_limits(self, tenant_id: int, agent_id: Optional[str] = None) -> List[TokenUsageLimit]:
+        """Obtém os limites ativos do tenant e, se informado, do agente."""
+        scope_filter = and_(TokenUsageLimit.tenant_id == tenant_id, TokenUsageLimit.agent_id == None)
+        if agent_id:
+            scope_filter = or_(scope_filter, TokenUsageLimit.agent_id == agent_id)
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(TokenUsageLimit).where(scope_filter, TokenUsageLimit.is_active == True)
+            )
+            return result.scalars().all()
+    
+    async def _get_scope_limits(self, tenant_id: int, agent_id: Optional[str], daily_only: bool = False) -> List[TokenUsageLimit]:
+        """Obtém os limites ativos do agente (se informado) ou apenas os do tenant."""
+        query = select(TokenUsageLimit).where(TokenUsageLimit.is_active == True)
+        if agent_id:
+            query = query.where(TokenUsageLimit.agent_id == agent_id)
+        else:
+            query = query.where(TokenUsageLimit.tenant_id == tenant_id, TokenUsageLimit.agent_id == None)
+        
+        if daily_only:
+            query = query.where(TokenUsageLimit.daily_limit != None)  # Somente limites diários configurados
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            return result.scalars().all()
+    
+    async def check_pre_flight_limits(self, tenant_id: int, agent_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Verifica, antes da chamada ao LLM, se o tenant ou agente já excedeu seus limites.
+        
+        Returns:
+            Dicionário com "allowed", "action" ("allow", "reject" ou "downgrade") e,
+            quando excedido, "limit_type", "current_usage", "max_limit" e "agent_id"
+        """
+        result = {"allowed": True, "action": "allow"}
+        
+        mode = settings.TOKEN_LIMIT_ENFORCEMENT
+        if mode not in ("reject", "downgrade"):
+            return result
+        
+        try:
+            limits = await self._get_active_limits(tenant_id, agent_id)
+            
+            for limit in limits:
+                scope_agent = str(limit.agent_id) if limit.agent_id else None
+                
+                for period, max_limit in (("daily", limit.daily_limit), ("monthly", limit.monthly_limit)):
+                    if not max_limit:
+                        continue
+                    
+                    current_usage = await self.get_current_usage(tenant_id, scope_agent, period)
+                    if current_usage >= max_limit:
+                        # Sem modelo alternativo configurado, downgrade equivale a rejeitar
+                        action = mode
+                        if mode == "downgrade" and not settings.TOKEN_LIMIT_DOWNGRADE_MODEL:
+                            action = "reject"
+                        
+                        logger.warning(
+                            f"Limite {period} de tokens excedido para tenant {tenant_id}"
+                            f"{f' / agente {scope_agent}' if scope_agent else ''}: "
+                            f"{current_usage}/{max_limit} - ação: {action}"
+                        )
+                        return {
+                            "allowed": action != "reject",
+                            "action": action,
+                            "limit_type": period,
+                            "current_usage": current_usage,
+                            "max_limit": max_limit,
+                            "agent_id": scope_agent
+                        }
+        except Exception as e:
+            # Em caso de falha, não bloquear o atendimento
+            logger.error(f"Erro na verificação prévia de limites de tokens: {e}")
+        
+        return result
+    
+    async def check_token_limits(self, tenant_id: int, agent_id: str = None):
+        """Verifica se os limites de uso de tokens foram atingidos."""
         # 1. Verificar limites mensais
-        await self._check_monthly_limits(tenant_id, agent_id, current_year, current_month)
+        await self._check_monthly_limits(tenant_id, agent_id)
         
         # 2. Verificar limites diários (se configurados)
-        await self._check_daily_limits(tenant_id, agent_id, current_year, current_month, current_day)
+        await self._check_daily_limits(tenant_id, agent_id)
         
-    async def _check_monthly_limits(self, tenant_id: int, agent_id: str, year: int, month: int):
+        # 3. Limites do tenant também se aplicam ao uso do agente
+        if agent_id:
+            await self._check_monthly_limits(tenant_id, None)
+            await self._check_daily_limits(tenant_id, None)
+        
+    async def _check_monthly_limits(self, tenant_id: int, agent_id: str):
         """Verifica limites mensais de uso de tokens."""
-        # Construir consulta para obter total de tokens usados no mês
-        query = self.db.query(func.sum(TokenUsageLog.total_tokens).label("total_tokens"))
-        query = query.filter(
-            TokenUsageLog.tenant_id == tenant_id,
-            extract('year', TokenUsageLog.timestamp) == year,
-            extract('month', TokenUsageLog.timestamp) == month
-        )
+        # Obter limites específicos do agente ou do tenant
+        limits = await self._get_scope_limits(tenant_id, agent_id)
         
-        # Se agent_id for especificado, filtrar por agente
-        if agent_id:
-            query = query.filter(TokenUsageLog.agent_id == agent_id)
-            
-            # Obter limites específicos do agente
-            limits = self.db.query(TokenUsageLimit).filter(
-                TokenUsageLimit.agent_id == agent_id,
-                TokenUsageLimit.is_active == True
-            ).all()
-        else:
-            # Obter limites do tenant
-            limits = self.db.query(TokenUsageLimit).filter(
-                TokenUsageLimit.tenant_id == tenant_id,
-                TokenUsageLimit.agent_id == None,
-                TokenUsageLimit.is_active == True
-            ).all()
+        if not any(limit.monthly_limit for limit in limits):
+            return
         
-        # Obter total de tokens usados
-        result = query.first()
-        total_used = result.total_tokens if result and result.total_tokens else 0
+        # Obter total de tokens usados no mês (contador no Redis)
+        total_used = await self.get_current_usage(tenant_id, agent_id, "monthly")
         
         # Verificar cada limite configurado
         for limit in limits:
@@ -158,34 +501,14 @@ class TokenCounterService:
                         notification_target=limit.notify_email or limit.notify_webhook_url
                     )
     
-    async def _check_daily_limits(self, tenant_id: int, agent_id: str, year: int, month: int, day: int):
+    async def _check_daily_limits(self, tenant_id: int, agent_id: str):
         """Verifica limites diários de uso de tokens."""
-        # Semelhante ao _check_monthly_limits, mas filtrando por dia
-        query = self.db.query(func.sum(TokenUsageLog.total_tokens).label("total_tokens"))
-        query = query.filter(
-            TokenUsageLog.tenant_id == tenant_id,
-            extract('year', TokenUsageLog.timestamp) == year,
-            extract('month', TokenUsageLog.timestamp) == month,
-            extract('day', TokenUsageLog.timestamp) == day
-        )
+        limits = await self._get_scope_limits(tenant_id, agent_id, daily_only=True)
         
-        if agent_id:
-            query = query.filter(TokenUsageLog.agent_id == agent_id)
-            limits = self.db.query(TokenUsageLimit).filter(
-                TokenUsageLimit.agent_id == agent_id,
-                TokenUsageLimit.is_active == True,
-                TokenUsageLimit.daily_limit != None  # Somente limites diários configurados
-            ).all()
-        else:
-            limits = self.db.query(TokenUsageLimit).filter(
-                TokenUsageLimit.tenant_id == tenant_id,
-                TokenUsageLimit.agent_id == None,
-                TokenUsageLimit.is_active == True,
-                TokenUsageLimit.daily_limit != None  # Somente limites diários configurados
-            ).all()
+        if not limits:
+            return
         
-        result = query.first()
-        total_used = result.total_tokens if result and result.total_tokens else 0
+        total_used = await self.get_current_usage(tenant_id, agent_id, "daily")
         
         for limit in limits:
             if limit.daily_limit and total_used > 0:
@@ -218,45 +541,47 @@ class TokenCounterService:
         # Verificar se já existe um alerta recente (últimas 24 horas)
         yesterday = datetime.utcnow() - timedelta(days=1)
         
-        query = self.db.query(TokenUsageAlert).filter(
+        query = select(TokenUsageAlert).where(
             TokenUsageAlert.tenant_id == tenant_id,
             TokenUsageAlert.limit_type == limit_type,
             TokenUsageAlert.created_at >= yesterday
         )
         
         if agent_id:
-            query = query.filter(TokenUsageAlert.agent_id == agent_id)
+            query = query.where(TokenUsageAlert.agent_id == agent_id)
         else:
-            query = query.filter(TokenUsageAlert.agent_id == None)
-        
-        existing_alert = query.order_by(TokenUsageAlert.created_at.desc()).first()
+            query = query.where(TokenUsageAlert.agent_id == None)
         
-        # Se já existir um alerta recente, atualizar apenas se o uso aumentou significativamente
-        if existing_alert:
-            # Só cria um novo alerta se o uso aumentou pelo menos 5%
-            usage_increase = (current_usage - existing_alert.current_usage) / max_limit
+        # Sessões assíncronas curtas: nenhuma conexão fica presa durante o envio da notificação
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query.order_by(TokenUsageAlert.created_at.desc()).limit(1))
+            existing_alert = result.scalar_one_or_none()
             
-            if usage_increase < 0.05:
-                return existing_alert
-        
-        # Criar novo alerta
-        alert = TokenUsageAlert(
-            id=uuid.uuid4(),
-            tenant_id=tenant_id,
-            agent_id=agent_id,
-            limit_type=limit_type,
-            threshold_value=threshold_value,
-            current_usage=current_usage,
-            max_limit=max_limit,
-            notification_channel=notification_channel,
-            notification_target=notification_target,
-            notification_sent=False,
-            created_at=datetime.utcnow()
-        )
-        
-        self.db.add(alert)
-        self.db.commit()
-        self.db.refresh(alert)
+            # Se já existir um alerta recente, atualizar apenas se o uso aumentou significativamente
+            if existing_alert:
+                # Só cria um novo alerta se o uso aumentou pelo menos 5%
+                usage_increase = (current_usage - existing_alert.current_usage) / max_limit
+                
+                if usage_increase < 0.05:
+                    return existing_alert
+            
+            # Criar novo alerta
+            alert = TokenUsageAlert(
+                id=uuid.uuid4(),
+                tenant_id=tenant_id,
+                agent_id=agent_id,
+                limit_type=limit_type,
+                threshold_value=threshold_value,
+                current_usage=current_usage,
+                max_limit=max_limit,
+                notification_channel=notification_channel,
+                notification_target=notification_target,
+                notification_sent=False,
+                created_at=datetime.utcnow()
+            )
+            
+            session.add(alert)
+            await session.commit()
         
         # Enviar notificação
         if notification_channel and notification_target:
@@ -268,7 +593,11 @@ class TokenCounterService:
             
             if success:
                 alert.notification_sent = True
-                self.db.commit()
+                async with AsyncSessionLocal() as session:
+                    await session.execute(
+                        update(TokenUsageAlert).where(TokenUsageAlert.id == alert.id).values(notification_sent=True)
+                    )
+                    await session.commit()
         
         return alert
     
@@ -276,56 +605,67 @@ class TokenCounterService:
         self,
         tenant_id: Optional[int] = None,
         agent_id: Optional[str] = None,
-        period: str = "monthly",  # "daily", "monthly", "yearly"
+        period: str = "monthly",  # "hourly", "daily", "monthly", "yearly"
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> List[Dict[str, Any]]:
         """
         Obtém um resumo do uso de tokens para um tenant ou agente específico.
+        Lê apenas os agregados (token_usage_hourly / token_usage_daily).
         """
         # Determinar datas de início e fim se não forem fornecidas
         if not end_date:
             end_date = datetime.utcnow()
         
         if not start_date:
-            if period == "daily":
+            if period == "hourly":
+                start_date = end_date - timedelta(days=2)  # Últimas 48 horas
+            elif period == "daily":
                 start_date = end_date - timedelta(days=30)  # Últimos 30 dias
             elif period == "monthly":
                 start_date = end_date - timedelta(days=365)  # Últimos 12 meses
             else:  # yearly
                 start_date = end_date - timedelta(days=365 * 3)  # Últimos 3 anos
         
-        # Configurar agrupamento com base no período
-        if period == "daily":
-            # Agrupar por dia
-            date_group = func.date_trunc('day', TokenUsageLog.timestamp)
-            date_format = "%Y-%m-%d"
-        elif period == "monthly":
-            # Agrupar por mês
-            date_group = func.date_trunc('month', TokenUsageLog.timestamp)
-            date_format = "%Y-%m"
-        else:  # yearly
-            # Agrupar por ano
-            date_group = func.date_trunc('year', TokenUsageLog.timestamp)
-            date_format = "%Y"
+        # Configurar agregado e agrupamento com base no período
+        if period == "hourly":
+            rollup = TokenUsageHourly
+            date_group = rollup.period_start
+            date_format = "%Y-%m-%d %H:00"
+            start_date = start_date.replace(minute=0, second=0, microsecond=0)
+        else:
+            rollup = TokenUsageDaily
+            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            if period == "daily":
+                # Agrupar por dia
+                date_group = rollup.period_start
+                date_format = "%Y-%m-%d"
+            elif period == "monthly":
+                # Agrupar por mês
+                date_group = func.date_trunc('month', rollup.period_start)
+                date_format = "%Y-%m"
+            else:  # yearly
+                # Agrupar por ano
+                date_group = func.date_trunc('year', rollup.period_start)
+                date_format = "%Y"
         
         # Construir consulta base
         query = self.db.query(
             date_group.label("period_date"),
-            func.sum(TokenUsageLog.prompt_tokens).label("prompt_tokens"),
-            func.sum(TokenUsageLog.completion_tokens).label("completion_tokens"),
-            func.sum(TokenUsageLog.total_tokens).label("total_tokens"),
-            func.sum(TokenUsageLog.estimated_cost_usd).label("total_cost")
+            func.sum(rollup.prompt_tokens).label("prompt_tokens"),
+            func.sum(rollup.completion_tokens).label("completion_tokens"),
+            func.sum(rollup.total_tokens).label("total_tokens"),
+            func.sum(rollup.estimated_cost_usd).label("total_cost")
         ).filter(
-            TokenUsageLog.timestamp.between(start_date, end_date)
+            rollup.period_start.between(start_date, end_date)
         )
         
         # Filtrar por tenant e/ou agente
         if tenant_id:
-            query = query.filter(TokenUsageLog.tenant_id == tenant_id)
+            query = query.filter(rollup.tenant_id == tenant_id)
         
         if agent_id:
-            query = query.filter(TokenUsageLog.agent_id == agent_id)
+            query = query.filter(rollup.agent_id == agent_id)
         
         # Agrupar e ordenar
         query = query.group_by(date_group).order_by(date_group)
@@ -351,7 +691,7 @@ class TokenCounterService:
             if limit:
                 if period == "daily":
                     limit_value = limit.daily_limit
-                else:
+                elif period != "hourly":
                     limit_value = limit.monthly_limit
         
         # Formatar resultados
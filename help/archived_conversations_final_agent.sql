@@ -0,0 +1,19 @@
+-- Agente final da conversa arquivada (usado na distribuição por agente do dashboard)
+ALTER TABLE archived_conversations ADD COLUMN IF NOT EXISTS final_agent_id VARCHAR;
+
+CREATE INDEX IF NOT EXISTS ix_archived_conversations_final_agent_id ON archived_conversations (final_agent_id);
+CREATE INDEX IF NOT EXISTS idx_archived_conversations_tenant_archived_at ON archived_conversations (tenant_id, archived_at);
+
+-- Preencher conversas já arquivadas com o último agente que respondeu no histórico
+UPDATE archived_conversations ac
+SET final_agent_id = COALESCE(
+    (
+        SELECT h.elem->>'agent_id'
+        FROM jsonb_array_elements(ac.history) WITH ORDINALITY AS h(elem, idx)
+        WHERE h.elem->>'role' = 'assistant' AND h.elem ? 'agent_id'
+        ORDER BY h.idx DESC
+        LIMIT 1
+    ),
+    ac.meta_data->>'current_agent_id'
+)
+WHERE ac.final_agent_id IS NULL;
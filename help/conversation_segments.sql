@@ -0,0 +1,20 @@
+-- Armazenamento frio dos trechos de histórico removidos pela compactação de conversas
+-- (SystemConfig.history_compaction_enabled). A transcrição completa de uma conversa é
+-- a concatenação dos segmentos (por segment_index) seguida do histórico arquivado.
+
+CREATE TABLE IF NOT EXISTS conversation_segments (
+    id SERIAL PRIMARY KEY,
+    conversation_id VARCHAR NOT NULL,
+    tenant_id VARCHAR NOT NULL,
+    user_id VARCHAR NOT NULL,
+    segment_index INTEGER NOT NULL,
+    messages JSONB NOT NULL,
+    message_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT uq_conversation_segments_index UNIQUE (conversation_id, segment_index)
+);
+
+CREATE INDEX IF NOT EXISTS ix_conversation_segments_conversation_id ON conversation_segments (conversation_id);
+CREATE INDEX IF NOT EXISTS ix_conversation_segments_tenant_id ON conversation_segments (tenant_id);
+CREATE INDEX IF NOT EXISTS ix_conversation_segments_user_id ON conversation_segments (user_id);
@@ -0,0 +1,21 @@
+-- Resumos de conversas gerados pelo MemoryService (um registro por conversa, atualizado a
+-- cada resumo incremental). Gravados em lote pelo ConversationArchiveWriter.
+
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    id SERIAL PRIMARY KEY,
+    conversation_id VARCHAR NOT NULL,
+    tenant_id VARCHAR NOT NULL,
+    user_id VARCHAR NOT NULL,
+    brief_summary TEXT NOT NULL,
+    detailed_summary TEXT,
+    key_points JSONB,
+    entities JSONB,
+    sentiment VARCHAR,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT uq_conversation_summaries_conversation_id UNIQUE (conversation_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_conversation_summaries_tenant_user_created
+    ON conversation_summaries (tenant_id, user_id, created_at);
@@ -0,0 +1,45 @@
+-- Agregados de uso de tokens (horário e diário)
+-- Mantidos incrementalmente por TokenCounterService.log_token_usage (INSERT ... ON CONFLICT).
+-- Após criar as tabelas, popular o histórico com:
+--   python -m app.db.backfill_token_rollups
+
+CREATE TABLE IF NOT EXISTS token_usage_hourly (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    agent_id UUID NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    model_id INTEGER NOT NULL REFERENCES llm_models(id) ON DELETE CASCADE,
+    period_start TIMESTAMP NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    estimated_cost_usd FLOAT DEFAULT 0.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT uq_token_usage_hourly_bucket UNIQUE (tenant_id, agent_id, model_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS ix_token_usage_hourly_id ON token_usage_hourly (id);
+CREATE INDEX IF NOT EXISTS idx_token_usage_hourly_tenant_period ON token_usage_hourly (tenant_id, period_start);
+
+---
+
+CREATE TABLE IF NOT EXISTS token_usage_daily (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    agent_id UUID NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    model_id INTEGER NOT NULL REFERENCES llm_models(id) ON DELETE CASCADE,
+    period_start TIMESTAMP NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    estimated_cost_usd FLOAT DEFAULT 0.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT uq_token_usage_daily_bucket UNIQUE (tenant_id, agent_id, model_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS ix_token_usage_daily_id ON token_usage_daily (id);
+CREATE INDEX IF NOT EXISTS idx_token_usage_daily_tenant_period ON token_usage_daily (tenant_id, period_start);
+CREATE INDEX IF NOT EXISTS idx_token_usage_daily_agent_period ON token_usage_daily (agent_id, period_start);
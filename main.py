@@ -1,4 +1,5 @@
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -12,6 +13,8 @@ from app.api.router import api_router
 from app.core.config import settings
 
 from app.core.redis import init_redis_pool, close_redis_connections
+from app.services.archive_writer import get_archive_writer, stop_archive_writer
+from app.services.memory_index_store import acquire_storage_lock, get_memory_index_store
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -24,15 +27,45 @@ os.makedirs(settings.MEMORY_DB_PATH, exist_ok=True)
 
 @app.on_event("startup")
 async def startup_db_client():
+    # Índices de memória com write-behind: um único processo por diretório (ver MemoryIndexStore)
+    from app.services.config import load_system_config
+    memory_storage_path = load_system_config().memory.memory_db_path or settings.MEMORY_DB_PATH
+    app.state.memory_storage_lock = acquire_storage_lock(memory_storage_path)
+    if app.state.memory_storage_lock is None:
+        raise RuntimeError(
+            f"Diretório de memórias {memory_storage_path} em uso por outro processo "
+            "(outro worker da API ou um comando de manutenção)"
+        )
+    
     await init_redis_pool()
-    # Criar uma sessão global para serviços
-    from sqlalchemy.orm import sessionmaker
-    from app.db.session import engine
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     
-    # Criar instância global do TokenCounterService 
-    # (opcional, mas pode ser útil para processos assíncronos)
-    app.state.token_counter = TokenCounterService(SessionLocal())
+    # Pool de processos de indexação de documentos (encerrado no shutdown)
+    from app.services.rag_faiss import get_ingest_pool
+    get_ingest_pool()
+    
+    # Writer de arquivamento de conversas em segundo plano
+    get_archive_writer().start()
+    
+    # Reconciliação periódica dos contadores de tokens (Redis x Postgres)
+    app.state.token_counter_reconcile_task = asyncio.create_task(
+        reconcile_token_counters_periodically(settings.TOKEN_COUNTER_RECONCILE_INTERVAL)
+    )
+    
+    # Gravação periódica dos índices de memória (write-behind)
+    app.state.memory_index_flush_task = asyncio.create_task(
+        flush_memory_indices_periodically(settings.MEMORY_FLUSH_INTERVAL)
+    )
+    
+    # Expiração e compactação periódica dos índices de memória
+    app.state.memory_cleanup_task = asyncio.create_task(
+        clean_memory_indices_periodically(settings.MEMORY_CLEANUP_INTERVAL)
+    )
+    
+    # Extração de memórias em lote (fila processada na janela de baixa demanda)
+    if settings.MEMORY_EXTRACTION_WORKER_ENABLED:
+        app.state.memory_extraction_task = asyncio.create_task(
+            extract_memories_periodically(settings.MEMORY_EXTRACTION_INTERVAL)
+        )
     
     import logging
     logger = logging.getLogger("main")
@@ -41,10 +74,90 @@ async def startup_db_client():
     logger.info(f"🔍 Health check básico em: /api/v1/health")
     logger.info(f"💾 Health check database em: /api/v1/health/database")
 
+async def reconcile_token_counters_periodically(interval: int):
+    """Reconcilia os contadores de uso de tokens do Redis com o banco a cada `interval` segundos."""
+    import logging
+    logger = logging.getLogger("main")
+    from app.db.session import worker_session
+    
+    while True:
+        try:
+            # Sessão própria por iteração, do pool de jobs em segundo plano
+            with worker_session() as db:
+                await TokenCounterService(db).reconcile_usage_counters()
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar contadores de tokens: {e}")
+        
+        await asyncio.sleep(interval)
+
+async def flush_memory_indices_periodically(interval: float):
+    """Grava em disco os índices de memória com pendências a cada `interval` segundos."""
+    import logging
+    logger = logging.getLogger("main")
+    
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(get_memory_index_store().flush_due)
+        except Exception as e:
+            logger.error(f"Erro ao gravar índices de memória: {e}")
+
+async def clean_memory_indices_periodically(interval: int):
+    """Expira memórias antigas e compacta os índices FAISS a cada `interval` segundos."""
+    import logging
+    logger = logging.getLogger("main")
+    from app.db.compact_memory_indices import compact_memory_indices
+    
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await compact_memory_indices()
+            reclaimed = sum(item["reclaimed"] for item in report.values())
+            logger.info(f"Manutenção dos índices de memória concluída: {reclaimed} vetores removidos")
+        except Exception as e:
+            logger.error(f"Erro na manutenção dos índices de memória: {e}")
+
+async def extract_memories_periodically(interval: int):
+    """Processa a fila de extração de memórias a cada `interval` segundos."""
+    import logging
+    logger = logging.getLogger("main")
+    from app.services.memory_extraction import get_memory_extraction_queue
+    
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await get_memory_extraction_queue().drain()
+        except Exception as e:
+            logger.error(f"Erro na extração de memórias em lote: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task_name in ("token_counter_reconcile_task", "memory_index_flush_task", "memory_cleanup_task", "memory_extraction_task"):
+        task = getattr(app.state, task_name, None)
+        if task:
+            task.cancel()
+    
+    # Gravar memórias ainda pendentes nos índices FAISS
+    await asyncio.to_thread(get_memory_index_store().flush_all)
+    
+    # Gravar conversas ainda na fila de arquivamento
+    await asyncio.to_thread(stop_archive_writer)
+    
+    # Encerrar o pool de processos de indexação de documentos
+    from app.services.rag_faiss import shutdown_ingest_pool
+    shutdown_ingest_pool()
+    
     await close_redis_connections()
     
+    # Liberar o diretório de memórias para os comandos de manutenção
+    storage_lock = getattr(app.state, "memory_storage_lock", None)
+    if storage_lock:
+        storage_lock.close()
+    
+    # Fechar conexões do engine assíncrono
+    from app.db.session import async_engine
+    await async_engine.dispose()
+    
     import logging
     logger = logging.getLogger("main")
     logger.info("🛑 Aplicação finalizada")
@@ -0,0 +1,139 @@
+# scripts/bench_memory_fallback.py
+"""
+Micro-benchmark da busca no fallback de memórias em memória.
+
+Compara, para 10k e 100k memórias, a busca do FallbackMemoryIndex (matriz float32
+por usuário, um produto matriz-vetor + argpartition) com a varredura linear
+anterior: filtrar a lista de memórias por tenant/usuário e calcular
+`MemoryService._calculate_similarity` entrada a entrada, ordenando o resultado.
+
+Os embeddings são aleatórios (mesma semente para os dois caminhos) e o top-k dos
+dois caminhos é conferido antes da medição.
+
+Uso:
+    python -m scripts.bench_memory_fallback --sizes 10000 100000 --dimensions 128
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.memory import MemoryEntry, MemoryService, MemoryType
+from app.services.memory_fallback import FallbackMemoryIndex
+
+TENANT_ID = "1"
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _build_entries(size: int, dimensions: int, users: int, seed: int) -> List[MemoryEntry]:
+    vectors = np.random.default_rng(seed).standard_normal((size, dimensions), dtype=np.float32)
+    return [
+        MemoryEntry(
+            id=str(position),
+            tenant_id=TENANT_ID,
+            user_id=f"user-{position % users}",
+            type=MemoryType.FACT,
+            content=f"memória {position}",
+            embedding=vectors[position].tolist()
+        )
+        for position in range(size)
+    ]
+
+
+def _linear_scan(entries: List[MemoryEntry], user_id: str, query: List[float], limit: int) -> List[MemoryEntry]:
+    """Caminho anterior do recall_memories: filtro + _calculate_similarity por entrada."""
+    filtered_entries = [
+        entry for entry in entries
+        if entry.tenant_id == TENANT_ID and entry.user_id == user_id
+    ]
+    
+    entries_with_scores = []
+    for entry in filtered_entries:
+        if entry.embedding:
+            similarity = MemoryService._calculate_similarity(None, query, entry.embedding)
+            entries_with_scores.append((entry, similarity))
+    
+    entries_with_scores.sort(key=lambda x: x[1], reverse=True)
+    return [entry for entry, _ in entries_with_scores[:limit]]
+
+
+def _measure(search, queries: List[List[float]]) -> List[float]:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_size(size: int, dimensions: int, users: int, limit: int, queries: int, seed: int) -> Dict[str, float]:
+    """Mede as duas buscas para `size` memórias e retorna as latências (ms) e o ganho."""
+    entries = _build_entries(size, dimensions, users, seed)
+    
+    index = FallbackMemoryIndex()
+    for entry in entries:
+        # O índice descarta a lista de floats da entrada: guardar uma cópia para a varredura linear
+        index.add(entry.model_copy())
+    
+    user_id = "user-0"
+    query_vectors = np.random.default_rng(seed + 1).standard_normal((queries, dimensions), dtype=np.float32).tolist()
+    
+    def indexed(query):
+        return index.search(TENANT_ID, user_id, query, limit=limit)
+    
+    def linear(query):
+        return _linear_scan(entries, user_id, query, limit)
+    
+    # Os dois caminhos devem retornar as mesmas memórias
+    expected = [entry.id for entry in linear(query_vectors[0])]
+    found = [entry.id for entry, _ in indexed(query_vectors[0])]
+    if found != expected:
+        raise AssertionError(f"Top-{limit} diferente entre os caminhos: {found} != {expected}")
+    
+    linear_samples = _measure(linear, query_vectors)
+    indexed_samples = _measure(indexed, query_vectors)
+    
+    return {
+        "size": size,
+        "linear_p50_ms": _percentile(linear_samples, 50) * 1000,
+        "linear_p95_ms": _percentile(linear_samples, 95) * 1000,
+        "indexed_p50_ms": _percentile(indexed_samples, 50) * 1000,
+        "indexed_p95_ms": _percentile(indexed_samples, 95) * 1000,
+        "speedup": _percentile(linear_samples, 50) / max(_percentile(indexed_samples, 50), 1e-9),
+        "index_mb": index.stats()["bytes"] / (1024 * 1024)
+    }
+
+
+def main(args) -> None:
+    results = [
+        run_size(size, args.dimensions, args.users, args.limit, args.queries, args.seed)
+        for size in args.sizes
+    ]
+    
+    print(f"\n{args.dimensions} dimensões, {args.users} usuário(s), top-{args.limit}, {args.queries} consultas por tamanho")
+    print(f"{'memórias':>10}{'linear p50':>12}{'linear p95':>12}{'índice p50':>12}{'índice p95':>12}{'ganho':>9}{'matriz MB':>11}")
+    for result in results:
+        print(
+            f"{result['size']:>10}{result['linear_p50_ms']:>12.2f}{result['linear_p95_ms']:>12.2f}"
+            f"{result['indexed_p50_ms']:>12.3f}{result['indexed_p95_ms']:>12.3f}"
+            f"{result['speedup']:>8.0f}x{result['index_mb']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Busca no fallback de memórias: FallbackMemoryIndex x varredura linear")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Número de memórias por cenário")
+    parser.add_argument("--dimensions", type=int, default=128, help="Dimensão dos embeddings")
+    parser.add_argument("--users", type=int, default=1, help="Usuários do tenant (a busca é feita para um deles)")
+    parser.add_argument("--limit", type=int, default=5, help="Memórias retornadas por busca")
+    parser.add_argument("--queries", type=int, default=10, help="Consultas medidas por tamanho")
+    parser.add_argument("--seed", type=int, default=42, help="Semente dos embeddings aleatórios")
+    main(parser.parse_args())
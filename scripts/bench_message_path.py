@@ -0,0 +1,147 @@
+# scripts/bench_message_path.py
+"""
+Benchmark de bloqueio do event loop no caminho de processamento de mensagens.
+
+Compara as consultas feitas durante o processamento de uma mensagem com a sessão
+síncrona (psycopg2, caminho anterior: a corrotina bloqueia o loop durante a
+consulta) e com a sessão assíncrona (asyncpg, caminho atual).
+
+Cada "mensagem" simulada faz uma consulta com latência de banco configurável
+(pg_sleep, para emular a ida e volta da rede) e a busca do agente por ID, como
+em AgentService.get_agent / get_agent_async. Enquanto as mensagens rodam com a
+concorrência informada, um monitor mede o atraso do event loop (lag): quanto um
+`asyncio.sleep(interval)` demora além do esperado.
+
+Uso (com o Postgres do .env acessível):
+    python -m scripts.bench_message_path --messages 500 --concurrency 50 --latency 0.005
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import select, text
+
+from app.db.models.agent import Agent as AgentModel
+from app.db.session import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+LATENCY_QUERY = text("SELECT pg_sleep(:latency)")
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _monitor_loop_lag(stop: asyncio.Event, interval: float, samples: List[float]) -> None:
+    """Registra o atraso de cada `asyncio.sleep(interval)` até `stop` ser sinalizado."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def _sync_message(agent_id: str, latency: float) -> None:
+    """Caminho anterior: sessão síncrona usada dentro da corrotina."""
+    db = SessionLocal()
+    try:
+        db.execute(LATENCY_QUERY, {"latency": latency})
+        db.execute(select(AgentModel).where(AgentModel.id == agent_id)).scalar_one_or_none()
+    finally:
+        db.close()
+
+
+async def _async_message(agent_id: str, latency: float) -> None:
+    """Caminho atual: sessão assíncrona (asyncpg)."""
+    async with AsyncSessionLocal() as session:
+        await session.execute(LATENCY_QUERY, {"latency": latency})
+        result = await session.execute(select(AgentModel).where(AgentModel.id == agent_id))
+        result.scalar_one_or_none()
+
+
+async def run_scenario(
+    name: str,
+    message: Callable[[str, float], Awaitable[None]],
+    agent_id: str,
+    messages: int,
+    concurrency: int,
+    latency: float,
+    interval: float
+) -> Dict[str, float]:
+    """Processa `messages` mensagens com a concorrência informada e mede o lag do loop."""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def process() -> None:
+        async with semaphore:
+            await message(agent_id, latency)
+    
+    # Aquecer o pool de conexões fora da medição
+    await asyncio.gather(*(process() for _ in range(min(concurrency, messages))))
+    
+    samples: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop_lag(stop, interval, samples))
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(process() for _ in range(messages)))
+    elapsed = time.perf_counter() - started
+    
+    stop.set()
+    await monitor
+    
+    return {
+        "scenario": name,
+        "messages_per_s": messages / elapsed,
+        "lag_p50_ms": _percentile(samples, 50) * 1000,
+        "lag_p95_ms": _percentile(samples, 95) * 1000,
+        "lag_p99_ms": _percentile(samples, 99) * 1000,
+        "lag_max_ms": max(samples, default=0.0) * 1000
+    }
+
+
+def _first_agent_id() -> str:
+    db = SessionLocal()
+    try:
+        agent_id = db.execute(select(AgentModel.id).limit(1)).scalar_one_or_none()
+    finally:
+        db.close()
+    
+    # Sem agentes cadastrados a consulta continua sendo feita (sem resultado)
+    return str(agent_id or uuid.uuid4())
+
+
+async def main(args) -> None:
+    agent_id = args.agent_id or _first_agent_id()
+    
+    results = []
+    for name, message in (("sync (psycopg2)", _sync_message), ("async (asyncpg)", _async_message)):
+        results.append(await run_scenario(
+            name, message, agent_id, args.messages, args.concurrency, args.latency, args.interval
+        ))
+    
+    await async_engine.dispose()
+    engine.dispose()
+    
+    print(f"\n{args.messages} mensagens, concorrência {args.concurrency}, latência do banco {args.latency * 1000:.1f} ms")
+    print(f"{'cenário':<18}{'msg/s':>10}{'lag p50':>10}{'lag p95':>10}{'lag p99':>10}{'lag max':>10}  (ms)")
+    for result in results:
+        print(
+            f"{result['scenario']:<18}{result['messages_per_s']:>10.1f}"
+            f"{result['lag_p50_ms']:>10.2f}{result['lag_p95_ms']:>10.2f}"
+            f"{result['lag_p99_ms']:>10.2f}{result['lag_max_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lag do event loop no caminho de mensagens: sessão síncrona x assíncrona")
+    parser.add_argument("--messages", type=int, default=500, help="Mensagens simuladas por cenário")
+    parser.add_argument("--concurrency", type=int, default=50, help="Mensagens processadas em paralelo")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latência simulada por consulta (segundos)")
+    parser.add_argument("--interval", type=float, default=0.01, help="Intervalo do monitor de lag (segundos)")
+    parser.add_argument("--agent-id", help="Agente usado na busca (padrão: o primeiro cadastrado)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+# tests/test_dashboard_queries.py
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.endpoints import dashboard
+from app.db.models.agent import Agent
+from app.db.models.archived_conversation import ArchivedConversation
+from app.db.models.llm_model import LLMModel
+from app.db.models.token_usage import TokenUsageAlert, TokenUsageDaily, TokenUsageLimit
+
+
+class _FakeQuery:
+    def __init__(self, rows):
+        self._rows = rows
+    
+    def __getattr__(self, name):
+        # filter, order_by, group_by, limit... apenas encadeiam
+        return lambda *args, **kwargs: self
+    
+    def all(self):
+        return list(self._rows)
+    
+    def scalar(self):
+        return 0
+
+
+class _FakeSession:
+    """Sessão falsa que conta as consultas e devolve linhas conforme a primeira entidade."""
+    
+    def __init__(self, rows_by_entity):
+        self.rows_by_entity = rows_by_entity
+        self.query_count = 0
+    
+    def query(self, *entities):
+        self.query_count += 1
+        return _FakeQuery(self.rows_by_entity.get(entities[0], []))
+
+
+class _FakeTokenCounterService:
+    def __init__(self, db):
+        self.db = db
+    
+    async def get_token_usage_summary(self, **kwargs):
+        return {}
+
+
+def _superuser():
+    return SimpleNamespace(is_superuser=True, tenant_id=1)
+
+
+def _conversation_rows(count):
+    agent_ids = [uuid.uuid4() for _ in range(count)]
+    conversations = [
+        SimpleNamespace(
+            conversation_id=f"conv-{i}",
+            user_id=f"user-{i}",
+            created_at=datetime.utcnow(),
+            archived_at=datetime.utcnow(),
+            message_count=10,
+            archive_reason="inactivity",
+            final_agent_id=str(agent_ids[i]),
+            meta_data={}
+        )
+        for i in range(count)
+    ]
+    agents = [SimpleNamespace(id=agent_id, name=f"Agente {i}") for i, agent_id in enumerate(agent_ids)]
+    return {ArchivedConversation: conversations, Agent.id: agents}
+
+
+def _token_usage_rows(count):
+    agent_ids = [uuid.uuid4() for _ in range(count)]
+    return {
+        # Uso por agente e por modelo (as duas agregações começam por colunas diferentes)
+        TokenUsageDaily.agent_id: [
+            SimpleNamespace(agent_id=agent_id, total_tokens=100, total_cost=0.01) for agent_id in agent_ids
+        ],
+        TokenUsageDaily.model_id: [
+            SimpleNamespace(model_id=i, total_tokens=100, total_cost=0.01) for i in range(count)
+        ],
+        TokenUsageLimit: [
+            SimpleNamespace(
+                id=i, tenant_id=1, agent_id=agent_id,
+                monthly_limit=1000, daily_limit=100, warning_threshold=0.8
+            )
+            for i, agent_id in enumerate(agent_ids)
+        ],
+        TokenUsageAlert: [
+            SimpleNamespace(
+                id=uuid.uuid4(), tenant_id=1, agent_id=agent_id, limit_type="monthly",
+                threshold_value=0.8, current_usage=900, max_limit=1000, created_at=datetime.utcnow()
+            )
+            for agent_id in agent_ids[:5]
+        ],
+        Agent.id: [SimpleNamespace(id=agent_id, name=f"Agente {i}") for i, agent_id in enumerate(agent_ids)],
+        LLMModel.id: [SimpleNamespace(id=i, name=f"Modelo {i}") for i in range(count)]
+    }
+
+
+@pytest.mark.asyncio
+async def test_recent_conversations_query_count_is_constant():
+    counts = []
+    for size in (1, 10, 50):
+        db = _FakeSession(_conversation_rows(size))
+        result = await dashboard.get_recent_conversations(
+            tenant_id="1", limit=50, db=db, current_user=_superuser()
+        )
+        
+        assert len(result) == size
+        assert all(conv["agent_name"].startswith("Agente") for conv in result)
+        counts.append(db.query_count)
+    
+    # Conversas + nomes dos agentes (IN), independente do número de linhas
+    assert counts == [2, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_token_usage_dashboard_query_count_is_constant(monkeypatch):
+    monkeypatch.setattr(dashboard, "TokenCounterService", _FakeTokenCounterService)
+    
+    counts = []
+    for size in (1, 10, 50):
+        db = _FakeSession(_token_usage_rows(size))
+        result = await dashboard.get_token_usage_dashboard(
+            tenant_id="1", db=db, current_user=_superuser()
+        )
+        
+        assert len(result["agent_usage"]) == size
+        assert len(result["model_usage"]) == size
+        assert all(usage["agent_name"] != "Unknown Agent" for usage in result["agent_usage"])
+        assert all(usage["model_name"] != "Unknown Model" for usage in result["model_usage"])
+        assert all("agent_name" in limit for limit in result["limits"])
+        counts.append(db.query_count)
+    
+    # Uso por agente, limites, alertas, nomes dos agentes, uso por modelo e nomes dos modelos
+    assert counts == [6, 6, 6]
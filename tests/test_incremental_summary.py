@@ -0,0 +1,159 @@
+# tests/test_incremental_summary.py
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.db.models.conversation import ConversationState
+from app.services import archive_writer
+from app.services.memory import MemoryService
+from app.services.orchestrator import AgentOrchestrator
+
+SUMMARY_RESPONSE = json.dumps({
+    "brief_summary": "Paciente quer agendar uma limpeza.",
+    "detailed_summary": "O paciente pediu horários para limpeza e avaliação na próxima semana.",
+    "key_points": ["agendamento", "limpeza"],
+    "entities": {"procedimentos": ["limpeza"]},
+    "sentiment": "neutro"
+})
+
+
+class _FakeLLM:
+    """LLM falso que registra os tokens (palavras) de cada prompt recebido."""
+    
+    def __init__(self):
+        self.prompts = []
+        self.call_tokens = []
+    
+    async def generate_response(self, prompt):
+        text = "\n".join(message["content"] for message in prompt)
+        self.prompts.append(text)
+        self.call_tokens.append(len(text.split()))
+        return SUMMARY_RESPONSE
+
+
+class _FakeArchiveWriter:
+    def enqueue_summary(self, summary):
+        return True
+
+
+@pytest.fixture
+def summary_env(monkeypatch):
+    monkeypatch.setattr(settings, "MEMORY_STRUCTURED_SUMMARY", True)
+    monkeypatch.setattr(archive_writer, "get_archive_writer", lambda: _FakeArchiveWriter())
+    
+    llm = _FakeLLM()
+    memory_service = MemoryService(llm, use_local_storage=False)
+    
+    async def skip_extraction(*args, **kwargs):
+        return None
+    
+    monkeypatch.setattr(memory_service, "_schedule_memory_extraction", skip_extraction)
+    
+    # Orquestrador sem Redis: o estado fica apenas no objeto em memória
+    orchestrator = AgentOrchestrator.__new__(AgentOrchestrator)
+    orchestrator.memory_service = memory_service
+    orchestrator.redis = None
+    return llm, orchestrator
+
+
+def _new_state():
+    return ConversationState(
+        conversation_id="conv-1", tenant_id="1", user_id="user-1", current_agent_id="agent-1", history=[]
+    )
+
+
+def _message(index):
+    role = "user" if index % 2 == 0 else "assistant"
+    return {"role": role, "content": f"mensagem-{index} " + "palavra " * 20}
+
+
+async def _summarize(orchestrator, state, max_input_chars):
+    await orchestrator._generate_and_store_summary(state, max_input_chars=max_input_chars)
+
+
+async def _run_conversation(orchestrator, total_messages, frequency=10, max_input_chars=12000):
+    state = _new_state()
+    for index in range(total_messages):
+        state.history.append(_message(index))
+        if (index + 1) % frequency == 0:
+            await _summarize(orchestrator, state, max_input_chars)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_summary_tokens_grow_linearly_with_conversation_length(summary_env):
+    llm, orchestrator = summary_env
+    
+    await _run_conversation(orchestrator, 200)
+    tokens_200 = sum(llm.call_tokens)
+    calls_200 = len(llm.call_tokens)
+    
+    await _run_conversation(orchestrator, 400)
+    tokens_400 = sum(llm.call_tokens) - tokens_200
+    calls_400 = len(llm.call_tokens) - calls_200
+    
+    # Cada resumo envia só as mensagens novas + o resumo anterior: custo por chamada constante
+    assert calls_400 == 2 * calls_200
+    assert 1.9 <= tokens_400 / tokens_200 <= 2.1
+    
+    incremental_calls = llm.call_tokens[1:calls_200]
+    assert max(incremental_calls) - min(incremental_calls) <= 2
+
+
+@pytest.mark.asyncio
+async def test_truncated_batch_advances_watermark_only_to_sent_messages(summary_env):
+    llm, orchestrator = summary_env
+    state = _new_state()
+    state.history = [_message(index) for index in range(10)]
+    
+    # Cada mensagem tem ~180 caracteres: cabem duas por resumo
+    max_input_chars = 400
+    await _summarize(orchestrator, state, max_input_chars)
+    
+    assert state.metadata["summary_watermark"] == 2
+    assert "mensagem-0 " in llm.prompts[0] and "mensagem-1 " in llm.prompts[0]
+    assert "mensagem-2 " not in llm.prompts[0]
+    
+    while state.metadata["summary_watermark"] < len(state.history):
+        await _summarize(orchestrator, state, max_input_chars)
+    
+    # Nenhuma mensagem fica sem ser resumida
+    sent = "\n".join(llm.prompts)
+    assert all(f"mensagem-{index} " in sent for index in range(10))
+    assert len(llm.prompts) == 5
+
+
+@pytest.mark.asyncio
+async def test_only_one_summary_in_flight_per_conversation(summary_env):
+    llm, orchestrator = summary_env
+    state = _new_state()
+    state.history = [_message(index) for index in range(10)]
+    
+    assert await orchestrator._start_summary(state.conversation_id)
+    # Enquanto o resumo roda, novas mensagens não agendam outro
+    assert not await orchestrator._start_summary(state.conversation_id)
+    
+    await _summarize(orchestrator, state, 12000)
+    
+    # Concluído o resumo, a marca é liberada
+    assert await orchestrator._start_summary(state.conversation_id)
+    await orchestrator._finish_summary(state.conversation_id)
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_releases_in_flight_marker(summary_env):
+    llm, orchestrator = summary_env
+    state = _new_state()
+    state.history = [_message(index) for index in range(10)]
+    
+    async def failing_summary(*args, **kwargs):
+        raise RuntimeError("LLM indisponível")
+    
+    orchestrator.memory_service.generate_conversation_summary = failing_summary
+    assert await orchestrator._start_summary(state.conversation_id)
+    await _summarize(orchestrator, state, 12000)
+    
+    assert state.metadata["last_summary_error"]["error_type"] == "RuntimeError"
+    assert await orchestrator._start_summary(state.conversation_id)
+    await orchestrator._finish_summary(state.conversation_id)
@@ -0,0 +1,43 @@
+# tests/test_memory_fallback.py
+import time
+
+from app.services.memory import MemoryEntry, MemoryType
+from app.services.memory_fallback import FallbackMemoryIndex
+
+
+def _entry(memory_id, embedding, **kwargs):
+    return MemoryEntry(
+        id=memory_id,
+        tenant_id="1",
+        user_id="user-1",
+        type=MemoryType.FACT,
+        content=f"memória {memory_id}",
+        embedding=embedding,
+        **kwargs
+    )
+
+
+def test_new_entry_gets_its_own_timestamps():
+    first = _entry("a", [1.0, 0.0])
+    time.sleep(0.01)
+    second = _entry("b", [0.0, 1.0])
+    
+    assert second.created_at > first.created_at
+    assert second.last_accessed > first.last_accessed
+
+
+def test_new_entry_survives_quota_eviction():
+    index = FallbackMemoryIndex(max_entries_per_user=2)
+    
+    # Memórias já existentes, acessadas por último agora
+    now = time.time()
+    index.add(_entry("old-1", [1.0, 0.0, 0.0], last_accessed=now))
+    index.add(_entry("old-2", [0.0, 1.0, 0.0], last_accessed=now + 0.001))
+    time.sleep(0.01)
+    
+    # Entrada nova (timestamps padrão): não pode ser a primeira a ser descartada pelo LRU
+    index.add(_entry("new", [0.0, 0.0, 1.0]))
+    
+    stored = {entry.id for entry in index.user_entries("1", "user-1")}
+    assert stored == {"old-2", "new"}
+    assert index.stats()["evicted_user_quota"] == 1
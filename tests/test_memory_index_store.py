@@ -0,0 +1,84 @@
+# tests/test_memory_index_store.py
+import os
+
+import pytest
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from app.services.memory import MemoryEntry, MemoryType
+from app.services.memory_fallback import FallbackMemoryIndex
+from app.services.memory_index_store import MemoryIndexStore, PrecomputedEmbeddings, resolve_index_dir
+
+VECTORS = {
+    "a": [3.0, 0.0, 0.0],
+    "b": [1.0, 1.0, 0.0],
+    "c": [0.0, 0.5, 2.0]
+}
+QUERY = [2.0, 1.0, 0.0]
+
+
+def test_faiss_search_uses_same_similarity_scale_as_fallback(tmp_path):
+    path = str(tmp_path)
+    index = FAISS.from_embeddings(
+        [(memory_id, vector) for memory_id, vector in VECTORS.items()],
+        PrecomputedEmbeddings(),
+        metadatas=[{"id": memory_id, "user_id": "user-1"} for memory_id in VECTORS]
+    )
+    store = MemoryIndexStore()
+    store.register(path, index)
+    
+    fallback = FallbackMemoryIndex()
+    for memory_id, vector in VECTORS.items():
+        fallback.add(MemoryEntry(
+            id=memory_id, tenant_id="1", user_id="user-1", type=MemoryType.FACT, content=memory_id, embedding=vector
+        ))
+    
+    faiss_scores = {doc.metadata["id"]: score for doc, score in store.search_user(path, "user-1", QUERY, 3)}
+    fallback_scores = {entry.id: score for entry, score in fallback.search("1", "user-1", QUERY, limit=3)}
+    
+    # Similaridade de cosseno nos dois caminhos: o mesmo relevance_threshold vale para ambos
+    assert faiss_scores.keys() == fallback_scores.keys()
+    for memory_id, score in fallback_scores.items():
+        assert faiss_scores[memory_id] == pytest.approx(score, abs=1e-5)
+
+
+def _tenant_index():
+    return FAISS.from_embeddings(
+        [("inicial", [1.0, 0.0, 0.0])],
+        PrecomputedEmbeddings(),
+        metadatas=[{"id": "init", "init_doc": True}]
+    )
+
+
+def test_least_recently_used_index_is_flushed_and_evicted(tmp_path):
+    store = MemoryIndexStore(flush_batch_size=100, max_loaded=2)
+    paths = [str(tmp_path / f"tenant_{i}") for i in range(3)]
+    for path in paths:
+        os.makedirs(path)
+    
+    store.register(paths[0], _tenant_index())
+    store.add_documents(paths[0], [Document(page_content="a", metadata={"id": "a", "user_id": "user-1"})], [[0.0, 1.0, 0.0]])
+    store.register(paths[1], _tenant_index())
+    store.register(paths[2], _tenant_index())
+    
+    # O tenant 0 (usado há mais tempo) foi gravado antes de sair do cache
+    assert not store.is_loaded(paths[0])
+    assert store.is_loaded(paths[1]) and store.is_loaded(paths[2])
+    assert os.path.exists(os.path.join(resolve_index_dir(paths[0]), "index.faiss"))
+    assert not os.path.exists(os.path.join(paths[0], "pending.log"))
+    
+    with pytest.raises(KeyError):
+        store.add_documents(paths[0], [Document(page_content="b", metadata={"id": "b"})], [[0.0, 0.0, 1.0]])
+
+
+def test_idle_index_is_evicted_on_periodic_flush(tmp_path):
+    store = MemoryIndexStore(idle_ttl=60)
+    idle_path, active_path = str(tmp_path / "tenant_1"), str(tmp_path / "tenant_2")
+    store.register(idle_path, _tenant_index())
+    store.register(active_path, _tenant_index())
+    
+    store._indices[idle_path].last_used -= 120
+    store.flush_due()
+    
+    assert not store.is_loaded(idle_path)
+    assert store.is_loaded(active_path)